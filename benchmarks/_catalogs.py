@@ -0,0 +1,72 @@
+"""
+Catalogs shared by the benchmarks, generated with `galsampler.tests.fake_catalogs`.
+
+Catalog sizes range up to 10**8 objects. Benchmarks with catalogs larger than
+the value of the environment variable GALSAMPLER_BENCHMARK_MAX_SIZE,
+10**7 by default, are skipped, so that the default suite runs on a workstation.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict
+import os
+import numpy as np
+
+from galsampler.tests.fake_catalogs import fake_source_galaxy_catalog, fake_target_halo_catalog
+
+
+max_size = int(float(os.environ.get('GALSAMPLER_BENCHMARK_MAX_SIZE', 1e7)))
+
+catalog_sizes = [10**4, 10**5, 10**6, 10**7, 10**8]
+num_source_gals = 10**5
+fixed_seed = 43
+
+#  Binned halo properties, in order, and the range spanned by their bins
+haloprop_ranges = OrderedDict((('mass', (10., 15.5)), ('conc', (1., 25.)), ('rvir', (0., 1.))))
+source_haloprop_keys = {'mass': 'host_halo_mass', 'conc': 'host_halo_conc', 'rvir': 'host_halo_rvir'}
+
+_cache = {}
+
+
+def skip_if_too_large(num_objects):
+    """ Skip the benchmark if the catalog exceeds GALSAMPLER_BENCHMARK_MAX_SIZE.
+    asv skips any benchmark whose setup raises NotImplementedError.
+    """
+    if num_objects > max_size:
+        raise NotImplementedError("Set GALSAMPLER_BENCHMARK_MAX_SIZE to run this benchmark")
+
+
+def haloprop_bins(num_props, num_bins):
+    """ Bins of the first ``num_props`` halo properties, with ``num_bins`` bins each.
+    """
+    bins = OrderedDict()
+    for key, (low, high) in list(haloprop_ranges.items())[:num_props]:
+        if key == 'mass':
+            bins[key] = np.logspace(low, high, num_bins+1)
+        else:
+            bins[key] = np.linspace(low, high, num_bins+1)
+    return bins
+
+
+def source_catalog():
+    """ Source galaxy catalog with ``num_source_gals`` galaxies, sorted by host halo,
+    together with a dictionary of the properties of their host halos.
+    """
+    if 'source' not in _cache:
+        galaxies = fake_source_galaxy_catalog(num_source_gals, seed=fixed_seed)
+        galaxies = galaxies[np.argsort(galaxies['host_halo_id'], kind='mergesort')]
+        halo_ids, idx = np.unique(galaxies['host_halo_id'], return_index=True)
+        halos = OrderedDict(halo_id=halo_ids)
+        for key, source_key in source_haloprop_keys.items():
+            halos[key] = galaxies[source_key][idx]
+        _cache['source'] = galaxies, halos
+    return _cache['source']
+
+
+def target_catalog(num_target_halos):
+    """ Target halo catalog with ``num_target_halos`` halos.
+    """
+    key = ('target', num_target_halos)
+    if key not in _cache:
+        _cache.clear()
+        _cache[key] = fake_target_halo_catalog(num_target_halos, seed=fixed_seed)
+    return _cache[key]
@@ -0,0 +1,50 @@
+"""
+Benchmarks of the binning of halo catalogs.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from galsampler import halo_bin_indices, matching_bin_dictionary
+
+from ._catalogs import catalog_sizes, haloprop_bins, skip_if_too_large, target_catalog
+
+
+class HaloBinIndices(object):
+    """ `halo_bin_indices` as a function of catalog size,
+    number of binned halo properties and number of bins per property.
+    """
+    params = (catalog_sizes, [1, 2, 3], [10, 100])
+    param_names = ('num_halos', 'num_props', 'num_bins')
+    timeout = 1800
+
+    def setup(self, num_halos, num_props, num_bins):
+        skip_if_too_large(num_halos)
+        halos = target_catalog(num_halos)
+        self.haloprops = dict((key, (halos[key], bins))
+            for key, bins in haloprop_bins(num_props, num_bins).items())
+
+    def time_halo_bin_indices(self, num_halos, num_props, num_bins):
+        halo_bin_indices(**self.haloprops)
+
+    def peakmem_halo_bin_indices(self, num_halos, num_props, num_bins):
+        halo_bin_indices(**self.haloprops)
+
+
+class MatchingBinDictionary(object):
+    """ `matching_bin_dictionary` as a function of the number of bins
+    and of the minimum number of halos per bin.
+    """
+    params = ([(100, ), (30, 30), (10, 10, 10), (30, 30, 30)], [1, 10, 100])
+    param_names = ('bin_shapes', 'nhalo_min')
+
+    def setup(self, bin_shapes, nhalo_min):
+        halos = target_catalog(10**6)
+        haloprops = dict((key, (halos[key], bins))
+            for key, bins in haloprop_bins(len(bin_shapes), bin_shapes[0]).items())
+        self.bin_numbers = halo_bin_indices(**haloprops)
+        self.bin_shapes = tuple(bin_shapes)
+
+    def time_matching_bin_dictionary(self, bin_shapes, nhalo_min):
+        matching_bin_dictionary(self.bin_numbers, nhalo_min, self.bin_shapes)
+
+    def peakmem_matching_bin_dictionary(self, bin_shapes, nhalo_min):
+        matching_bin_dictionary(self.bin_numbers, nhalo_min, self.bin_shapes)
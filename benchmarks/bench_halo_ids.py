@@ -0,0 +1,71 @@
+"""
+Benchmarks of the matching of galaxy host halo IDs to halo IDs.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+
+from galsampler.halo_ids import crossmatch_halo_ids, HaloIdIndex
+
+from ._catalogs import catalog_sizes, fixed_seed, skip_if_too_large
+
+
+def _halo_ids_and_host_halo_ids(num_gals, halo_id_range):
+    """ IDs of num_gals/2 halos, either a permutation of consecutive integers
+    or random 62-bit integers, and host halo IDs of ``num_gals`` galaxies.
+    """
+    rng = np.random.RandomState(fixed_seed)
+    num_halos = num_gals//2
+    if halo_id_range == 'dense':
+        halo_ids = rng.permutation(num_halos)
+    else:
+        halo_ids = np.unique(rng.randint(0, 2**62, num_halos))
+        rng.shuffle(halo_ids)
+    return halo_ids, halo_ids[rng.randint(0, len(halo_ids), num_gals)]
+
+
+class CrossmatchHaloIds(object):
+    """ `crossmatch_halo_ids` against ``crossmatch`` of halotools, as a function of
+    the number of galaxies, for halo IDs spanning a dense or a sparse range.
+    """
+    params = (catalog_sizes, ['dense', 'sparse'], ['galsampler', 'halotools'])
+    param_names = ('num_gals', 'halo_id_range', 'implementation')
+    timeout = 1800
+
+    def setup(self, num_gals, halo_id_range, implementation):
+        skip_if_too_large(num_gals)
+        if implementation == 'halotools':
+            try:
+                from halotools.utils import crossmatch
+            except ImportError:
+                raise NotImplementedError("halotools is not installed")
+            self.crossmatch = crossmatch
+        else:
+            self.crossmatch = crossmatch_halo_ids
+        self.halo_ids, self.galaxy_host_halo_ids = _halo_ids_and_host_halo_ids(num_gals, halo_id_range)
+
+    def time_crossmatch(self, num_gals, halo_id_range, implementation):
+        self.crossmatch(self.galaxy_host_halo_ids, self.halo_ids)
+
+    def peakmem_crossmatch(self, num_gals, halo_id_range, implementation):
+        self.crossmatch(self.galaxy_host_halo_ids, self.halo_ids)
+
+
+class HaloIdIndexLookup(object):
+    """ Construction of a `HaloIdIndex` and lookups in a prebuilt index, e.g.,
+    when the same halo catalog is matched to many galaxy catalogs.
+    """
+    params = (catalog_sizes, ['dense', 'sparse'])
+    param_names = ('num_gals', 'halo_id_range')
+    timeout = 1800
+
+    def setup(self, num_gals, halo_id_range):
+        skip_if_too_large(num_gals)
+        self.halo_ids, self.galaxy_host_halo_ids = _halo_ids_and_host_halo_ids(num_gals, halo_id_range)
+        self.index = HaloIdIndex(self.halo_ids)
+
+    def time_build(self, num_gals, halo_id_range):
+        HaloIdIndex(self.halo_ids)
+
+    def time_lookup(self, num_gals, halo_id_range):
+        self.index.lookup(self.galaxy_host_halo_ids)
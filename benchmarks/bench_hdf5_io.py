@@ -0,0 +1,85 @@
+"""
+Benchmarks of the chunked HDF5 pipeline, which require h5py.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from galsampler import halo_bin_indices, SourceSampler
+from galsampler.hdf5_io import HAS_H5PY, HDF5ChunkedWriter, iter_hdf5_chunks
+from galsampler.hdf5_io import populate_hdf5_target_galaxy_catalog
+
+from ._catalogs import catalog_sizes, fixed_seed, haloprop_bins
+from ._catalogs import skip_if_too_large, source_catalog, target_catalog
+
+
+def _write_target_catalog(fname, num_target_halos, chunk_size):
+    """ Write the columns of the target halo catalog to ``fname``, one dataset per column.
+    """
+    target_halos = target_catalog(num_target_halos)
+    with HDF5ChunkedWriter(fname, chunk_size=chunk_size) as writer:
+        writer.write(dict((key, target_halos[key]) for key in target_halos.dtype.names))
+
+
+class _HDF5Benchmark(object):
+    """ Target halo catalog written to a temporary HDF5 file.
+    """
+    timeout = 1800
+
+    def setup(self, num_target_halos, chunk_size):
+        skip_if_too_large(num_target_halos)
+        if not HAS_H5PY:
+            raise NotImplementedError("h5py is not installed")
+        self.tmp_dir = tempfile.mkdtemp()
+        self.target_halos_fname = os.path.join(self.tmp_dir, 'target_halos.hdf5')
+        self.output_fname = os.path.join(self.tmp_dir, 'target_galaxies.hdf5')
+        _write_target_catalog(self.target_halos_fname, num_target_halos, chunk_size)
+
+    def teardown(self, num_target_halos, chunk_size):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class IterHDF5Chunks(_HDF5Benchmark):
+    """ `iter_hdf5_chunks` reading the columns needed to bin and populate the
+    target halos, as a function of catalog size and chunk size.
+    """
+    params = (catalog_sizes, [10**5, 10**6])
+    param_names = ('num_target_halos', 'chunk_size')
+
+    def time_iter_hdf5_chunks(self, num_target_halos, chunk_size):
+        for __ in iter_hdf5_chunks(self.target_halos_fname, ('halo_id', 'mass', 'x'), chunk_size):
+            pass
+
+    def peakmem_iter_hdf5_chunks(self, num_target_halos, chunk_size):
+        for __ in iter_hdf5_chunks(self.target_halos_fname, ('halo_id', 'mass', 'x'), chunk_size):
+            pass
+
+
+class PopulateHDF5TargetGalaxyCatalog(_HDF5Benchmark):
+    """ `populate_hdf5_target_galaxy_catalog` as a function of catalog size
+    and chunk size, for halos binned by mass.
+    """
+    params = (catalog_sizes, [10**5, 10**6])
+    param_names = ('num_target_halos', 'chunk_size')
+    nhalo_min = 10
+    num_bins = 30
+
+    def setup(self, num_target_halos, chunk_size):
+        super(PopulateHDF5TargetGalaxyCatalog, self).setup(num_target_halos, chunk_size)
+        self.source_galaxies, source_halos = source_catalog()
+        self.bins = haloprop_bins(1, self.num_bins)
+        source_bin_numbers = halo_bin_indices(mass=(source_halos['mass'], self.bins['mass']))
+        self.sampler = SourceSampler(self.source_galaxies['host_halo_id'], source_bin_numbers,
+            source_halos['halo_id'], self.nhalo_min, self.bins['mass'], assume_sorted=True)
+
+    def time_populate_hdf5_target_galaxy_catalog(self, num_target_halos, chunk_size):
+        populate_hdf5_target_galaxy_catalog(self.sampler, self.target_halos_fname, self.bins,
+            self.output_fname, self.source_galaxies, source_galaxy_keys=('x', 'y', 'z'),
+            target_halo_keys=('rvir', ), seed=fixed_seed, chunk_size=chunk_size)
+
+    def peakmem_populate_hdf5_target_galaxy_catalog(self, num_target_halos, chunk_size):
+        populate_hdf5_target_galaxy_catalog(self.sampler, self.target_halos_fname, self.bins,
+            self.output_fname, self.source_galaxies, source_galaxy_keys=('x', 'y', 'z'),
+            target_halo_keys=('rvir', ), seed=fixed_seed, chunk_size=chunk_size)
@@ -0,0 +1,15 @@
+"""
+Benchmarks of the time taken to import galsampler in a fresh interpreter.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+
+class ImportTime(object):
+    """ Time to import galsampler and its main entry points.
+    """
+    params = (['import galsampler', 'from galsampler import SourceSampler',
+        'from galsampler import halo_bin_indices', 'from galsampler import build_target_galaxy_catalog'], )
+    param_names = ('statement', )
+
+    def timeraw_import(self, statement):
+        return statement
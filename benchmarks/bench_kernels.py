@@ -0,0 +1,66 @@
+"""
+Benchmarks of the kernels expanding the selected halos into galaxies.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+
+from galsampler import transfer_host_centric_positions
+from galsampler.selection_kernels import galaxy_selection_indices, HAS_CYTHON_KERNELS
+
+from ._catalogs import catalog_sizes, fixed_seed, skip_if_too_large
+
+
+class GalaxySelectionIndices(object):
+    """ `galaxy_selection_indices` as a function of the number of galaxies,
+    for every backend.
+    """
+    params = (catalog_sizes, ['cython', 'numpy'])
+    param_names = ('num_gals', 'backend')
+    timeout = 1800
+
+    def setup(self, num_gals, backend):
+        skip_if_too_large(num_gals)
+        if backend == 'cython' and not HAS_CYTHON_KERNELS:
+            raise NotImplementedError("The compiled extension is not available")
+        #  Halos with 0 to 4 galaxies, 2 on average
+        rng = np.random.RandomState(fixed_seed)
+        self.richness = rng.randint(0, 5, num_gals//2)
+        self.first_source_gal_indices = rng.randint(0, num_gals, num_gals//2)
+        self.ngal_tot = int(self.richness.sum())
+
+    def time_galaxy_selection_indices(self, num_gals, backend):
+        galaxy_selection_indices(self.first_source_gal_indices, self.richness,
+            self.ngal_tot, backend=backend)
+
+    def peakmem_galaxy_selection_indices(self, num_gals, backend):
+        galaxy_selection_indices(self.first_source_gal_indices, self.richness,
+            self.ngal_tot, backend=backend)
+
+
+class TransferHostCentricPositions(object):
+    """ `transfer_host_centric_positions` as a function of the number of galaxies,
+    for every backend.
+    """
+    params = (catalog_sizes, ['cython', 'numpy'])
+    param_names = ('num_gals', 'backend')
+    timeout = 1800
+    period = 250.
+
+    def setup(self, num_gals, backend):
+        skip_if_too_large(num_gals)
+        if backend == 'cython' and not HAS_CYTHON_KERNELS:
+            raise NotImplementedError("The compiled extension is not available")
+        rng = np.random.RandomState(fixed_seed)
+        self.host_centric_pos = rng.uniform(-1, 1, (num_gals, 3)).astype('f4')
+        self.target_halo_pos = rng.uniform(0, self.period, (num_gals//2, 3)).astype('f4')
+        self.target_halo_row_indices = np.sort(rng.randint(0, num_gals//2, num_gals))
+        self.out = np.empty_like(self.host_centric_pos)
+
+    def time_transfer_host_centric_positions(self, num_gals, backend):
+        transfer_host_centric_positions(self.host_centric_pos, self.target_halo_pos, self.period,
+            out=self.out, target_halo_row_indices=self.target_halo_row_indices, backend=backend)
+
+    def peakmem_transfer_host_centric_positions(self, num_gals, backend):
+        transfer_host_centric_positions(self.host_centric_pos, self.target_halo_pos, self.period,
+            out=self.out, target_halo_row_indices=self.target_halo_row_indices, backend=backend)
@@ -0,0 +1,32 @@
+"""
+Peak memory traced with tracemalloc for every stage of the selection pipeline,
+recorded in bytes per object, so that regressions of the memory footprint of
+a single stage are visible even when the peak RSS of the process is unchanged.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from galsampler.tests.peak_memory import pipeline_peak_memory, bytes_per_object_budgets
+
+from ._catalogs import catalog_sizes, skip_if_too_large
+
+
+_stages = {}
+
+
+class PipelinePeakMemory(object):
+    """ Peak bytes per object of each stage as a function of catalog size.
+    See `galsampler.tests.peak_memory.pipeline_peak_memory`.
+    """
+    params = (catalog_sizes, list(bytes_per_object_budgets.keys()))
+    param_names = ('num_objects', 'stage')
+    timeout = 1800
+    unit = 'bytes per object'
+
+    def setup(self, num_objects, stage):
+        skip_if_too_large(num_objects)
+        if num_objects not in _stages:
+            _stages.clear()
+            _stages[num_objects] = pipeline_peak_memory(num_objects)
+
+    def track_peak_bytes_per_object(self, num_objects, stage):
+        return _stages[num_objects][stage][2]
@@ -0,0 +1,108 @@
+"""
+Benchmarks of the selection of source halos and source galaxies.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+
+from galsampler import halo_bin_indices, source_halo_index_selection
+from galsampler import source_galaxy_selection_indices, SourceSampler
+from galsampler import matched_value_selection_indices
+
+from ._catalogs import catalog_sizes, fixed_seed, haloprop_bins
+from ._catalogs import skip_if_too_large, source_catalog, target_catalog
+
+
+def _binned_catalogs(num_target_halos, num_props, num_bins):
+    """ Bin numbers of the source and target halos.
+    """
+    __, source_halos = source_catalog()
+    target_halos = target_catalog(num_target_halos)
+    bins = haloprop_bins(num_props, num_bins)
+    source_bin_numbers = halo_bin_indices(
+        **dict((key, (source_halos[key], b)) for key, b in bins.items()))
+    target_bin_numbers = halo_bin_indices(
+        **dict((key, (target_halos[key], b)) for key, b in bins.items()))
+    return source_halos, target_halos, list(bins.values()), source_bin_numbers, target_bin_numbers
+
+
+class SourceHaloIndexSelection(object):
+    """ `source_halo_index_selection` as a function of target catalog size,
+    number of binned halo properties, number of bins and ``nhalo_min``.
+    """
+    params = (catalog_sizes, [1, 2], [10, 30], [1, 10])
+    param_names = ('num_target_halos', 'num_props', 'num_bins', 'nhalo_min')
+    timeout = 1800
+
+    def setup(self, num_target_halos, num_props, num_bins, nhalo_min):
+        skip_if_too_large(num_target_halos)
+        __, target_halos, self.bins, self.source_bin_numbers, self.target_bin_numbers = (
+            _binned_catalogs(num_target_halos, num_props, num_bins))
+        self.target_halo_ids = target_halos['halo_id']
+
+    def time_source_halo_index_selection(self, num_target_halos, num_props, num_bins, nhalo_min):
+        source_halo_index_selection(self.source_bin_numbers, self.target_bin_numbers,
+            self.target_halo_ids, nhalo_min, *self.bins, seed=fixed_seed)
+
+    def peakmem_source_halo_index_selection(self, num_target_halos, num_props, num_bins, nhalo_min):
+        source_halo_index_selection(self.source_bin_numbers, self.target_bin_numbers,
+            self.target_halo_ids, nhalo_min, *self.bins, seed=fixed_seed)
+
+
+class SourceGalaxySelectionIndices(object):
+    """ `source_galaxy_selection_indices` and `SourceSampler.sample`
+    as a function of target catalog size.
+    """
+    params = (catalog_sizes, [1, 2], [False, True])
+    param_names = ('num_target_halos', 'num_props', 'compact')
+    timeout = 1800
+    num_bins = 30
+    nhalo_min = 10
+
+    def setup(self, num_target_halos, num_props, compact):
+        skip_if_too_large(num_target_halos)
+        source_halos, target_halos, self.bins, self.source_bin_numbers, self.target_bin_numbers = (
+            _binned_catalogs(num_target_halos, num_props, self.num_bins))
+        self.source_galaxies, __ = source_catalog()
+        self.source_halo_ids = source_halos['halo_id']
+        self.target_halo_ids = target_halos['halo_id']
+        self.sampler = SourceSampler(self.source_galaxies['host_halo_id'], self.source_bin_numbers,
+            self.source_halo_ids, self.nhalo_min, *self.bins, assume_sorted=True)
+
+    def time_source_galaxy_selection_indices(self, num_target_halos, num_props, compact):
+        source_galaxy_selection_indices(self.source_galaxies['host_halo_id'],
+            self.source_bin_numbers, self.source_halo_ids, self.target_bin_numbers,
+            self.target_halo_ids, self.nhalo_min, *self.bins, compact=compact)
+
+    def peakmem_source_galaxy_selection_indices(self, num_target_halos, num_props, compact):
+        source_galaxy_selection_indices(self.source_galaxies['host_halo_id'],
+            self.source_bin_numbers, self.source_halo_ids, self.target_bin_numbers,
+            self.target_halo_ids, self.nhalo_min, *self.bins, compact=compact)
+
+    def time_sample(self, num_target_halos, num_props, compact):
+        self.sampler.sample(self.target_bin_numbers, self.target_halo_ids, compact=compact)
+
+    def peakmem_sample(self, num_target_halos, num_props, compact):
+        self.sampler.sample(self.target_bin_numbers, self.target_halo_ids, compact=compact)
+
+
+class MatchedValueSelectionIndices(object):
+    """ `matched_value_selection_indices` as a function of the number of values.
+    """
+    params = (catalog_sizes, [False, True])
+    param_names = ('num_values', 'assume_x_is_sorted')
+    timeout = 1800
+
+    def setup(self, num_values, assume_x_is_sorted):
+        skip_if_too_large(num_values)
+        rng = np.random.RandomState(fixed_seed)
+        self.x = rng.uniform(0, 1, num_values)
+        if assume_x_is_sorted:
+            self.x.sort()
+        self.y = rng.uniform(0, 1, num_values)
+
+    def time_matched_value_selection_indices(self, num_values, assume_x_is_sorted):
+        matched_value_selection_indices(self.x, self.y, assume_x_is_sorted=assume_x_is_sorted)
+
+    def peakmem_matched_value_selection_indices(self, num_values, assume_x_is_sorted):
+        matched_value_selection_indices(self.x, self.y, assume_x_is_sorted=assume_x_is_sorted)
@@ -8,7 +8,43 @@ from ._astropy_init import *
 
 if not _ASTROPY_SETUP_:
     # For egg_info test builds to pass, put package imports here.
-    from .host_halo_binning import halo_bin_indices, matching_bin_dictionary
-    from .source_halo_selection import source_halo_index_selection
-    from .source_galaxy_selection import source_galaxy_selection_indices
-    from .matched_halo_selection_1d import matched_value_selection_indices
+    # Public functions are imported from their module on first access,
+    # so that ``import galsampler`` stays fast in short-lived worker processes.
+    import importlib
+    import sys
+
+    _lazy_attributes = {
+        'halo_bin_indices': 'host_halo_binning',
+        'matching_bin_array': 'host_halo_binning',
+        'matching_bin_dictionary': 'host_halo_binning',
+        'source_halo_index_selection': 'source_halo_selection',
+        'source_galaxy_selection_indices': 'source_galaxy_selection',
+        'SourceSampler': 'source_galaxy_selection',
+        'CompactGalaxySelection': 'compact_selection',
+        'build_target_galaxy_catalog': 'galaxy_catalog',
+        'transfer_host_centric_positions': 'host_centric_transfer',
+        'transfer_host_centric_velocities': 'host_centric_transfer',
+        'populate_hdf5_target_galaxy_catalog': 'hdf5_io',
+        'matched_value_selection_indices': 'matched_halo_selection_1d',
+        'StageProfiler': 'instrumentation',
+        'HaloIdIndex': 'halo_ids',
+    }
+
+    __all__ = ['__version__', '__githash__', 'test'] + sorted(_lazy_attributes)
+
+    def __getattr__(name):
+        try:
+            module_name = _lazy_attributes[name]
+        except KeyError:
+            raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+        value = getattr(importlib.import_module('.' + module_name, __name__), name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(_lazy_attributes))
+
+    if sys.version_info < (3, 7):
+        # Module __getattr__ (PEP 562) requires Python 3.7, so import everything eagerly
+        for _name in _lazy_attributes:
+            __getattr__(_name)
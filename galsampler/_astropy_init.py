@@ -115,10 +115,6 @@ def test(package=None, test_path=None, args=None, plugins=None,
 if not _ASTROPY_SETUP_:  # noqa
     import os
     from warnings import warn
-    from astropy.config.configuration import (
-        update_default_config,
-        ConfigurationDefaultMissingError,
-        ConfigurationDefaultMissingWarning)
 
     # add these here so we only need to cleanup the namespace at the end
     config_dir = None
@@ -127,6 +123,11 @@ if not _ASTROPY_SETUP_:  # noqa
         config_dir = os.path.dirname(__file__)
         config_template = os.path.join(config_dir, __package__ + ".cfg")
         if os.path.isfile(config_template):
+            # astropy is only imported when there is a configuration to install
+            from astropy.config.configuration import (
+                update_default_config,
+                ConfigurationDefaultMissingError,
+                ConfigurationDefaultMissingWarning)
             try:
                 update_default_config(
                     __package__, config_dir, version=__version__)
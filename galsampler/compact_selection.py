@@ -0,0 +1,278 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+from .selection_kernels import galaxy_selection_indices
+from .instrumentation import stage
+from .utils import atleast_1d_no_copy, take
+
+
+__all__ = ('CompactGalaxySelection', )
+
+default_chunk_size = int(1e7)
+
+
+class CompactGalaxySelection(object):
+    """ Run-length representation of the galaxies selected to populate a target halo catalog.
+
+    The galaxies of each target halo are a contiguous run of the source galaxy catalog
+    sorted by host halo, so the selection is fully determined by per-halo arrays:
+    the index of the first galaxy of the run, the richness, and the IDs of the
+    target and source halos. Only these arrays, restricted to halos with at least
+    one galaxy, are stored, together with the permutation that sorts the source
+    galaxy catalog. The arrays of shape (num_target_gals, ) returned by
+    `source_galaxy_selection_indices` are only computed on demand, either all at once
+    with the `expand` method, in chunks with the `iter_chunks` method, or not at all
+    when galaxy properties are copied with the `gather` method.
+
+    Instances are usually created by passing ``compact=True`` to
+    `SourceSampler.sample` or `source_galaxy_selection_indices`.
+
+    Parameters
+    ----------
+    first_sorted_source_gal_indices : ndarray
+        Numpy integer array of shape (num_target_halos, ) storing the index of the first
+        galaxy of each target halo in the source galaxy catalog sorted by host halo
+
+    richness : ndarray
+        Numpy integer array of shape (num_target_halos, ) storing the number of
+        galaxies of each target halo
+
+    target_halo_ids : ndarray
+        Numpy integer array of shape (num_target_halos, ) storing the halo ID
+        of each target halo
+
+    source_halo_ids : ndarray
+        Numpy integer array of shape (num_target_halos, ) storing the halo ID
+        of the source halo selected for each target halo
+
+    idx_sorted_source_galaxies : ndarray, optional
+        Numpy integer array of shape (num_source_gals, ) storing the indices that sort
+        the source galaxy catalog by host halo. Default is None, meaning that the
+        source galaxy catalog is already sorted.
+
+    target_halo_row_indices : ndarray, optional
+        Numpy integer array of shape (num_target_halos, ) storing the row index
+        of each target halo in the target halo catalog. Default is None.
+
+    source_halo_row_indices : ndarray, optional
+        Numpy integer array of shape (num_target_halos, ) storing the row index
+        in the source halo catalog of the source halo selected for each target halo.
+        Default is None.
+
+    backend : string, optional
+        Implementation used to expand the runs of galaxies.
+        See `galaxy_selection_indices`. Default is ``auto``.
+
+    num_threads : int, optional
+        Number of OpenMP threads used by the ``cython`` backend. Default is 1.
+
+    Examples
+    --------
+    >>> first_sorted_source_gal_indices = np.array((5, 0, 2))
+    >>> richness = np.array((2, 0, 3))
+    >>> target_halo_ids = np.array((100, 101, 102))
+    >>> source_halo_ids = np.array((7, 3, 5))
+    >>> selection = CompactGalaxySelection(first_sorted_source_gal_indices, richness,
+    ...     target_halo_ids, source_halo_ids)
+    >>> selection.num_target_gals
+    5
+    >>> indices, target_galaxy_target_halo_ids, target_galaxy_source_halo_ids = selection.expand()
+
+    Galaxy properties of the source catalog can be transferred without
+    materializing the selection indices:
+
+    >>> source_galaxy_mstar = np.arange(10.)
+    >>> target_galaxy_mstar = selection.gather(source_galaxy_mstar)
+    """
+
+    def __init__(self, first_sorted_source_gal_indices, richness, target_halo_ids, source_halo_ids,
+                idx_sorted_source_galaxies=None, target_halo_row_indices=None,
+                source_halo_row_indices=None, backend='auto', num_threads=1):
+        richness = np.atleast_1d(richness).astype('i8', copy=False)
+
+        #  Target halos without galaxies contribute nothing to the selection
+        occupied = richness > 0
+        self.first_sorted_source_gal_indices = np.atleast_1d(
+            first_sorted_source_gal_indices).astype('i8', copy=False)[occupied]
+        self.richness = richness[occupied]
+        self.target_halo_ids = np.atleast_1d(target_halo_ids)[occupied]
+        self.source_halo_ids = np.atleast_1d(source_halo_ids)[occupied]
+        self.idx_sorted_source_galaxies = idx_sorted_source_galaxies
+        self.target_halo_row_indices = _optional_mask(target_halo_row_indices, occupied)
+        self.source_halo_row_indices = _optional_mask(source_halo_row_indices, occupied)
+        self.backend = backend
+        self.num_threads = num_threads
+
+        #  Galaxies of halo i occupy the interval [gal_offsets[i], gal_offsets[i+1])
+        self._gal_offsets = np.zeros(len(self.richness)+1, dtype='i8')
+        np.cumsum(self.richness, out=self._gal_offsets[1:])
+
+    @property
+    def num_target_gals(self):
+        """ Total number of selected galaxies.
+        """
+        return int(self._gal_offsets[-1])
+
+    def __len__(self):
+        return self.num_target_gals
+
+    def expand(self, start=0, stop=None):
+        """ Materialize the selection of the galaxies in the interval [``start``, ``stop``).
+
+        Parameters
+        ----------
+        start : int, optional
+            Index of the first target galaxy. Default is 0.
+
+        stop : int, optional
+            Index of the last target galaxy, exclusive. Default is ``num_target_gals``.
+
+        Returns
+        -------
+        indices : ndarray
+            Numpy integer array of shape (stop-start, ) storing the indices
+            of the selected galaxies in the source galaxy catalog
+
+        target_galaxy_target_halo_ids : ndarray
+            Numpy integer array of shape (stop-start, ) storing the halo ID
+            of the target halo hosting each selected source galaxy
+
+        target_galaxy_source_halo_ids : ndarray
+            Numpy integer array of shape (stop-start, ) storing the halo ID
+            of the source halo hosting each selected source galaxy
+        """
+        start, stop, first_halo, last_halo, first, richness = self._runs(start, stop)
+        indices = self._selection_indices_of_runs(first, richness, stop-start)
+        target_galaxy_target_halo_ids = np.repeat(self.target_halo_ids[first_halo:last_halo], richness)
+        target_galaxy_source_halo_ids = np.repeat(self.source_halo_ids[first_halo:last_halo], richness)
+        return indices, target_galaxy_target_halo_ids, target_galaxy_source_halo_ids
+
+    def selection_indices(self, start=0, stop=None):
+        """ Indices in the source galaxy catalog of the target galaxies
+        in the interval [``start``, ``stop``). See the `expand` method.
+        """
+        start, stop, __, __, first, richness = self._runs(start, stop)
+        return self._selection_indices_of_runs(first, richness, stop-start)
+
+    def halo_row_indices(self, start=0, stop=None):
+        """ Row indices of the target halo and of the source halo hosting each
+        target galaxy in the interval [``start``, ``stop``), so that halo properties
+        can be attached to the target galaxies with a plain gather.
+
+        Returns
+        -------
+        target_galaxy_target_halo_row_indices : ndarray
+            Numpy integer array of shape (stop-start, )
+
+        target_galaxy_source_halo_row_indices : ndarray
+            Numpy integer array of shape (stop-start, )
+        """
+        if self.target_halo_row_indices is None or self.source_halo_row_indices is None:
+            msg = ("Halo row indices are only available when ``target_halo_row_indices`` "
+                "and ``source_halo_row_indices`` are passed to CompactGalaxySelection")
+            raise ValueError(msg)
+        return (self._repeat_per_halo(self.target_halo_row_indices, start, stop),
+            self._repeat_per_halo(self.source_halo_row_indices, start, stop))
+
+    def iter_chunks(self, chunk_size=default_chunk_size):
+        """ Materialize the selection in consecutive chunks of ``chunk_size`` galaxies.
+
+        Parameters
+        ----------
+        chunk_size : int, optional
+            Number of galaxies per chunk. The last chunk may be smaller.
+            Default is 10**7.
+
+        Yields
+        ------
+        start : int
+            Index of the first target galaxy of the chunk
+
+        result : tuple
+            Output of the `expand` method for the chunk
+        """
+        for start in range(0, self.num_target_gals, chunk_size):
+            yield start, self.expand(start, start+chunk_size)
+
+    def gather(self, column, chunk_size=default_chunk_size, out=None):
+        """ Transfer a property of the source galaxies to the target galaxies,
+        one chunk at a time, so that the selection indices of all target galaxies
+        never need to be stored simultaneously.
+
+        Parameters
+        ----------
+        column : ndarray
+            Array of shape (num_source_gals, ...) storing a property of
+            every galaxy of the source galaxy catalog, e.g., a column of a table,
+            a memory-mapped array or an HDF5 dataset. Memory-mapped arrays and
+            HDF5 datasets are read in sequential blocks. See `galsampler.utils.take`.
+
+        chunk_size : int, optional
+            Number of galaxies per chunk. Default is 10**7.
+
+        out : ndarray, optional
+            Array of shape (num_target_gals, ...) in which to store the result,
+            e.g., a memory-mapped array. Default is None, in which case
+            a new array is allocated.
+
+        Returns
+        -------
+        out : ndarray
+            Array of shape (num_target_gals, ...) storing the property
+            of every target galaxy
+        """
+        column = atleast_1d_no_copy(column)
+        if out is None:
+            out = np.empty((self.num_target_gals, ) + column.shape[1:], dtype=column.dtype)
+        elif len(out) != self.num_target_gals:
+            msg = "Input ``out`` has length {0} but there are num_target_gals = {1} selected galaxies"
+            raise ValueError(msg.format(len(out), self.num_target_gals))
+
+        with stage('gather', self.num_target_gals):
+            for start in range(0, self.num_target_gals, chunk_size):
+                stop = min(start+chunk_size, self.num_target_gals)
+                out[start:stop] = take(column, self.selection_indices(start, stop))
+        return out
+
+    def _runs(self, start, stop):
+        """ Runs of galaxies of the halos overlapping the interval [``start``, ``stop``),
+        with the first and last runs trimmed to the interval.
+        """
+        num_target_gals = self.num_target_gals
+        stop = num_target_gals if stop is None else min(stop, num_target_gals)
+        start = min(max(start, 0), stop)
+
+        first_halo = np.searchsorted(self._gal_offsets, start, side='right') - 1
+        last_halo = np.searchsorted(self._gal_offsets, stop, side='left')
+        if start == stop:
+            first_halo = last_halo = min(first_halo, last_halo)
+
+        first = self.first_sorted_source_gal_indices[first_halo:last_halo].copy()
+        richness = self.richness[first_halo:last_halo].copy()
+        if len(richness) > 0:
+            num_skipped = start - self._gal_offsets[first_halo]
+            first[0] += num_skipped
+            richness[0] -= num_skipped
+            richness[-1] -= self._gal_offsets[last_halo] - stop
+        return start, stop, first_halo, last_halo, first, richness
+
+    def _repeat_per_halo(self, values, start, stop):
+        """ Repeat ``values``, an array of shape (num_occupied_halos, ) aligned with
+        ``target_halo_ids``, for every target galaxy in the interval [``start``, ``stop``).
+        """
+        __, __, first_halo, last_halo, __, richness = self._runs(start, stop)
+        return np.repeat(values[first_halo:last_halo], richness)
+
+    def _selection_indices_of_runs(self, first, richness, num_gals):
+        sorted_source_galaxy_selection_indices = galaxy_selection_indices(first, richness,
+                num_gals, backend=self.backend, num_threads=self.num_threads)
+        if self.idx_sorted_source_galaxies is None:
+            return sorted_source_galaxy_selection_indices
+        else:
+            return self.idx_sorted_source_galaxies[sorted_source_galaxy_selection_indices]
+
+
+def _optional_mask(arr, mask):
+    return None if arr is None else np.atleast_1d(arr)[mask]
@@ -1 +1,2 @@
 from .galaxy_selection_kernel import *
+from .host_centric_transfer_kernel import *
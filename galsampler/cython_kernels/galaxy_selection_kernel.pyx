@@ -3,29 +3,93 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 cimport cython
+from cython.parallel cimport prange
+from libc.stdint cimport int64_t
 import numpy as np
 
 
-__all__ = ('galaxy_selection_kernel', )
+__all__ = ('galaxy_selection_kernel', 'OPENMP_ENABLED')
+
+
+cdef extern from *:
+    """
+    #ifdef _OPENMP
+    #define GALSAMPLER_OPENMP_ENABLED 1
+    #else
+    #define GALSAMPLER_OPENMP_ENABLED 0
+    #endif
+    """
+    int GALSAMPLER_OPENMP_ENABLED
+
+#  True if the extension was compiled with OpenMP support.
+#  Otherwise the parallel fill runs serially regardless of num_threads
+OPENMP_ENABLED = bool(GALSAMPLER_OPENMP_ENABLED)
 
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.nonecheck(False)
-def galaxy_selection_kernel(long[:] first_source_gal_indices, int[:] richness, int ngal_tot):
-    """
+def galaxy_selection_kernel(const int64_t[:] first_source_gal_indices, const int64_t[:] richness,
+            Py_ssize_t ngal_tot, int num_threads=1):
+    """ For every halo, write the indices of its ``richness`` resident galaxies,
+    beginning at ``first_source_gal_indices``, into a single array.
+
+    Parameters
+    ----------
+    first_source_gal_indices : ndarray
+        Numpy int64 array of shape (nhalo, ) storing the index of the
+        first galaxy of each halo
+
+    richness : ndarray
+        Numpy int64 array of shape (nhalo, ) storing the number of galaxies
+        of each halo. Halos with non-positive richness contribute no galaxies.
+
+    ngal_tot : int
+        Length of the output array. Must be at least the sum of the positive richnesses.
+
+    num_threads : int, optional
+        Number of OpenMP threads used to fill the output array. Default is 1.
+
+    Returns
+    -------
+    result : ndarray
+        Numpy int64 array of shape (ngal_tot, )
     """
-    cdef long[:] result = np.zeros(ngal_tot).astype('i8')
-    cdef int i, j, n
-    cdef int cur = 0
-    cdef int ifirst, ilast
-    cdef int nhalo = first_source_gal_indices.shape[0]
-    for i in range(nhalo):
-        ifirst = first_source_gal_indices[i]
-        n = richness[i]
-        if n > 0:
-            ilast = ifirst + richness[i]
-            for j in range(ifirst, ilast):
-                result[cur] = j
-                cur += 1
-    return result
+    cdef Py_ssize_t nhalo = first_source_gal_indices.shape[0]
+    cdef Py_ssize_t i, j, n, ifirst, cur = 0
+
+    #  Bounds are not checked in the loops below
+    if richness.shape[0] != nhalo:
+        msg = ("Input ``first_source_gal_indices`` has length {0}, "
+            "but input ``richness`` has length {1}")
+        raise ValueError(msg.format(nhalo, richness.shape[0]))
+
+    #  Exclusive prefix sum of the richness gives the output offset of each halo
+    cdef int64_t[:] offsets = np.zeros(nhalo, dtype='i8')
+    with nogil:
+        for i in range(nhalo):
+            offsets[i] = cur
+            if richness[i] > 0:
+                cur += richness[i]
+
+    if cur > ngal_tot:
+        msg = "Total richness = {0} exceeds the length of the output array ngal_tot = {1}"
+        raise ValueError(msg.format(cur, ngal_tot))
+
+    cdef int64_t[:] result = np.zeros(ngal_tot, dtype='i8')
+
+    if num_threads > 1:
+        for i in prange(nhalo, nogil=True, num_threads=num_threads, schedule='static'):
+            ifirst = first_source_gal_indices[i]
+            n = richness[i]
+            for j in range(n):
+                result[offsets[i] + j] = ifirst + j
+    else:
+        with nogil:
+            for i in range(nhalo):
+                ifirst = first_source_gal_indices[i]
+                n = richness[i]
+                for j in range(n):
+                    result[offsets[i] + j] = ifirst + j
+
+    return np.asarray(result)
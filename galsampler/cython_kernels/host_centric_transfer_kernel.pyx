@@ -0,0 +1,100 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+cimport cython
+from cython.parallel cimport prange
+from libc.math cimport fmod
+from libc.stdint cimport int64_t
+
+
+__all__ = ('host_centric_transfer_kernel', )
+
+
+ctypedef fused floating_t:
+    float
+    double
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.nonecheck(False)
+def host_centric_transfer_kernel(floating_t[:] out, const floating_t[:] host_centric,
+            const floating_t[:] target_halo, const int64_t[:] target_halo_row_indices=None,
+            const floating_t[:] rvir_ratio=None, double period=0., int num_threads=1):
+    """ For every galaxy, add the (optionally rescaled) host-centric coordinate
+    to the coordinate of its target halo and wrap the result into [0, period),
+    in a single pass with no temporary arrays.
+
+    Parameters
+    ----------
+    out : ndarray
+        Float array of shape (ngal, ) in which to store the result.
+        May be the same array as ``host_centric``.
+
+    host_centric : ndarray
+        Float array of shape (ngal, ) storing the host-centric coordinate of each galaxy
+
+    target_halo : ndarray
+        Float array storing the coordinate of the target halo, with shape (ngal, )
+        or, if ``target_halo_row_indices`` is passed, with shape (nhalo, )
+
+    target_halo_row_indices : ndarray, optional
+        Numpy int64 array of shape (ngal, ) storing the row of ``target_halo``
+        of the target halo of each galaxy
+
+    rvir_ratio : ndarray, optional
+        Float array of shape (ngal, ) by which each host-centric coordinate is rescaled
+
+    period : float, optional
+        Periodic boundary condition. Non-positive values disable the wrapping.
+        Default is 0.
+
+    num_threads : int, optional
+        Number of OpenMP threads. Default is 1.
+
+    Returns
+    -------
+    out : ndarray
+    """
+    cdef Py_ssize_t i, n = out.shape[0]
+    cdef bint has_rows = target_halo_row_indices is not None
+    cdef bint has_rvir_ratio = rvir_ratio is not None
+    cdef bint wrap = period > 0
+    cdef floating_t p = <floating_t>period
+    cdef floating_t h, d, x
+
+    if host_centric.shape[0] != n or (has_rows and target_halo_row_indices.shape[0] != n):
+        raise ValueError("All per-galaxy input arrays must have the same length as ``out``")
+    if (has_rvir_ratio and rvir_ratio.shape[0] != n) or (not has_rows and target_halo.shape[0] != n):
+        raise ValueError("All per-galaxy input arrays must have the same length as ``out``")
+
+    for i in prange(n, nogil=True, num_threads=num_threads, schedule='static'):
+        if has_rows:
+            h = target_halo[target_halo_row_indices[i]]
+        else:
+            h = target_halo[i]
+        if has_rvir_ratio:
+            d = host_centric[i]*rvir_ratio[i]
+        else:
+            d = host_centric[i]
+        x = h + d
+        if wrap:
+            #  Galaxies rarely lie more than one period outside the box, and
+            #  subtracting the period is then exact, so fmod is seldom needed
+            if x >= p:
+                if x < 2*p:
+                    x = x - p
+                else:
+                    x = <floating_t>fmod(x, p)
+            elif x < 0:
+                if x <= -p:
+                    x = <floating_t>fmod(x, p)
+                if x < 0:
+                    x = x + p
+            #  A tiny negative coordinate can round up to the period itself
+            if x >= p:
+                x = 0
+        out[i] = x
+
+    return out
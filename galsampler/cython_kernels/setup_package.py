@@ -1,10 +1,53 @@
 from distutils.extension import Extension
 import os
+import shutil
+import tempfile
 
 PATH_TO_PKG = os.path.relpath(os.path.dirname(__file__))
-SOURCES = ("galaxy_selection_kernel.pyx", )
+SOURCES = ("galaxy_selection_kernel.pyx", "host_centric_transfer_kernel.pyx")
 THIS_PKG_NAME = '.'.join(__name__.split('.')[:-1])
 
+OPENMP_TEST_PROGRAM = """
+#include <omp.h>
+int main(void) { return omp_get_max_threads() > 0 ? 0 : 1; }
+"""
+
+
+def get_openmp_flags():
+    """ Return the compiler and linker flags needed to build with OpenMP,
+    or two empty lists if the compiler does not support OpenMP.
+
+    OpenMP can also be disabled by setting the environment variable
+    GALSAMPLER_DISABLE_OPENMP, in which case the parallel kernels run serially.
+    """
+    if os.environ.get('GALSAMPLER_DISABLE_OPENMP', False):
+        return [], []
+
+    from distutils.ccompiler import new_compiler
+    from distutils.sysconfig import customize_compiler
+    from distutils.errors import CompileError, LinkError
+
+    compiler = new_compiler()
+    customize_compiler(compiler)
+    if compiler.compiler_type == 'msvc':
+        compile_flags, link_flags = ['/openmp'], []
+    else:
+        compile_flags, link_flags = ['-fopenmp'], ['-fopenmp']
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmp_dir, 'test_openmp.c')
+        with open(fname, 'w') as f:
+            f.write(OPENMP_TEST_PROGRAM)
+        objects = compiler.compile([fname], output_dir=tmp_dir, extra_postargs=compile_flags)
+        compiler.link_executable(objects, os.path.join(tmp_dir, 'test_openmp'),
+            extra_postargs=link_flags)
+    except (CompileError, LinkError):
+        return [], []
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return compile_flags, link_flags
+
 
 def get_extensions():
 
@@ -13,7 +56,7 @@ def get_extensions():
     include_dirs = ['numpy']
     libraries = []
     language = 'c'
-    extra_compile_args = []
+    extra_compile_args, extra_link_args = get_openmp_flags()
 
     extensions = []
     for name, source in zip(names, sources):
@@ -22,6 +65,7 @@ def get_extensions():
             include_dirs=include_dirs,
             libraries=libraries,
             language=language,
-            extra_compile_args=extra_compile_args))
+            extra_compile_args=extra_compile_args,
+            extra_link_args=extra_link_args))
 
     return extensions
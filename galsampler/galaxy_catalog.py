@@ -0,0 +1,168 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict
+import numpy as np
+from .compact_selection import default_chunk_size
+from .halo_ids import HaloIdIndex
+from .instrumentation import stage
+from .utils import atleast_1d_no_copy, take
+
+
+__all__ = ('build_target_galaxy_catalog', )
+
+
+def build_target_galaxy_catalog(selection, source_galaxies, target_halos,
+            source_galaxy_keys=None, target_halo_keys=(), out=None,
+            chunk_size=default_chunk_size, include_halo_ids=True, target_halo_id_key='halo_id'):
+    """ Build the target galaxy catalog in a single pass over the selected galaxies.
+
+    Properties of the source galaxies are copied from the selected source galaxies,
+    and properties of the target halos are copied from the halo hosting each
+    target galaxy, using the target halo row indices recorded during the selection,
+    so that no matching on halo IDs is required. Selections without row indices
+    are matched to the target halos by halo ID with a `HaloIdIndex`.
+    The catalog is built one chunk of ``chunk_size`` galaxies at a time:
+    the selection indices of a chunk are computed once and reused for every column,
+    and are never stored for all galaxies at once.
+
+    Parameters
+    ----------
+    selection : `CompactGalaxySelection`
+        Selection returned by `SourceSampler.sample` or
+        `source_galaxy_selection_indices` with ``compact=True``
+
+    source_galaxies : table
+        Source galaxy catalog, stored as a Numpy structured array,
+        a dictionary of Numpy arrays, or an Astropy Table,
+        with one row per source galaxy. Columns may be memory-mapped arrays
+        or HDF5 datasets, e.g., an open ``h5py.Group``, which are read in
+        sequential blocks. See `galsampler.utils.take`.
+
+    target_halos : table
+        Target halo catalog, stored as a Numpy structured array,
+        a dictionary of Numpy arrays, or an Astropy Table, with one row per
+        target halo, in the same order as the target halos passed to the selection
+        unless the selection has no target halo row indices.
+
+    source_galaxy_keys : sequence, optional
+        Names of the columns of ``source_galaxies`` inherited by the target galaxies.
+        Default is None, in which case all columns are inherited.
+
+    target_halo_keys : sequence, optional
+        Names of the columns of ``target_halos`` inherited by the target galaxies,
+        e.g., ('halo_x', 'halo_y', 'halo_z', 'halo_mvir'). Default is an empty tuple.
+
+    out : table, optional
+        Preallocated catalog in which to store the result, e.g., a memory-mapped
+        structured array or a dictionary of memory-mapped arrays, with a column
+        of length ``selection.num_target_gals`` for each output key.
+        Default is None, in which case the columns are allocated as needed.
+
+    chunk_size : int, optional
+        Number of galaxies per chunk. Default is 10**7.
+
+    include_halo_ids : bool, optional
+        If True, the catalog also stores the ``target_halo_id`` and ``source_halo_id``
+        of the halos hosting each target galaxy. Default is True.
+
+    target_halo_id_key : string, optional
+        Name of the halo ID column of ``target_halos``, only used to locate the
+        target halos of a selection without target halo row indices.
+        Default is ``halo_id``.
+
+    Returns
+    -------
+    target_galaxies : table
+        ``out`` if it was passed, otherwise an ordered dictionary of Numpy arrays
+        of shape (num_target_gals, ), which can be passed to `astropy.table.Table`
+
+    Examples
+    --------
+    >>> from galsampler import CompactGalaxySelection
+    >>> selection = CompactGalaxySelection(np.array((1, 0)), np.array((2, 1)),
+    ...     np.array((100, 101)), np.array((7, 3)), target_halo_row_indices=np.arange(2),
+    ...     source_halo_row_indices=np.array((1, 0)))
+    >>> source_galaxies = dict(luminosity=np.array((1e10, 2e10, 3e10)))
+    >>> target_halos = dict(halo_mvir=np.array((1e12, 1e14)))
+    >>> target_galaxies = build_target_galaxy_catalog(selection, source_galaxies,
+    ...     target_halos, target_halo_keys=('halo_mvir', ))
+    """
+    if source_galaxy_keys is None:
+        source_galaxy_keys = _column_names(source_galaxies)
+    source_galaxy_keys, target_halo_keys = list(source_galaxy_keys), list(target_halo_keys)
+
+    halo_id_keys = ['target_halo_id', 'source_halo_id'] if include_halo_ids else []
+    output_keys = halo_id_keys + source_galaxy_keys + target_halo_keys
+    duplicate_keys = set(key for key in output_keys if output_keys.count(key) > 1)
+    if duplicate_keys:
+        msg = ("The following keys appear more than once in the output catalog:\n{0}\n"
+            "Select distinct keys with ``source_galaxy_keys`` and ``target_halo_keys``")
+        raise ValueError(msg.format(sorted(duplicate_keys)))
+
+    source_columns = [atleast_1d_no_copy(source_galaxies[key]) for key in source_galaxy_keys]
+    target_columns = [atleast_1d_no_copy(target_halos[key]) for key in target_halo_keys]
+
+    num_target_gals = selection.num_target_gals
+    if out is None:
+        out = OrderedDict()
+        if include_halo_ids:
+            out['target_halo_id'] = np.empty(num_target_gals, dtype=selection.target_halo_ids.dtype)
+            out['source_halo_id'] = np.empty(num_target_gals, dtype=selection.source_halo_ids.dtype)
+        for key, column in zip(source_galaxy_keys + target_halo_keys, source_columns + target_columns):
+            out[key] = np.empty((num_target_gals, ) + column.shape[1:], dtype=column.dtype)
+    output_columns = [out[key] for key in output_keys]
+    for key, column in zip(output_keys, output_columns):
+        if len(column) != num_target_gals:
+            msg = ("Column ``{0}`` of ``out`` has length {1} "
+                "but there are num_target_gals = {2} selected galaxies")
+            raise ValueError(msg.format(key, len(column), num_target_gals))
+
+    num_source_keys = len(source_galaxy_keys)
+    output_source_columns = output_columns[len(halo_id_keys):len(halo_id_keys)+num_source_keys]
+    output_target_columns = output_columns[len(halo_id_keys)+num_source_keys:]
+
+    if target_columns:
+        if selection.target_halo_row_indices is None:
+            target_halo_index = HaloIdIndex(np.asarray(target_halos[target_halo_id_key]))
+            target_halo_rows_of_halos = target_halo_index.lookup(selection.target_halo_ids)
+            if np.any(target_halo_rows_of_halos < 0):
+                msg = ("Some target halos of the selection do not appear in "
+                    "column ``{0}`` of ``target_halos``")
+                raise ValueError(msg.format(target_halo_id_key))
+        else:
+            target_halo_rows_of_halos = selection.target_halo_row_indices
+
+    for start in range(0, num_target_gals, chunk_size):
+        stop = min(start+chunk_size, num_target_gals)
+
+        with stage('expand_selection', stop-start):
+            if include_halo_ids:
+                indices, target_galaxy_target_halo_ids, target_galaxy_source_halo_ids = (
+                    selection.expand(start, stop))
+                output_columns[0][start:stop] = target_galaxy_target_halo_ids
+                output_columns[1][start:stop] = target_galaxy_source_halo_ids
+            elif source_columns:
+                indices = selection.selection_indices(start, stop)
+
+        with stage('gather_source_galaxy_columns', (stop-start)*len(source_columns)):
+            for column, output_column in zip(source_columns, output_source_columns):
+                output_column[start:stop] = take(column, indices)
+
+        if target_columns:
+            with stage('gather_target_halo_columns', (stop-start)*len(target_columns)):
+                target_halo_rows = selection._repeat_per_halo(target_halo_rows_of_halos, start, stop)
+                for column, output_column in zip(target_columns, output_target_columns):
+                    output_column[start:stop] = take(column, target_halo_rows)
+
+    return out
+
+
+def _column_names(table):
+    """ Names of the columns of a structured array, a dictionary or an Astropy Table.
+    """
+    try:
+        return list(table.dtype.names)
+    except AttributeError:
+        return list(table.keys())
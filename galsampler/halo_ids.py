@@ -0,0 +1,204 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+
+
+__all__ = ('HaloIdIndex', 'crossmatch_halo_ids')
+
+#  A direct-address table is used when the IDs span at most this many values per halo
+default_max_dense_ratio = 4
+
+
+def crossmatch_halo_ids(x, halo_ids, max_dense_ratio=default_max_dense_ratio):
+    """ Find the elements of ``x``, e.g., the host halo IDs of a galaxy catalog,
+    which may be repeated, that appear in the array ``halo_ids`` of unique halo IDs.
+
+    Equivalent to ``crossmatch(x, halo_ids)`` of `halotools.utils`, but optimized for
+    the case of unique halo IDs with a `HaloIdIndex`: ``halo_ids`` is never sorted
+    when the IDs are integers spanning a range of at most ``max_dense_ratio*len(halo_ids)``
+    values, in which case every element of ``x`` is looked up in a direct-address table
+    in constant time. Otherwise, ``halo_ids`` is sorted and the elements of ``x``
+    are located with a binary search. In both cases ``x`` is never sorted.
+
+    Parameters
+    ----------
+    x : ndarray
+        Numpy array of shape (num_x, ), possibly with repeated values
+
+    halo_ids : ndarray
+        Numpy array of shape (num_halos, ) storing unique values
+
+    max_dense_ratio : float, optional
+        Largest ratio of the range spanned by the integer halo IDs to the number
+        of halos for which a direct-address table is used. Default is 4.
+
+    Returns
+    -------
+    idx_x : ndarray
+        Numpy integer array storing, in increasing order, the indices of the
+        elements of ``x`` that appear in ``halo_ids``
+
+    idx_halo_ids : ndarray
+        Numpy integer array with the same shape as ``idx_x`` such that
+        ``x[idx_x] == halo_ids[idx_halo_ids]``
+
+    Examples
+    --------
+    >>> halo_ids = np.array((5, 3, 9))
+    >>> galaxy_host_halo_ids = np.array((3, 3, 7, 9, 5, 3))
+    >>> idx_x, idx_halo_ids = crossmatch_halo_ids(galaxy_host_halo_ids, halo_ids)
+    >>> assert np.all(galaxy_host_halo_ids[idx_x] == halo_ids[idx_halo_ids])
+    """
+    rows = HaloIdIndex(halo_ids, max_dense_ratio).lookup(x)
+    idx_x = np.flatnonzero(rows >= 0)
+    return idx_x, rows[idx_x]
+
+
+class HaloIdIndex(object):
+    """ Index mapping the IDs of a halo catalog to their row in the catalog,
+    built once and reused for any number of vectorized lookups.
+
+    When the halo IDs are integers spanning a range of at most
+    ``max_dense_ratio*num_halos`` values, as in most simulations, the index is a
+    direct-address table storing the row of every possible ID, so that each
+    lookup takes constant time. Otherwise, the index stores the sorted halo IDs
+    and each lookup is a binary search.
+
+    Parameters
+    ----------
+    halo_ids : ndarray
+        Numpy array of shape (num_halos, ) storing unique halo IDs
+
+    max_dense_ratio : float, optional
+        Largest ratio of the range spanned by the integer halo IDs to the number
+        of halos for which a direct-address table is used. Default is 4.
+
+    Examples
+    --------
+    >>> halo_ids = np.array((5, 3, 9))
+    >>> index = HaloIdIndex(halo_ids)
+    >>> index.is_dense
+    True
+    >>> rows = index.lookup(np.array((3, 3, 7, 9)))
+    >>> assert np.all(rows == (1, 1, -1, 2))
+    """
+
+    def __init__(self, halo_ids, max_dense_ratio=default_max_dense_ratio):
+        self.halo_ids = np.atleast_1d(halo_ids)
+        num_halos = len(self.halo_ids)
+        self.is_dense = _is_dense(self.halo_ids, max_dense_ratio)
+
+        if self.is_dense:
+            id_min = self.halo_ids.min()
+            self._id_min, self._id_max = int(id_min), int(self.halo_ids.max())
+            self._table = np.full(self._id_max - self._id_min + 1, -1, dtype=np.intp)
+            #  Offsets are computed in the dtype of the IDs, e.g., uint64 IDs may exceed 2**63
+            self._table[(self.halo_ids - id_min).astype(np.intp)] = np.arange(num_halos)
+        else:
+            self._idx_sorted = np.argsort(self.halo_ids)
+            self._sorted_halo_ids = self.halo_ids[self._idx_sorted]
+
+    def __len__(self):
+        return len(self.halo_ids)
+
+    def lookup(self, ids, missing=-1):
+        """ Row of each ID in the halo catalog.
+
+        Parameters
+        ----------
+        ids : ndarray
+            Numpy array of shape (num_ids, ), possibly with repeated values
+
+        missing : int, optional
+            Value returned for IDs that do not appear in the halo catalog. Default is -1.
+
+        Returns
+        -------
+        rows : ndarray
+            Numpy integer array of shape (num_ids, ) storing the row of each ID,
+            or ``missing``
+        """
+        ids = np.atleast_1d(ids)
+        rows = np.full(len(ids), missing, dtype=np.intp)
+        if len(self.halo_ids) == 0 or len(ids) == 0:
+            return rows
+
+        dtype = self.halo_ids.dtype
+        if dtype.kind in 'iu':
+            is_valid, ids = cast_ids_to_dtype(ids, dtype)
+        else:
+            is_valid = np.ones(len(ids), dtype=bool)
+
+        if self.is_dense:
+            in_range = (ids >= dtype.type(self._id_min)) & (ids <= dtype.type(self._id_max))
+            is_valid[is_valid] = in_range
+            found = self._table[(ids[in_range] - dtype.type(self._id_min)).astype(np.intp)]
+            if missing != -1:
+                found[found == -1] = missing
+        else:
+            pos = np.searchsorted(self._sorted_halo_ids, ids)
+            np.minimum(pos, len(self.halo_ids)-1, out=pos)
+            found = np.where(self._sorted_halo_ids[pos] == ids, self._idx_sorted[pos], missing)
+        rows[is_valid] = found
+        return rows
+
+
+def cast_ids_to_dtype(ids, dtype):
+    """ Cast the elements of ``ids`` that are exactly representable in the integer
+    ``dtype`` to ``dtype``.
+
+    Comparisons between signed and unsigned 64-bit integers are performed
+    in float64 by Numpy, so that IDs larger than 2**53 may compare equal to
+    different IDs. Casting the IDs to a common integer dtype avoids the promotion.
+
+    Parameters
+    ----------
+    ids : ndarray
+        Numpy array of shape (num_ids, ) of any integer or floating-point dtype
+
+    dtype : dtype
+        Integer dtype
+
+    Returns
+    -------
+    is_representable : ndarray
+        Numpy boolean array of shape (num_ids, ) that is False for IDs that are out of
+        the range of ``dtype``, e.g., negative IDs for an unsigned dtype, or not integers
+
+    cast_ids : ndarray
+        Numpy array of shape (is_representable.sum(), ) and dtype ``dtype``
+        storing ``ids[is_representable]``
+
+    Examples
+    --------
+    >>> ids = np.array((-1, 2**60+3))
+    >>> is_representable, cast_ids = cast_ids_to_dtype(ids, np.uint64)
+    >>> assert np.all(is_representable == (False, True))
+    >>> assert cast_ids[0] == 2**60+3
+    """
+    ids = np.atleast_1d(ids)
+    dtype = np.dtype(dtype)
+    info = np.iinfo(dtype)
+    if ids.dtype.kind in 'iu':
+        #  The bounds are only compared when they are representable in the dtype of the IDs
+        ids_info = np.iinfo(ids.dtype)
+        is_representable = np.ones(len(ids), dtype=bool)
+        if ids_info.min < info.min:
+            is_representable &= ids >= ids.dtype.type(info.min)
+        if ids_info.max > info.max:
+            is_representable &= ids <= ids.dtype.type(info.max)
+    else:
+        #  info.max + 1 is a power of two, exactly representable in floating point
+        is_representable = (ids >= info.min) & (ids < info.max + 1.) & (ids == np.floor(ids))
+    return is_representable, ids[is_representable].astype(dtype)
+
+
+def _is_dense(halo_ids, max_dense_ratio):
+    """ Whether the integer halo IDs span at most ``max_dense_ratio`` values per halo.
+    """
+    if halo_ids.dtype.kind not in 'iu' or len(halo_ids) == 0:
+        return False
+    span = int(halo_ids.max()) - int(halo_ids.min()) + 1
+    return span <= max_dense_ratio*len(halo_ids)
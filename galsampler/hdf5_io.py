@@ -0,0 +1,324 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict
+import itertools
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+
+try:
+    import h5py
+    HAS_H5PY = True
+except ImportError:
+    h5py = None
+    HAS_H5PY = False
+
+from .host_halo_binning import _halo_bin_indices
+from .galaxy_catalog import build_target_galaxy_catalog
+from .instrumentation import stage
+from .source_halo_selection import fixed_seed
+
+
+__all__ = ('iter_hdf5_chunks', 'prefetch', 'HDF5ChunkedWriter', 'populate_hdf5_target_galaxy_catalog')
+
+default_chunk_size = int(1e6)
+
+
+def _require_h5py():
+    if not HAS_H5PY:
+        msg = "The ``galsampler.hdf5_io`` module requires h5py, which is not installed"
+        raise ImportError(msg)
+
+
+def iter_hdf5_chunks(source, keys, chunk_size=default_chunk_size, start=0, stop=None):
+    """ Read the columns ``keys`` of an HDF5 table in consecutive chunks of rows.
+
+    Only the requested columns are read, and only one chunk is held in memory at a time.
+
+    Parameters
+    ----------
+    source : string or `h5py.Group`
+        Name of an HDF5 file, or an open HDF5 group, storing each column of the table
+        as a dataset of shape (num_rows, ...)
+
+    keys : sequence
+        Names of the datasets to read
+
+    chunk_size : int, optional
+        Number of rows per chunk. Default is 10**6.
+
+    start, stop : int, optional
+        Range of rows to read. Default is all rows.
+
+    Yields
+    ------
+    first_row : int
+        Index of the first row of the chunk
+
+    chunk : OrderedDict
+        Dictionary mapping each key to a Numpy array of shape (num_rows_in_chunk, ...)
+    """
+    _require_h5py()
+    if isinstance(source, (str, bytes)):
+        with h5py.File(source, 'r') as f:
+            for result in iter_hdf5_chunks(f, keys, chunk_size, start, stop):
+                yield result
+        return
+
+    datasets = [source[key] for key in keys]
+    num_rows = len(datasets[0]) if datasets else 0
+    stop = num_rows if stop is None else min(stop, num_rows)
+    for first_row in range(start, stop, chunk_size):
+        last_row = min(first_row + chunk_size, stop)
+        with stage('read_hdf5_chunk', last_row-first_row):
+            chunk = OrderedDict((key, dataset[first_row:last_row]) for key, dataset in zip(keys, datasets))
+        yield first_row, chunk
+
+
+def prefetch(iterable, depth=1):
+    """ Iterate over ``iterable`` while a background thread computes
+    the next ``depth`` items, e.g., to overlap reading the next chunk of a catalog
+    with the computations on the current chunk.
+
+    Exceptions raised while computing an item are raised again by the consumer.
+
+    Parameters
+    ----------
+    iterable : iterable
+
+    depth : int, optional
+        Maximum number of items computed ahead of the consumer. Default is 1.
+
+    Yields
+    ------
+    item
+        Items of ``iterable``, in order
+
+    Examples
+    --------
+    >>> list(prefetch(iter(range(3))))
+    [0, 1, 2]
+    """
+    items = queue.Queue(maxsize=depth)
+    done = object()
+    stopped = threading.Event()
+
+    def _producer():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if stopped.is_set():
+                    return
+                items.put((item, None))
+        except BaseException as exc:
+            items.put((done, exc))
+        else:
+            items.put((done, None))
+        finally:
+            #  Release resources held by generators, e.g., open files
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    thread = threading.Thread(target=_producer)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, exc = items.get()
+            if exc is not None:
+                raise exc
+            if item is done:
+                return
+            yield item
+    finally:
+        #  Unblock the producer if the consumer stops early
+        stopped.set()
+        while thread.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+
+
+class HDF5ChunkedWriter(object):
+    """ Append columns to an HDF5 table one chunk of rows at a time.
+
+    Each column is stored as a resizable, chunked and optionally compressed dataset,
+    created from the dtype and shape of the first chunk written.
+
+    Parameters
+    ----------
+    target : string or `h5py.Group`
+        Name of an HDF5 file, which is created or truncated,
+        or an open HDF5 group in which to create the datasets
+
+    chunk_size : int, optional
+        Number of rows per HDF5 chunk of each dataset. Default is 10**6.
+
+    compression : string, optional
+        Compression filter of the datasets, e.g., ``gzip`` or ``lzf``.
+        Default is None, for no compression.
+
+    compression_opts : int, optional
+        Compression level of the ``gzip`` filter. Default is None.
+
+    Examples
+    --------
+    >>> import os, tempfile
+    >>> fname = os.path.join(tempfile.mkdtemp(), 'target_galaxies.hdf5')
+    >>> with HDF5ChunkedWriter(fname, compression='gzip') as writer:  # doctest: +SKIP
+    ...     writer.write(dict(luminosity=np.ones(5), x=np.zeros(5, dtype='f4')))
+    ...     writer.write(dict(luminosity=np.ones(3), x=np.zeros(3, dtype='f4')))
+    """
+
+    def __init__(self, target, chunk_size=default_chunk_size, compression=None, compression_opts=None):
+        _require_h5py()
+        if isinstance(target, (str, bytes)):
+            self._file = h5py.File(target, 'w')
+            self.group = self._file
+        else:
+            self._file = None
+            self.group = target
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.num_rows = 0
+
+    def write(self, columns):
+        """ Append a chunk of rows.
+
+        Parameters
+        ----------
+        columns : dict
+            Dictionary mapping the name of each column to an array of shape
+            (num_rows_in_chunk, ...). Every chunk must store the same columns.
+        """
+        num_rows = len(next(iter(columns.values()))) if columns else 0
+        for key, arr in columns.items():
+            arr = np.asarray(arr)
+            if len(arr) != num_rows:
+                msg = "All columns of a chunk must have the same length, but ``{0}`` has length {1} != {2}"
+                raise ValueError(msg.format(key, len(arr), num_rows))
+            if key not in self.group:
+                self.group.create_dataset(key, shape=(self.num_rows, ) + arr.shape[1:],
+                    maxshape=(None, ) + arr.shape[1:], dtype=arr.dtype,
+                    chunks=(max(1, self.chunk_size), ) + arr.shape[1:],
+                    compression=self.compression, compression_opts=self.compression_opts)
+            dataset = self.group[key]
+            if num_rows > 0:
+                with stage('write_hdf5_chunk', num_rows):
+                    dataset.resize(self.num_rows + num_rows, axis=0)
+                    dataset[self.num_rows:] = arr
+        self.num_rows += num_rows
+
+    def close(self):
+        """ Close the file if it was opened by the writer.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def populate_hdf5_target_galaxy_catalog(sampler, target_halos, binned_haloprops, output,
+            source_galaxies, source_galaxy_keys=None, target_halo_keys=(),
+            halo_id_key='halo_id', seed=fixed_seed, chunk_size=default_chunk_size,
+            compression=None, compression_opts=None, prefetch_depth=1):
+    """ Populate a target halo catalog stored in HDF5 with the galaxies of a source catalog,
+    writing the target galaxy catalog to HDF5, one chunk of target halos at a time.
+
+    For each chunk of target halos, the columns needed for the binning and the
+    inherited halo properties are read while the previous chunk is processed,
+    the halos are binned with `halo_bin_indices`, their galaxies are selected with
+    `SourceSampler.sample_chunks`, and the target galaxy catalog is built with
+    `build_target_galaxy_catalog` and appended to the output.
+    Results do not depend on ``chunk_size``.
+
+    Parameters
+    ----------
+    sampler : `SourceSampler`
+        Sampler of the source catalog
+
+    target_halos : string or `h5py.Group`
+        HDF5 file or group storing the target halo catalog, one dataset per column
+
+    binned_haloprops : dict
+        Dictionary mapping the name of each binned halo property of the target halo
+        catalog to its bins, in the same order as the bins passed to ``sampler``.
+        Use an OrderedDict on Python versions where dictionaries are unordered.
+
+    output : string or `h5py.Group`
+        HDF5 file, which is created or truncated, or group in which to write
+        the target galaxy catalog
+
+    source_galaxies : table
+        Source galaxy catalog, e.g., an open `h5py.Group`.
+        See `build_target_galaxy_catalog`.
+
+    source_galaxy_keys : sequence, optional
+        See `build_target_galaxy_catalog`. Default is None, for all columns.
+
+    target_halo_keys : sequence, optional
+        See `build_target_galaxy_catalog`. Default is an empty tuple.
+
+    halo_id_key : string, optional
+        Name of the halo ID column of the target halo catalog. Default is ``halo_id``.
+
+    seed : int, optional
+        Random number seed. Default is 43.
+
+    chunk_size : int, optional
+        Number of target halos per chunk, and number of rows per HDF5 chunk
+        of the output datasets. Default is 10**6.
+
+    compression : string, optional
+        Compression filter of the output datasets. See `HDF5ChunkedWriter`.
+        Default is None.
+
+    compression_opts : int, optional
+        See `HDF5ChunkedWriter`. Default is None.
+
+    prefetch_depth : int, optional
+        Number of chunks of target halos read ahead by a background thread.
+        Use 0 to read in the calling thread. Default is 1.
+
+    Returns
+    -------
+    num_target_gals : int
+        Number of galaxies written to ``output``
+    """
+    _require_h5py()
+    binned_keys = list(binned_haloprops.keys())
+    read_keys = list(OrderedDict.fromkeys([halo_id_key] + binned_keys + list(target_halo_keys)))
+
+    chunks = iter_hdf5_chunks(target_halos, read_keys, chunk_size)
+    if prefetch_depth > 0:
+        chunks = prefetch(chunks, prefetch_depth)
+    chunks, selection_chunks = itertools.tee(chunks)
+
+    def _target_halo_chunks():
+        for __, chunk in selection_chunks:
+            #  The pairs are passed in order rather than as keyword arguments,
+            #  since the order of **kwargs is only preserved from Python 3.6
+            bin_numbers = _halo_bin_indices((chunk[key], binned_haloprops[key]) for key in binned_keys)
+            yield bin_numbers, chunk[halo_id_key]
+
+    selections = sampler.sample_chunks(_target_halo_chunks(), seed=seed, compact=True)
+    with HDF5ChunkedWriter(output, chunk_size=chunk_size, compression=compression,
+                compression_opts=compression_opts) as writer:
+        for (__, chunk), selection in zip(chunks, selections):
+            writer.write(build_target_galaxy_catalog(selection, source_galaxies, chunk,
+                source_galaxy_keys=source_galaxy_keys, target_halo_keys=target_halo_keys))
+        return writer.num_rows
@@ -0,0 +1,212 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+
+from .instrumentation import stage
+
+try:
+    from .cython_kernels import host_centric_transfer_kernel as cython_host_centric_transfer_kernel
+    HAS_CYTHON_KERNELS = True
+except ImportError:
+    cython_host_centric_transfer_kernel = None
+    HAS_CYTHON_KERNELS = False
+
+
+__all__ = ('transfer_host_centric_positions', 'transfer_host_centric_velocities')
+
+available_backends = ('auto', 'cython', 'numpy')
+
+
+def transfer_host_centric_positions(host_centric_pos, target_halo_pos, period, out=None,
+            target_halo_row_indices=None, rvir_ratio=None, backend='auto', num_threads=1):
+    """ Place each target galaxy at the position of its target halo plus the position
+    of the source galaxy relative to its source halo, wrapping the result into the
+    periodic box, in a single pass that can overwrite the input array in place.
+
+    The calculation ``x = (target_halo_x + rvir_ratio*host_centric_x) % period``
+    is equivalent to adding the host-centric position to the target halo position
+    and calling ``enforce_periodicity_of_box`` of halotools, but requires no
+    temporary arrays of shape (num_target_gals, ).
+
+    Parameters
+    ----------
+    host_centric_pos : ndarray
+        Float array of shape (num_target_gals, ) or (num_target_gals, ndim) storing the
+        position of each selected source galaxy relative to its source halo,
+        e.g., ``source_gals['x'][indices] - source_gals['halo_x'][indices]``
+
+    target_halo_pos : ndarray
+        Float array storing the position of the target halo of each galaxy,
+        with the same shape as ``host_centric_pos``, or, if ``target_halo_row_indices``
+        is passed, storing the position of every halo of the target halo catalog
+
+    period : float or sequence
+        Length of the periodic box, or sequence of ndim lengths
+
+    out : ndarray, optional
+        Array with the same shape as ``host_centric_pos`` in which to store the result.
+        Pass ``out=host_centric_pos`` to overwrite the host-centric positions in place.
+        Default is None, in which case a new array with the dtype of ``host_centric_pos``
+        is allocated. Computations are carried out in the dtype of ``out``,
+        e.g., float32, and inputs of a different dtype are converted.
+
+    target_halo_row_indices : ndarray, optional
+        Numpy integer array of shape (num_target_gals, ) storing the row index of the
+        target halo of each galaxy in ``target_halo_pos``, as returned by
+        `CompactGalaxySelection.halo_row_indices`, so that the positions of the
+        target halos need not be gathered beforehand. Values outside the interval
+        [0, num_target_halos) raise an IndexError. Default is None.
+
+    rvir_ratio : ndarray, optional
+        Float array of shape (num_target_gals, ) storing the ratio of the virial radius
+        of the target halo to that of the source halo of each galaxy,
+        by which the host-centric positions are rescaled. Default is None.
+
+    backend : string, optional
+        Implementation used to compute the result. Options are ``cython``,
+        which requires the compiled extension, ``numpy``, and ``auto``, which
+        selects ``cython`` when the compiled extension is available and
+        ``out`` is a float32 or float64 array, and ``numpy`` otherwise.
+        Default is ``auto``.
+
+    num_threads : int, optional
+        Number of OpenMP threads used by the ``cython`` backend. Default is 1.
+
+    Returns
+    -------
+    out : ndarray
+        Array with the same shape as ``host_centric_pos`` storing
+        the position of every target galaxy in the interval [0, period)
+
+    Examples
+    --------
+    >>> host_centric_x = np.array((0.5, -0.25, 1.), dtype='f4')
+    >>> target_halo_x = np.array((100., 0.1, 249.5), dtype='f4')
+    >>> x = transfer_host_centric_positions(host_centric_x, target_halo_x, 250., out=host_centric_x)
+    """
+    return _transfer_host_centric_coordinates(host_centric_pos, target_halo_pos, period, out,
+        target_halo_row_indices, rvir_ratio, backend, num_threads)
+
+
+def transfer_host_centric_velocities(host_centric_vel, target_halo_vel, out=None,
+            target_halo_row_indices=None, rvir_ratio=None, backend='auto', num_threads=1):
+    """ Assign each target galaxy the velocity of its target halo plus the velocity
+    of the source galaxy relative to its source halo, in a single pass that can
+    overwrite the input array in place.
+
+    Parameters
+    ----------
+    host_centric_vel : ndarray
+        Float array of shape (num_target_gals, ) or (num_target_gals, ndim) storing the
+        velocity of each selected source galaxy relative to its source halo
+
+    target_halo_vel : ndarray
+        Float array storing the velocity of the target halo of each galaxy.
+        See `transfer_host_centric_positions`.
+
+    out : ndarray, optional
+        See `transfer_host_centric_positions`. Default is None.
+
+    target_halo_row_indices : ndarray, optional
+        See `transfer_host_centric_positions`. Default is None.
+
+    rvir_ratio : ndarray, optional
+        Float array of shape (num_target_gals, ) by which the host-centric velocities
+        are rescaled, e.g., the ratio of the virial velocities of the
+        target and source halos. Default is None.
+
+    backend : string, optional
+        See `transfer_host_centric_positions`. Default is ``auto``.
+
+    num_threads : int, optional
+        Number of OpenMP threads used by the ``cython`` backend. Default is 1.
+
+    Returns
+    -------
+    out : ndarray
+        Array with the same shape as ``host_centric_vel`` storing
+        the velocity of every target galaxy
+    """
+    return _transfer_host_centric_coordinates(host_centric_vel, target_halo_vel, None, out,
+        target_halo_row_indices, rvir_ratio, backend, num_threads)
+
+
+def _transfer_host_centric_coordinates(host_centric, target_halo, period, out,
+            target_halo_row_indices, rvir_ratio, backend, num_threads):
+    """ Dispatch each coordinate axis to the selected backend.
+    """
+    host_centric = np.asarray(host_centric)
+    if out is None:
+        out = np.empty_like(host_centric)
+    elif out.shape != host_centric.shape:
+        msg = "Input ``out`` has shape {0} but ``host_centric`` has shape {1}"
+        raise ValueError(msg.format(out.shape, host_centric.shape))
+    dtype = out.dtype
+
+    if backend == 'auto':
+        use_cython = HAS_CYTHON_KERNELS and dtype in (np.float32, np.float64)
+        backend = 'cython' if use_cython else 'numpy'
+    if backend not in available_backends:
+        msg = "keyword argument ``backend`` can only take the following values:\n{0}"
+        raise ValueError(msg.format(available_backends))
+    elif backend == 'cython' and not HAS_CYTHON_KERNELS:
+        msg = ("The ``cython`` backend requires the compiled extension "
+            "``galsampler.cython_kernels``, which is not available.\n"
+            "Use backend='numpy' instead.")
+        raise ImportError(msg)
+
+    host_centric = host_centric.astype(dtype, copy=False)
+    target_halo = np.asarray(target_halo).astype(dtype, copy=False)
+    if target_halo_row_indices is not None:
+        target_halo_row_indices = np.asarray(target_halo_row_indices).astype('i8', copy=False)
+        #  The cython backend does not check bounds when gathering the target halos
+        num_target_halos = len(target_halo)
+        if len(target_halo_row_indices) > 0 and (target_halo_row_indices.min() < 0
+                or target_halo_row_indices.max() >= num_target_halos):
+            msg = "Input ``target_halo_row_indices`` must be in the interval [0, {0})"
+            raise IndexError(msg.format(num_target_halos))
+    if rvir_ratio is not None:
+        rvir_ratio = np.asarray(rvir_ratio).astype(dtype, copy=False)
+
+    if host_centric.ndim == 1:
+        axes = [(out, host_centric, target_halo, period)]
+    else:
+        ndim = host_centric.shape[1]
+        periods = [None]*ndim if period is None else np.broadcast_to(period, (ndim, ))
+        axes = [(out[:, i], host_centric[:, i], target_halo[:, i], periods[i]) for i in range(ndim)]
+
+    with stage('transfer_host_centric_coordinates', host_centric.size):
+        for _out, _host_centric, _target_halo, _period in axes:
+            if backend == 'cython':
+                _period = 0. if _period is None else float(_period)
+                cython_host_centric_transfer_kernel(_out, _host_centric, _target_halo,
+                    target_halo_row_indices, rvir_ratio, _period, num_threads)
+            else:
+                _numpy_host_centric_transfer(_out, _host_centric, _target_halo,
+                    target_halo_row_indices, rvir_ratio, _period)
+    return out
+
+
+def _numpy_host_centric_transfer(out, host_centric, target_halo,
+            target_halo_row_indices, rvir_ratio, period):
+    """ Pure-Numpy counterpart of the ``cython`` backend using in-place operations,
+    requiring at most one temporary array for the gathered target halo coordinates.
+    """
+    if rvir_ratio is None:
+        np.copyto(out, host_centric)
+    else:
+        np.multiply(host_centric, rvir_ratio, out=out)
+
+    if target_halo_row_indices is None:
+        np.add(target_halo, out, out=out)
+    else:
+        np.add(target_halo[target_halo_row_indices], out, out=out)
+
+    if period is not None:
+        period = out.dtype.type(period)
+        np.mod(out, period, out=out)
+        #  A tiny negative coordinate can round up to the period itself
+        out[out >= period] = 0
+    return out
@@ -4,10 +4,12 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import numpy as np
 
-from .source_halo_selection import get_source_bin_from_target_bin
+from .source_halo_selection import get_source_bins_from_target_bins
+from .instrumentation import stage
+from .utils import atleast_1d_no_copy, iter_blocks
 
 
-__all__ = ('halo_bin_indices', 'matching_bin_dictionary')
+__all__ = ('halo_bin_indices', 'matching_bin_array', 'matching_bin_dictionary')
 
 
 def halo_bin_indices(**haloprop_and_bins_dict):
@@ -21,6 +23,8 @@ def halo_bin_indices(**haloprop_and_bins_dict):
         each value should be a two-element tuple storing two ndarrays,
         the first with shape (num_halos, ), the second with shape (nbins, ),
         where ``nbins`` is allowed to vary from property to property.
+        The halo properties may be memory-mapped arrays or HDF5 datasets,
+        which are read in sequential blocks.
 
     Returns
     -------
@@ -44,16 +48,68 @@ def halo_bin_indices(**haloprop_and_bins_dict):
     In this case, all values in the ``cell_ids`` array
     will be in the interval [0, num_bins_mass*num_bins_conc).
     """
-    bin_indices_dict = {}
-    for haloprop_name in haloprop_and_bins_dict.keys():
-        arr, bins = haloprop_and_bins_dict[haloprop_name]
-        bin_indices = np.maximum(1, np.minimum(np.digitize(arr, bins), len(bins)-1)) - 1
-        bin_indices_dict[haloprop_name] = bin_indices
+    return _halo_bin_indices(haloprop_and_bins_dict.values())
 
-    num_bins_dict = {key: len(haloprop_and_bins_dict[key][1])-1 for key in haloprop_and_bins_dict.keys()}
 
-    return np.ravel_multi_index(list(bin_indices_dict.values()),
-            list(num_bins_dict.values()))
+def _halo_bin_indices(haloprops_and_bins):
+    """ Cell ID of every host halo, for a sequence of (haloprop, bins) pairs
+    in the order of the dimensions of the cells. See `halo_bin_indices`.
+    """
+    haloprops_and_bins = list(haloprops_and_bins)
+    haloprops = [atleast_1d_no_copy(haloprop) for haloprop, __ in haloprops_and_bins]
+    bins_list = [bins for __, bins in haloprops_and_bins]
+    num_bins_list = [len(bins)-1 for bins in bins_list]
+
+    #  Halos are binned one block at a time, so that memory-mapped
+    #  halo properties never need to be read into memory all at once
+    num_halos = len(haloprops[0])
+    cell_ids = np.zeros(num_halos, dtype=np.intp)
+    with stage('halo_bin_indices', num_halos):
+        for ifirst, ilast in iter_blocks(num_halos):
+            bin_indices_list = [np.maximum(1, np.minimum(np.digitize(arr[ifirst:ilast], bins), len(bins)-1)) - 1
+                for arr, bins in zip(haloprops, bins_list)]
+            cell_ids[ifirst:ilast] = np.ravel_multi_index(bin_indices_list, num_bins_list)
+    return cell_ids
+
+
+def matching_bin_array(assigned_bin_numbers, nmin, bin_shapes):
+    """ For every bin number, find the closest bin with more than ``nmin`` objects,
+    and return the result in the form of an integer lookup array.
+
+    Parameters
+    ----------
+    assigned_bin_numbers : ndarray
+        Numpy integer array of shape (num_objects, ) storing the bin number
+        to which each object has been assigned
+
+    nmin : int
+        Minimum number of objects for the bin to be considered well-sampled
+
+    bin_shapes : tuple
+        Sequence storing the dimension of the binning scheme.
+        See `matching_bin_dictionary` for details.
+
+    Returns
+    -------
+    matching_bins : ndarray
+        Numpy integer array of shape (num_bins_total, ).
+        The value stored at index ``i`` is the nearest bin to bin ``i``
+        with more than ``nmin`` objects.
+
+    Examples
+    --------
+    >>> assigned_bin_numbers = np.array((3, 2, 2, 2, 3, 5, 2, 5, 5, 2, 2))
+    >>> matching_bins = matching_bin_array(assigned_bin_numbers, 3, (10, ))
+
+    Because the result is an ndarray, it can be indexed directly
+    with an array of bin numbers:
+
+    >>> matched_bin_numbers = matching_bins[assigned_bin_numbers]
+    """
+    num_bins_total = int(np.prod(bin_shapes))
+    assigned_bin_numbers = np.atleast_1d(assigned_bin_numbers).astype('i8')
+    counts = np.bincount(assigned_bin_numbers, minlength=num_bins_total)[:num_bins_total]
+    return get_source_bins_from_target_bins(counts, nmin, bin_shapes)
 
 
 def matching_bin_dictionary(assigned_bin_numbers, nmin, bin_shapes):
@@ -83,18 +139,7 @@ def matching_bin_dictionary(assigned_bin_numbers, nmin, bin_shapes):
         Python dictionary storing the bin correspondence.
         There will be a key for every possible bin number.
         The value bound to that key stores the nearest bin with more than ``nmin`` objects.
+        The same correspondence is available as an ndarray via `matching_bin_array`.
     """
-    num_bins_total = np.product(bin_shapes)
-    unique_bins, counts = np.unique(assigned_bin_numbers, return_counts=True)
-
-    d = {}
-    for bin_number in range(num_bins_total):
-        if bin_number in unique_bins:
-            d[bin_number] = counts[unique_bins == bin_number][0]
-        else:
-            d[bin_number] = 0
-
-    result = {}
-    for i in range(num_bins_total):
-        result[i] = get_source_bin_from_target_bin(d, i, nmin, bin_shapes)
-    return result
+    matching_bins = matching_bin_array(assigned_bin_numbers, nmin, bin_shapes)
+    return dict(enumerate(matching_bins.tolist()))
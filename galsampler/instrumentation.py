@@ -0,0 +1,210 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict
+import json
+import threading
+import time
+import tracemalloc
+
+
+__all__ = ('StageProfiler', 'stage')
+
+#  The peak of each stage is measured after a call to tracemalloc.reset_peak,
+#  which requires Python 3.9
+HAS_RESET_PEAK = hasattr(tracemalloc, 'reset_peak')
+
+_active_profilers = []
+_lock = threading.Lock()
+
+
+class StageProfiler(object):
+    """ Context manager recording the wall time, number of items and allocated bytes
+    of every named stage executed by galsampler while the context is active,
+    e.g., the sorting of the source galaxies, the selection of the source halos,
+    or the expansion of the selected halos into galaxies.
+
+    Instrumentation is opt-in: when no profiler is active,
+    each stage only costs a single check of an empty list.
+
+    Parameters
+    ----------
+    trace_memory : bool, optional
+        If True, the peak number of bytes allocated during each stage, including
+        Numpy arrays, is measured with `tracemalloc`, at the price of slowing down
+        allocations. Default is False, in which case no bytes are recorded.
+        Memory tracing requires Python 3.9 or later.
+
+    callback : callable, optional
+        Function called as ``callback(name, wall_time, num_items, peak_bytes)``
+        at the end of every stage, e.g., to forward the measurements
+        to a logger. Default is None.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from galsampler import halo_bin_indices
+    >>> mass = 10**np.random.uniform(10, 15, 1000)
+    >>> with StageProfiler() as profiler:
+    ...     cell_ids = halo_bin_indices(mass=(mass, np.logspace(10, 15, 12)))
+    >>> profiler.stages['halo_bin_indices']['num_items']
+    1000
+    >>> table = profiler.summary()
+    >>> json_string = profiler.to_json()
+    """
+
+    def __init__(self, trace_memory=False, callback=None):
+        if trace_memory and not HAS_RESET_PEAK:
+            msg = "StageProfiler(trace_memory=True) requires Python 3.9 or later"
+            raise NotImplementedError(msg)
+        self.trace_memory = trace_memory
+        self.callback = callback
+        self.stages = OrderedDict()
+        self._started_tracemalloc = False
+        self._local = threading.local()
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        with _lock:
+            _active_profilers.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        with _lock:
+            _active_profilers.remove(self)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def record(self, name, wall_time, num_items=None, peak_bytes=None):
+        """ Accumulate the measurements of one execution of the stage ``name``.
+        """
+        with _lock:
+            entry = self.stages.setdefault(name,
+                OrderedDict((('calls', 0), ('wall_time', 0.), ('num_items', None), ('peak_bytes', None))))
+            entry['calls'] += 1
+            entry['wall_time'] += wall_time
+            if num_items is not None:
+                entry['num_items'] = (entry['num_items'] or 0) + int(num_items)
+            if peak_bytes is not None:
+                entry['peak_bytes'] = max(entry['peak_bytes'] or 0, int(peak_bytes))
+        if self.callback is not None:
+            self.callback(name, wall_time, num_items, peak_bytes)
+
+    def summary(self):
+        """ Table of the stages in order of first execution, with the number of calls,
+        the total wall time, the total number of items, the throughput and
+        the largest peak of allocated bytes of a single call.
+
+        Returns
+        -------
+        table : string
+        """
+        header = ('stage', 'calls', 'time [s]', 'items', 'items/s', 'peak bytes')
+        rows = [header]
+        for name, entry in self.stages.items():
+            num_items, wall_time = entry['num_items'], entry['wall_time']
+            rate = num_items/wall_time if num_items is not None and wall_time > 0 else None
+            rows.append((name, str(entry['calls']), '{0:.4f}'.format(wall_time),
+                _format_optional(num_items, '{0:d}'), _format_optional(rate, '{0:.3e}'),
+                _format_optional(entry['peak_bytes'], '{0:d}')))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        lines = ['  '.join(value.ljust(width) if i == 0 else value.rjust(width)
+            for i, (value, width) in enumerate(zip(row, widths))) for row in rows]
+        lines.insert(1, '  '.join('-'*width for width in widths))
+        return '\n'.join(lines)
+
+    def to_json(self, **kwargs):
+        """ Measurements of every stage as a JSON string.
+        Keyword arguments are passed to `json.dumps`.
+        """
+        return json.dumps(self.stages, **kwargs)
+
+    def _memory_stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+
+class _NullStage(object):
+    """ Stage returned when no profiler is active.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_null_stage = _NullStage()
+
+
+class _Stage(object):
+    """ Stage measured by the active profilers.
+    """
+    def __init__(self, name, num_items, profilers):
+        self.name = name
+        self.num_items = num_items
+        self.profilers = profilers
+
+    def __enter__(self):
+        self._memory_frames = []
+        for profiler in self.profilers:
+            if profiler.trace_memory and tracemalloc.is_tracing():
+                stack = profiler._memory_stack()
+                current, peak = tracemalloc.get_traced_memory()
+                #  Peaks of the enclosing stage are preserved before resetting
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], peak)
+                tracemalloc.reset_peak()
+                frame = [current, current]
+                stack.append(frame)
+                self._memory_frames.append((profiler, frame))
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall_time = time.perf_counter() - self._start
+        peak_bytes = {}
+        for profiler, frame in self._memory_frames:
+            stack = profiler._memory_stack()
+            stack.pop()
+            absolute_peak = max(frame[1], tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1][1] = max(stack[-1][1], absolute_peak)
+            peak_bytes[id(profiler)] = absolute_peak - frame[0]
+        for profiler in self.profilers:
+            profiler.record(self.name, wall_time, self.num_items, peak_bytes.get(id(profiler)))
+
+
+def stage(name, num_items=None):
+    """ Context manager delimiting a named stage of a galsampler calculation,
+    measured by every active `StageProfiler`.
+
+    Parameters
+    ----------
+    name : string
+        Name of the stage
+
+    num_items : int, optional
+        Number of items processed by the stage, e.g., the number of galaxies.
+        Default is None.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> with stage('argsort', num_items=3):
+    ...     idx = np.argsort(np.array((3, 1, 2)))
+    """
+    if not _active_profilers:
+        return _null_stage
+    return _Stage(name, num_items, list(_active_profilers))
+
+
+def _format_optional(value, fmt):
+    return '-' if value is None else fmt.format(value)
@@ -1,6 +1,7 @@
 """
 """
 import numpy as np
+from .instrumentation import stage
 
 
 __all__ = ('matched_value_selection_indices', )
@@ -37,12 +38,14 @@ def matched_value_selection_indices(x, y, assume_x_is_sorted=False):
     if assume_x_is_sorted:
         x_sorted = x
     else:
-        idx_sorted_source = np.argsort(x)
-        x_sorted = x[idx_sorted_source]
+        with stage('sort_source_values', len(x)):
+            idx_sorted_source = np.argsort(x)
+            x_sorted = x[idx_sorted_source]
 
     num_source = len(x)
-    idx_selection = np.searchsorted(x_sorted, y)
-    idx_selection = np.where(idx_selection >= num_source, num_source-1, idx_selection)
+    with stage('matched_value_selection_indices', len(y)):
+        idx_selection = np.searchsorted(x_sorted, y)
+        idx_selection = np.where(idx_selection >= num_source, num_source-1, idx_selection)
 
     if assume_x_is_sorted:
         return idx_selection
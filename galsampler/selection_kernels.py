@@ -0,0 +1,107 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+
+try:
+    from .cython_kernels import galaxy_selection_kernel as cython_galaxy_selection_kernel
+    HAS_CYTHON_KERNELS = True
+except ImportError:
+    cython_galaxy_selection_kernel = None
+    HAS_CYTHON_KERNELS = False
+
+
+__all__ = ('galaxy_selection_indices', 'numpy_galaxy_selection_kernel')
+
+available_backends = ('auto', 'cython', 'numpy')
+
+
+def galaxy_selection_indices(first_source_gal_indices, richness, ngal_tot,
+            backend='auto', num_threads=1):
+    """ For every halo, calculate the indices of its ``richness`` resident galaxies,
+    beginning at ``first_source_gal_indices``, and concatenate the results.
+
+    Parameters
+    ----------
+    first_source_gal_indices : ndarray
+        Numpy integer array of shape (nhalo, ) storing the index of the
+        first galaxy of each halo
+
+    richness : ndarray
+        Numpy integer array of shape (nhalo, ) storing the number of galaxies
+        of each halo
+
+    ngal_tot : int
+        Length of the output array. Must be at least the sum of ``richness``.
+
+    backend : string, optional
+        Implementation used to compute the result. Options are ``cython``,
+        which requires the compiled extension, ``numpy``, which is a vectorized
+        pure-Numpy implementation, and ``auto``, which selects ``cython`` whenever the
+        compiled extension is available, regardless of the number of halos,
+        and ``numpy`` otherwise. All backends return identical results.
+        Default is ``auto``.
+
+    num_threads : int, optional
+        Number of OpenMP threads used by the ``cython`` backend. Default is 1.
+
+    Returns
+    -------
+    indices : ndarray
+        Numpy int64 array of shape (ngal_tot, )
+
+    Examples
+    --------
+    >>> first_source_gal_indices = np.array((5, 0, 2))
+    >>> richness = np.array((2, 0, 3))
+    >>> indices = galaxy_selection_indices(first_source_gal_indices, richness, 5)
+    """
+    #  No size threshold: the GalaxySelectionIndices benchmarks of bench_kernels
+    #  find the compiled kernel about 3 times faster from 1 to 10**6 galaxies
+    if backend == 'auto':
+        backend = 'cython' if HAS_CYTHON_KERNELS else 'numpy'
+
+    first_source_gal_indices = np.asarray(first_source_gal_indices).astype('i8', copy=False)
+    richness = np.asarray(richness).astype('i8', copy=False)
+
+    if backend == 'cython':
+        if not HAS_CYTHON_KERNELS:
+            msg = ("The ``cython`` backend requires the compiled extension "
+                "``galsampler.cython_kernels``, which is not available.\n"
+                "Use backend='numpy' instead.")
+            raise ImportError(msg)
+        return cython_galaxy_selection_kernel(first_source_gal_indices, richness,
+                ngal_tot, num_threads)
+    elif backend == 'numpy':
+        return numpy_galaxy_selection_kernel(first_source_gal_indices, richness, ngal_tot)
+    else:
+        msg = "keyword argument ``backend`` can only take the following values:\n{0}"
+        raise ValueError(msg.format(available_backends))
+
+
+def numpy_galaxy_selection_kernel(first_source_gal_indices, richness, ngal_tot):
+    """ Vectorized pure-Numpy implementation of the ``cython`` backend of
+    `galaxy_selection_indices`, requiring no Python loop over halos.
+
+    Galaxy ``k`` of the output belongs to halo ``i``, whose galaxies begin at output
+    offset ``offsets[i] = cumsum(richness)[i] - richness[i]``, so that its index is
+    ``k + (first_source_gal_indices[i] - offsets[i])``.
+    """
+    richness = np.maximum(np.asarray(richness).astype('i8', copy=False), 0)
+    if len(richness) != len(first_source_gal_indices):
+        msg = ("Input ``first_source_gal_indices`` has length {0}, "
+            "but input ``richness`` has length {1}")
+        raise ValueError(msg.format(len(first_source_gal_indices), len(richness)))
+    offsets = np.cumsum(richness)
+    num_selected = offsets[-1] if len(offsets) > 0 else 0
+    offsets -= richness
+
+    if num_selected > ngal_tot:
+        msg = "Total richness = {0} exceeds the length of the output array ngal_tot = {1}"
+        raise ValueError(msg.format(num_selected, ngal_tot))
+
+    result = np.zeros(ngal_tot, dtype='i8')
+    result[:num_selected] = np.repeat(first_source_gal_indices - offsets, richness)
+    result[:num_selected] += np.arange(num_selected)
+    return result
@@ -1,17 +1,24 @@
 """
 """
 import numpy as np
-from halotools.utils import crossmatch
-from .utils import compute_richness
-from .source_halo_selection import source_halo_index_selection
-from .cython_kernels import galaxy_selection_kernel
+from .halo_ids import HaloIdIndex
+from .utils import compute_richness_and_first_index, is_sorted, atleast_1d_no_copy
+from .source_halo_selection import _SourceHaloPools, _source_halo_index_selection, fixed_seed
+from .selection_kernels import galaxy_selection_indices
+from .compact_selection import CompactGalaxySelection
+from .instrumentation import stage
 
-__all__ = ('source_galaxy_selection_indices', )
+__all__ = ('source_galaxy_selection_indices', 'SourceSampler')
+
+#  Optional keyword arguments of SourceSampler and SourceSampler.sample
+source_sampler_kwargs = ('sparse_cells', 'assume_sorted', 'check_sorted')
+sample_kwargs = ('seed', 'backend', 'num_threads', 'n_jobs', 'executor',
+    'seed_by_halo_id', 'compact', 'return_row_indices')
 
 
 def source_galaxy_selection_indices(source_galaxies_host_halo_id,
             source_halos_bin_number, source_halos_halo_id,
-            target_halos_bin_number, target_halo_ids, nhalo_min, *bins):
+            target_halos_bin_number, target_halo_ids, nhalo_min, *bins, **kwargs):
     """
     Examples
     --------
@@ -57,6 +64,52 @@ def source_galaxy_selection_indices(source_galaxies_host_halo_id,
     *bins : sequence
         Sequence of arrays that were used to bin the halos
 
+    seed : int, optional
+        Random number seed. Default is 43.
+
+    backend : string, optional
+        Implementation used to expand the selected halos into the selected galaxies:
+        ``cython``, ``numpy`` or ``auto``. See `galaxy_selection_indices`.
+        Default is ``auto``.
+
+    num_threads : int, optional
+        Number of OpenMP threads used by the ``cython`` backend. Default is 1.
+
+    n_jobs : int, optional
+        Number of workers used to select the source halos of different cells
+        concurrently. See `source_halo_index_selection`. Default is 1.
+
+    executor : `concurrent.futures.Executor`, optional
+        Executor used to select the source halos of different cells concurrently.
+        See `source_halo_index_selection`. Default is None.
+
+    sparse_cells : bool, optional
+        If True, only occupied cells are materialized.
+        See `source_halo_index_selection`. Default is False.
+
+    assume_sorted : bool, optional
+        If True, ``source_galaxies_host_halo_id`` is assumed to already be sorted,
+        skipping the sort of the galaxy catalog. See `SourceSampler`. Default is False.
+
+    check_sorted : bool, optional
+        If True and ``assume_sorted`` is True, verify that ``source_galaxies_host_halo_id``
+        is sorted, raising a ValueError if it is not. Default is True.
+
+    seed_by_halo_id : bool, optional
+        If True, the source halo selected for each target halo depends only on
+        the target halo ID and not on the rest of the target catalog.
+        See `source_halo_index_selection`. Default is False.
+
+    compact : bool, optional
+        If True, return a `CompactGalaxySelection` rather than the three arrays below,
+        so that the selection of each galaxy is only computed on demand.
+        See `SourceSampler.sample`. Default is False.
+
+    return_row_indices : bool, optional
+        If True, also return the row indices of the target and source halos,
+        so that halo properties can be attached to the target galaxies with
+        a plain gather rather than by matching halo IDs. Default is False.
+
     Returns
     -------
     indices : ndarray
@@ -70,53 +123,388 @@ def source_galaxy_selection_indices(source_galaxies_host_halo_id,
     target_galaxy_source_halo_ids : ndarray
         Numpy integer array of shape (num_target_gals, ) storing the halo ID
         of the source halo hosting each selected source galaxy
-    """
-    #  Sort the source galaxies so that members of a common halo are grouped together
-    idx_sorted_source_galaxies = np.argsort(source_galaxies_host_halo_id)
-    sorted_source_galaxies_host_halo_id = source_galaxies_host_halo_id[idx_sorted_source_galaxies]
 
-    #  Calculate the index correspondence array that will undo the sorting at the end
-    num_source_gals = len(source_galaxies_host_halo_id)
-    idx_unsorted_galaxy_indices = np.arange(num_source_gals).astype('i8')[idx_sorted_source_galaxies]
+    target_galaxy_target_halo_row_indices : ndarray
+        Returned only if ``return_row_indices`` is True.
+        Numpy integer array of shape (num_target_gals, ) storing the row index
+        in the target halo catalog of the target halo hosting each selected galaxy
 
-    #  For each source halo, calculate the number of resident galaxies
-    source_halos_richness = compute_richness(
-                source_halos_halo_id, sorted_source_galaxies_host_halo_id)
+    target_galaxy_source_halo_row_indices : ndarray
+        Returned only if ``return_row_indices`` is True.
+        Numpy integer array of shape (num_target_gals, ) storing the row index
+        in the source halo catalog of the source halo hosting each selected galaxy
 
-    #  For each source halo, calculate the index of its first resident galaxy
-    source_halo_sorted_source_galaxies_indices = _galaxy_table_indices(
-                source_halos_halo_id, sorted_source_galaxies_host_halo_id)
+    target_halo_source_halo_row_indices : ndarray
+        Returned only if ``return_row_indices`` is True.
+        Numpy integer array of shape (num_target_halos, ) storing the row index
+        in the source halo catalog of the source halo selected for each target halo
+    """
+    _check_kwargs('source_galaxy_selection_indices', kwargs, source_sampler_kwargs + sample_kwargs)
+    sampler = SourceSampler(source_galaxies_host_halo_id,
+            source_halos_bin_number, source_halos_halo_id, nhalo_min, *bins,
+            **{key: kwargs[key] for key in source_sampler_kwargs if key in kwargs})
+    return sampler.sample(target_halos_bin_number, target_halo_ids,
+            **{key: kwargs[key] for key in sample_kwargs if key in kwargs})
+
+
+class SourceSampler(object):
+    """ Object used to transfer the galaxies of a single source catalog into
+    any number of target halo catalogs.
+
+    All quantities that depend only on the source catalog are computed once
+    when the object is instantiated: the order of the galaxies sorted by host halo,
+    the richness and first-galaxy index of every source halo, the source halos
+    grouped by cell, and the nearest well-sampled cell of every cell.
+    Each call to the `sample` method then only performs the target-side work.
+    Results are identical to those of `source_galaxy_selection_indices`.
+    Target catalogs that do not fit in memory can be processed in chunks
+    with the `sample_chunks` method.
 
-    #  For each target halo, calculate the index of the associated source halo
-    source_halo_selection_indices, matching_target_halo_ids = source_halo_index_selection(
-            source_halos_bin_number, target_halos_bin_number, target_halo_ids, nhalo_min, *bins)
+    Parameters
+    ----------
+    source_galaxies_host_halo_id : ndarray
+        Numpy integer array of shape (num_source_gals, )
+        storing the ID of the host halo of each source galaxy
 
-    #  For each target halo, calculate the number of galaxies
-    target_halo_richness = source_halos_richness[source_halo_selection_indices]
-    num_target_gals = np.sum(target_halo_richness)
+    source_halos_bin_number : ndarray
+        Numpy integer array of shape (num_source_halos, )
+        storing the bin number assigned to every halo in the source halo catalog
 
-    #  For each target halo, calculate the halo ID of the associated source halo
-    target_halo_source_halo_ids = source_halos_halo_id[source_halo_selection_indices]
+    source_halos_halo_id : ndarray
+        Numpy integer array of shape (num_source_halos, )
+        storing the ID of every halo in the source halo catalog
 
-    #  For each target halo, calculate the index of its first resident galaxy
-    target_halo_first_sorted_source_gal_indices = (
-                source_halo_sorted_source_galaxies_indices[source_halo_selection_indices])
+    nhalo_min : int
+        Minimum permissible number of halos in source catalog for a cell to be
+        considered well-sampled
 
-    #  For every target halo, we know the index of the first and last galaxy to select
-    #  Calculate an array of shape (num_target_gals, ) with the index of each selected galaxy
-    sorted_source_galaxy_selection_indices = np.array(galaxy_selection_kernel(
-            target_halo_first_sorted_source_gal_indices.astype('i8'),
-            target_halo_richness.astype('i4'), num_target_gals))
+    *bins : sequence
+        Sequence of arrays that were used to bin the halos
 
-    #  For each target galaxy, calculate the halo ID of its source and target halo
-    target_galaxy_target_halo_ids = np.repeat(matching_target_halo_ids, target_halo_richness)
-    target_galaxy_source_halo_ids = np.repeat(target_halo_source_halo_ids, target_halo_richness)
+    sparse_cells : bool, optional
+        If True, only occupied cells are materialized.
+        See `source_halo_index_selection`. Default is False.
 
-    #  For each index in the sorted galaxy catalog,
-    #  calculate the index of the catalog in its original order
-    selection_indices = idx_unsorted_galaxy_indices[sorted_source_galaxy_selection_indices]
+    assume_sorted : bool, optional
+        If True, ``source_galaxies_host_halo_id`` is assumed to already be
+        in monotonically increasing order, so that the galaxies are not sorted
+        and the selected indices require no reordering, reducing both runtime and
+        peak memory. In this case ``source_galaxies_host_halo_id`` may be a
+        memory-mapped array, e.g., from ``np.load(fname, mmap_mode='r')``,
+        or an HDF5 dataset, which is only ever read in sequential blocks;
+        otherwise it is read into memory to be sorted. Default is False.
 
-    return (selection_indices, target_galaxy_target_halo_ids, target_galaxy_source_halo_ids)
+    check_sorted : bool, optional
+        If True and ``assume_sorted`` is True, verify that
+        ``source_galaxies_host_halo_id`` is sorted with an O(num_source_gals) pass,
+        raising a ValueError if it is not. Default is True.
+
+    Examples
+    --------
+    >>> from galsampler.tests import fake_source_galaxy_catalog, fake_target_halo_catalog
+    >>> source_galaxies = fake_source_galaxy_catalog()
+    >>> source_halo_ids, idx = np.unique(source_galaxies['host_halo_id'], return_index=True)
+    >>> source_halo_mass = source_galaxies['host_halo_mass'][idx]
+    >>> mass_bins = np.logspace(10, 15.5, 15)
+    >>> source_halo_bin_numbers = np.digitize(source_halo_mass, mass_bins) - 1
+
+    >>> sampler = SourceSampler(source_galaxies['host_halo_id'],
+    ...     source_halo_bin_numbers, source_halo_ids, 1, mass_bins)
+
+    The same sampler can now be used to populate many target catalogs:
+
+    >>> for seed in (0, 1):
+    ...     target_halos = fake_target_halo_catalog(num_target_halos=1000, seed=seed)
+    ...     target_halo_bin_numbers = np.digitize(target_halos['mass'], mass_bins) - 1
+    ...     _result = sampler.sample(target_halo_bin_numbers, target_halos['halo_id'], seed=seed)
+    ...     selection_indices, target_galaxy_target_halo_ids, target_galaxy_source_halo_ids = _result
+    """
+
+    def __init__(self, source_galaxies_host_halo_id, source_halos_bin_number,
+                source_halos_halo_id, nhalo_min, *bins, **kwargs):
+        _check_kwargs('SourceSampler', kwargs, source_sampler_kwargs)
+        source_galaxies_host_halo_id = atleast_1d_no_copy(source_galaxies_host_halo_id)
+        self.source_halos_halo_id = np.atleast_1d(source_halos_halo_id)
+
+        if kwargs.get('assume_sorted', False):
+            if kwargs.get('check_sorted', True) and not is_sorted(source_galaxies_host_halo_id):
+                msg = ("Input ``source_galaxies_host_halo_id`` must be sorted "
+                    "in monotonically increasing order when passing assume_sorted=True")
+                raise ValueError(msg)
+            self._idx_sorted_source_galaxies = None
+            sorted_source_galaxies_host_halo_id = source_galaxies_host_halo_id
+        else:
+            #  Sort the source galaxies so that members of a common halo are grouped together.
+            #  The sorting indices also serve to undo the sorting at the end.
+            #  A stable sort preserves the order of galaxies within each halo,
+            #  so that results agree with those of a presorted catalog
+            source_galaxies_host_halo_id = np.asarray(source_galaxies_host_halo_id)
+            with stage('sort_source_galaxies', len(source_galaxies_host_halo_id)):
+                self._idx_sorted_source_galaxies = np.argsort(source_galaxies_host_halo_id, kind='mergesort')
+                sorted_source_galaxies_host_halo_id = source_galaxies_host_halo_id[
+                        self._idx_sorted_source_galaxies]
+
+        #  For each source halo, calculate the number of resident galaxies
+        #  and the index of its first resident galaxy in the sorted galaxy catalog
+        with stage('compute_richness', len(sorted_source_galaxies_host_halo_id)):
+            _result = compute_richness_and_first_index(
+                        self.source_halos_halo_id, sorted_source_galaxies_host_halo_id)
+        self.source_halos_richness, self._source_halo_sorted_source_galaxies_indices = _result
+
+        #  Group the source halos by cell and match every cell to a well-sampled cell
+        bin_shapes = tuple(len(arr)-1 for arr in bins)
+        with stage('source_halo_pools', len(self.source_halos_halo_id)):
+            self._source_halo_pools = _SourceHaloPools(source_halos_bin_number,
+                    nhalo_min, bin_shapes, kwargs.get('sparse_cells', False))
+
+    def sample(self, target_halos_bin_number, target_halo_ids, seed=fixed_seed,
+                backend='auto', num_threads=1, n_jobs=1, executor=None, seed_by_halo_id=False,
+                compact=False, return_row_indices=False):
+        """ Select the galaxies that populate the target halos.
+
+        Parameters
+        ----------
+        target_halos_bin_number : ndarray
+            Numpy integer array of shape (num_target_halos, )
+            storing the bin number assigned to every halo in the target halo catalog
+
+        target_halo_ids : ndarray
+            Numpy integer array of shape (num_target_halos, )
+            storing the ID of every halo in the target halo catalog
+
+        seed : int, optional
+            Random number seed. Default is 43.
+
+        backend : string, optional
+            Implementation used to expand the selected halos into the selected galaxies:
+            ``cython``, ``numpy`` or ``auto``. See `galaxy_selection_indices`.
+            Default is ``auto``, which falls back to ``numpy`` when the compiled
+            extension is unavailable.
+
+        num_threads : int, optional
+            Number of OpenMP threads used to expand the selected halos into
+            the selected galaxies. Has no effect unless the compiled extension
+            was built with OpenMP support. Default is 1.
+
+        n_jobs : int, optional
+            Number of workers used to select the source halos of different cells
+            concurrently. See `source_halo_index_selection`. Default is 1.
+
+        executor : `concurrent.futures.Executor`, optional
+            Executor used to select the source halos of different cells concurrently.
+            See `source_halo_index_selection`. Default is None.
+
+        seed_by_halo_id : bool, optional
+            If True, the source halo selected for each target halo depends only on
+            the seed and the target halo ID, so that results for any target halo are
+            unaffected by reordering or subsetting the target catalog.
+            See `source_halo_index_selection`. Default is False.
+
+        compact : bool, optional
+            If True, return a `CompactGalaxySelection` storing only per-halo arrays,
+            from which the three arrays below can be expanded on demand.
+            Recommended when the number of selected galaxies is too large for
+            the expanded arrays to fit in memory. Default is False.
+
+        return_row_indices : bool, optional
+            If True, also return the row indices of the target and source halos.
+            Row indices of target halos refer to the order of ``target_halo_ids``,
+            and row indices of source halos to the order of ``source_halos_halo_id``.
+            Has no effect if ``compact`` is True, since `CompactGalaxySelection`
+            always stores the row indices. Default is False.
+
+        Returns
+        -------
+        indices : ndarray
+            Numpy integer array of shape (num_target_gals, ) storing the indices
+            of the selected galaxies
+
+        target_galaxy_target_halo_ids : ndarray
+            Numpy integer array of shape (num_target_gals, ) storing the halo ID
+            of the target halo hosting each selected source galaxy
+
+        target_galaxy_source_halo_ids : ndarray
+            Numpy integer array of shape (num_target_gals, ) storing the halo ID
+            of the source halo hosting each selected source galaxy
+
+        target_galaxy_target_halo_row_indices : ndarray
+            Returned only if ``return_row_indices`` is True.
+            Numpy integer array of shape (num_target_gals, ) storing the row index
+            in the target halo catalog of the target halo hosting each selected galaxy
+
+        target_galaxy_source_halo_row_indices : ndarray
+            Returned only if ``return_row_indices`` is True.
+            Numpy integer array of shape (num_target_gals, ) storing the row index
+            in the source halo catalog of the source halo hosting each selected galaxy
+
+        target_halo_source_halo_row_indices : ndarray
+            Returned only if ``return_row_indices`` is True.
+            Numpy integer array of shape (num_target_halos, ) storing the row index
+            in the source halo catalog of the source halo selected for each target halo
+        """
+        return self._sample(target_halos_bin_number, target_halo_ids, seed=seed,
+                backend=backend, num_threads=num_threads, n_jobs=n_jobs, executor=executor,
+                seed_by_halo_id=seed_by_halo_id, compact=compact,
+                return_row_indices=return_row_indices)
+
+    def sample_chunks(self, target_halo_chunks, seed=fixed_seed,
+                backend='auto', num_threads=1, n_jobs=1, executor=None, seed_by_halo_id=False,
+                compact=False, return_row_indices=False):
+        """ Select the galaxies that populate a target halo catalog
+        that is processed one chunk at a time, e.g., a catalog too large to fit in memory.
+
+        Each cell continues its random stream from one chunk to the next, so that
+        concatenating the results of all chunks gives the same result as calling
+        the `sample` method on the entire catalog, regardless of how the catalog
+        is divided into chunks.
+
+        Parameters
+        ----------
+        target_halo_chunks : iterable
+            Iterable of (target_halos_bin_number, target_halo_ids) pairs,
+            each storing a Numpy integer array of shape (num_target_halos_in_chunk, ).
+            Chunks are consumed lazily, so a generator reading the catalog
+            from disk can be passed.
+
+        seed : int, optional
+            Random number seed. Default is 43.
+
+        backend : string, optional
+            See the `sample` method. Default is ``auto``.
+
+        num_threads : int, optional
+            See the `sample` method. Default is 1.
+
+        n_jobs : int, optional
+            See the `sample` method. Default is 1.
+
+        executor : `concurrent.futures.Executor`, optional
+            See the `sample` method. Default is None.
+
+        seed_by_halo_id : bool, optional
+            See the `sample` method. Default is False.
+
+        compact : bool, optional
+            If True, yield a `CompactGalaxySelection` for each chunk.
+            See the `sample` method. Default is False.
+
+        return_row_indices : bool, optional
+            If True, also yield the row indices of the target and source halos.
+            Row indices of target halos refer to the rows of each chunk.
+            See the `sample` method. Default is False.
+
+        Yields
+        ------
+        indices : ndarray
+            Numpy integer array of shape (num_target_gals_in_chunk, ) storing the indices
+            of the selected galaxies
+
+        target_galaxy_target_halo_ids : ndarray
+            Numpy integer array of shape (num_target_gals_in_chunk, ) storing the halo ID
+            of the target halo hosting each selected source galaxy
+
+        target_galaxy_source_halo_ids : ndarray
+            Numpy integer array of shape (num_target_gals_in_chunk, ) storing the halo ID
+            of the source halo hosting each selected source galaxy
+
+        Examples
+        --------
+        >>> from galsampler.tests import fake_source_galaxy_catalog, fake_target_halo_catalog
+        >>> source_galaxies = fake_source_galaxy_catalog()
+        >>> source_halo_ids, idx = np.unique(source_galaxies['host_halo_id'], return_index=True)
+        >>> source_halo_mass = source_galaxies['host_halo_mass'][idx]
+        >>> mass_bins = np.logspace(10, 15.5, 15)
+        >>> source_halo_bin_numbers = np.digitize(source_halo_mass, mass_bins) - 1
+        >>> sampler = SourceSampler(source_galaxies['host_halo_id'],
+        ...     source_halo_bin_numbers, source_halo_ids, 1, mass_bins)
+
+        >>> target_halos = fake_target_halo_catalog(num_target_halos=1000)
+        >>> target_halo_bin_numbers = np.digitize(target_halos['mass'], mass_bins) - 1
+        >>> chunks = ((target_halo_bin_numbers[i:i+100], target_halos['halo_id'][i:i+100])
+        ...     for i in range(0, 1000, 100))
+        >>> for _result in sampler.sample_chunks(chunks):
+        ...     selection_indices, target_galaxy_target_halo_ids, target_galaxy_source_halo_ids = _result
+        """
+        #  All chunks must draw from the same streams
+        if seed is None:
+            seed = np.random.SeedSequence().entropy % 2**64
+
+        cell_draw_counts = {}
+        for target_halos_bin_number, target_halo_ids in target_halo_chunks:
+            yield self._sample(target_halos_bin_number, target_halo_ids, seed=seed,
+                    backend=backend, num_threads=num_threads, n_jobs=n_jobs, executor=executor,
+                    seed_by_halo_id=seed_by_halo_id, compact=compact,
+                    return_row_indices=return_row_indices, cell_draw_counts=cell_draw_counts)
+
+    def _sample(self, target_halos_bin_number, target_halo_ids, seed=fixed_seed,
+                backend='auto', num_threads=1, n_jobs=1, executor=None, seed_by_halo_id=False,
+                compact=False, return_row_indices=False, cell_draw_counts=None):
+        """ Implementation of the `sample` method. See `_source_halo_index_selection`
+        for the ``cell_draw_counts`` argument.
+        """
+        #  Memory-mapped target catalogs are read here; HDF5 datasets require it
+        target_halos_bin_number = np.asarray(target_halos_bin_number)
+        target_halo_ids = np.asarray(target_halo_ids)
+
+        #  For each target halo, calculate the index of the associated source halo
+        num_target_halos = len(target_halo_ids)
+        with stage('source_halo_index_selection', num_target_halos):
+            source_halo_selection_indices, matching_target_halo_ids = _source_halo_index_selection(
+                    self._source_halo_pools, target_halos_bin_number, target_halo_ids,
+                    seed=seed, n_jobs=n_jobs, executor=executor, seed_by_halo_id=seed_by_halo_id,
+                    cell_draw_counts=cell_draw_counts)
+
+        with stage('gather_source_halo_properties', num_target_halos):
+            #  For each target halo, calculate the number of galaxies
+            target_halo_richness = self.source_halos_richness[source_halo_selection_indices]
+            num_target_gals = np.sum(target_halo_richness)
+
+            #  For each target halo, calculate the halo ID of the associated source halo
+            target_halo_source_halo_ids = self.source_halos_halo_id[source_halo_selection_indices]
+
+            #  For each target halo, calculate the index of its first resident galaxy
+            target_halo_first_sorted_source_gal_indices = (
+                        self._source_halo_sorted_source_galaxies_indices[source_halo_selection_indices])
+
+        if compact:
+            with stage('compact_selection', num_target_halos):
+                return CompactGalaxySelection(target_halo_first_sorted_source_gal_indices,
+                        target_halo_richness, matching_target_halo_ids, target_halo_source_halo_ids,
+                        self._idx_sorted_source_galaxies,
+                        target_halo_row_indices=np.arange(num_target_halos),
+                        source_halo_row_indices=source_halo_selection_indices,
+                        backend=backend, num_threads=num_threads)
+
+        #  For every target halo, we know the index of the first and last galaxy to select
+        #  Calculate an array of shape (num_target_gals, ) with the index of each selected galaxy
+        with stage('galaxy_selection_indices', num_target_gals):
+            sorted_source_galaxy_selection_indices = galaxy_selection_indices(
+                    target_halo_first_sorted_source_gal_indices, target_halo_richness,
+                    num_target_gals, backend=backend, num_threads=num_threads)
+
+        #  For each target galaxy, calculate the halo ID of its source and target halo
+        with stage('repeat_halo_ids', num_target_gals):
+            target_galaxy_target_halo_ids = np.repeat(matching_target_halo_ids, target_halo_richness)
+            target_galaxy_source_halo_ids = np.repeat(target_halo_source_halo_ids, target_halo_richness)
+
+        #  For each index in the sorted galaxy catalog,
+        #  calculate the index of the catalog in its original order
+        if self._idx_sorted_source_galaxies is None:
+            selection_indices = sorted_source_galaxy_selection_indices
+        else:
+            with stage('unsort_selection_indices', num_target_gals):
+                selection_indices = self._idx_sorted_source_galaxies[sorted_source_galaxy_selection_indices]
+
+        result = (selection_indices, target_galaxy_target_halo_ids, target_galaxy_source_halo_ids)
+        if return_row_indices:
+            with stage('repeat_halo_row_indices', num_target_gals):
+                target_galaxy_target_halo_row_indices = np.repeat(
+                    np.arange(num_target_halos), target_halo_richness)
+                target_galaxy_source_halo_row_indices = np.repeat(
+                    source_halo_selection_indices, target_halo_richness)
+            result = result + (target_galaxy_target_halo_row_indices,
+                target_galaxy_source_halo_row_indices, source_halo_selection_indices)
+        return result
 
 
 def _galaxy_table_indices(source_halo_id, galaxy_host_halo_id):
@@ -138,10 +526,22 @@ def _galaxy_table_indices(source_halo_id, galaxy_host_halo_id):
         Numpy integer array of shape (num_halos, ).
         All values will be in the interval [-1, num_gals)
     """
-    uval_gals, indx_uval_gals = np.unique(galaxy_host_halo_id, return_index=True)
-    idxA, idxB = crossmatch(source_halo_id, uval_gals)
-    num_source_halos = len(source_halo_id)
-    indices = np.zeros(num_source_halos) - 1
-    indices[idxA] = indx_uval_gals[idxB]
-    return indices.astype(int)
+    source_halo_id = np.atleast_1d(source_halo_id)
+    rows = HaloIdIndex(source_halo_id).lookup(galaxy_host_halo_id)
+    idx_gals = np.flatnonzero(rows >= 0)
+
+    #  idx_gals is increasing, so the first match of each halo is its first galaxy
+    matched_halos, first_match = np.unique(rows[idx_gals], return_index=True)
+    indices = np.zeros(len(source_halo_id), dtype=int) - 1
+    indices[matched_halos] = idx_gals[first_match]
+    return indices
 
+
+def _check_kwargs(func_name, kwargs, supported_kwargs):
+    """ Raise a TypeError if ``kwargs`` has a key outside ``supported_kwargs``,
+    as Python does for functions with explicit keyword arguments.
+    """
+    unexpected_kwargs = sorted(set(kwargs) - set(supported_kwargs))
+    if unexpected_kwargs:
+        msg = "{0}() got unexpected keyword argument(s) {1}. Supported keyword arguments are {2}"
+        raise TypeError(msg.format(func_name, unexpected_kwargs, supported_kwargs))
@@ -1,12 +1,18 @@
 """
 """
+import os
+import threading
+
 import numpy as np
-from halotools.utils import distribution_matching_indices
-from astropy.utils.misc import NumpyRNGContext
+from .instrumentation import stage
 
 
 fixed_seed = 43
 
+#  Random number generator of each thread reused for every cell,
+#  see _reused_cell_random_generator
+_thread_local = threading.local()
+
 
 __all__ = ('source_halo_index_selection', )
 
@@ -18,7 +24,7 @@ def get_source_bin_from_target_bin(source_bin_counts, bin_number, nhalo_min, bin
         return bin_number
     else:
         idx = np.unravel_index(bin_number, bin_shapes)
-        num_cells_total = np.product(bin_shapes)
+        num_cells_total = np.prod(bin_shapes)
 
         seq = list((bin_number, taxicab_metric(idx, np.unravel_index(bin_number, bin_shapes)))
             for bin_number in range(num_cells_total) if source_bin_counts[bin_number] >= nhalo_min)
@@ -26,6 +32,77 @@ def get_source_bin_from_target_bin(source_bin_counts, bin_number, nhalo_min, bin
         return sorted_seq[0][0]
 
 
+def get_source_bins_from_target_bins(source_bin_counts, nhalo_min, bin_shapes):
+    """ For every cell in the binning scheme, find the nearest cell
+    with at least ``nhalo_min`` source halos.
+
+    Distances between cells are computed according to the taxicab metric
+    on the grid of bin indices. The map for all cells is computed simultaneously
+    with a breadth-first search that begins from every well-sampled cell.
+    When two well-sampled cells are equidistant, the one with the smaller
+    bin number is selected, so that for every ``bin_number``,
+    ``result[bin_number]`` is identical to the value returned by
+    `get_source_bin_from_target_bin`.
+
+    Parameters
+    ----------
+    source_bin_counts : ndarray
+        Numpy integer array of shape (num_cells_total, ) storing the number of
+        source halos in each cell
+
+    nhalo_min : int
+        Minimum permissible number of halos in source catalog for a cell to be
+        considered well-sampled
+
+    bin_shapes : tuple
+        Sequence storing the number of bins of each binned property
+
+    Returns
+    -------
+    source_bins : ndarray
+        Numpy integer array of shape (num_cells_total, ) storing the
+        bin number of the well-sampled cell matched to each cell
+    """
+    bin_shapes = tuple(int(n) for n in bin_shapes)
+    num_cells_total = int(np.prod(bin_shapes))
+    well_sampled = np.asarray(source_bin_counts) >= nhalo_min
+    if not np.any(well_sampled):
+        msg = "There are no cells in the source catalog with more halos than nhalo_min={0}"
+        raise ValueError(msg.format(nhalo_min))
+
+    #  Unmatched cells store the sentinel value num_cells_total,
+    #  which is larger than any bin number
+    cell_numbers = np.arange(num_cells_total)
+    source_bins = np.where(well_sampled, cell_numbers, num_cells_total).reshape(bin_shapes)
+
+    unmatched = ~well_sampled.reshape(bin_shapes)
+    while np.any(unmatched):
+        #  Each unmatched cell adjacent to a matched cell inherits the smallest
+        #  matching bin number among its matched neighbors
+        candidates = np.zeros_like(source_bins) + num_cells_total
+        for axis in range(len(bin_shapes)):
+            for step in (1, -1):
+                _shifted_minimum(source_bins, step, axis, candidates)
+        newly_matched = unmatched & (candidates < num_cells_total)
+        source_bins[newly_matched] = candidates[newly_matched]
+        unmatched &= ~newly_matched
+
+    return source_bins.flatten()
+
+
+def _shifted_minimum(arr, step, axis, out):
+    """ Overwrite ``out`` with the element-wise minimum of ``out`` and
+    the array ``arr`` shifted by ``step`` elements along ``axis``.
+    """
+    src, dst = [slice(None)]*arr.ndim, [slice(None)]*arr.ndim
+    if step > 0:
+        src[axis], dst[axis] = slice(None, -step), slice(step, None)
+    else:
+        src[axis], dst[axis] = slice(-step, None), slice(None, step)
+    src, dst = tuple(src), tuple(dst)
+    np.minimum(out[dst], arr[src], out=out[dst])
+
+
 def taxicab_metric(arr1, arr2):
     return sum(abs(y-x) for x, y in zip(arr1, arr2))
 
@@ -75,6 +152,40 @@ def source_halo_index_selection(source_halo_bin_numbers,
 
     seed : int, optional
         Random number seed. Default is 43.
+        Each cell draws from an independent random stream keyed by
+        the seed and the bin number of the cell.
+
+    seed_by_halo_id : bool, optional
+        If True, the source halo selected for each target halo is a pure function
+        of the seed, the halo ID of the target halo and the source halos of its cell,
+        computed by hashing (seed, target halo ID) to a uniform random number.
+        The selection of any target halo is then unaffected by reordering,
+        splitting or extending the target catalog, so that any subset of the
+        catalog can be recomputed in isolation.
+        Only supported by the ``random`` method. Default is False.
+
+    sparse_cells : bool, optional
+        If True, only cells that are occupied by at least one source or target halo
+        are materialized, and the search for the nearest well-sampled cell is
+        restricted to occupied cells, so that memory and runtime scale with the
+        number of occupied cells rather than with the total number of cells.
+        Results are identical to those of the default dense mode.
+        Recommended when binning in several halo properties simultaneously.
+        Default is False.
+
+    n_jobs : int, optional
+        Number of workers used to perform the selection in different cells concurrently.
+        Cells are grouped into batches of similar total size to balance the load.
+        Results are bit-identical to the serial case for any value of ``n_jobs``.
+        Values less than 1 use one worker per CPU. By default, a thread pool is used
+        for the ``random`` method and a process pool for the ``hod_matching`` method.
+        Default is 1.
+
+    executor : `concurrent.futures.Executor`, optional
+        Executor used to perform the selection when more control over the workers
+        is required, e.g., to reuse a pool across calls. The executor is not shut down.
+        Note that with the ``hod_matching`` method, only process-based executors
+        give reproducible results. Default is None.
 
     Returns
     -------
@@ -87,80 +198,557 @@ def source_halo_index_selection(source_halo_bin_numbers,
         Numpy integer array of shape (num_target_halos, ) storing the halo ID
         of the target halo corresponding to each selected source halo
     """
+    bin_shapes = tuple(len(arr)-1 for arr in bins)
+    sparse_cells = kwargs.get('sparse_cells', False)
+    with stage('source_halo_pools', len(source_halo_bin_numbers)):
+        source_halo_pools = _SourceHaloPools(source_halo_bin_numbers, nhalo_min, bin_shapes, sparse_cells)
+    with stage('source_halo_index_selection', len(target_halo_ids)):
+        return _source_halo_index_selection(source_halo_pools,
+                target_halo_bin_numbers, target_halo_ids, **kwargs)
+
+
+def _source_halo_index_selection(source_halo_pools, target_halo_bin_numbers, target_halo_ids, **kwargs):
+    """ Implementation of `source_halo_index_selection` for source halos that have
+    already been grouped by cell into an instance of `_SourceHaloPools`.
+
+    The optional ``cell_draw_counts`` keyword argument is a dictionary mapping
+    the bin number of a cell to the number of random draws already made in that cell.
+    The dictionary is updated in place, so that passing the same dictionary to
+    consecutive calls continues the random stream of every cell across calls.
+    """
+    intra_bin_selection_method = kwargs.get('intra_bin_selection_method', 'random')
+    n_jobs = kwargs.get('n_jobs', 1)
+    executor = kwargs.get('executor', None)
+    cell_draw_counts = kwargs.get('cell_draw_counts', None)
+    if cell_draw_counts is None:
+        cell_draw_counts = {}
+
+    _result = source_halo_pools.group_targets(target_halo_bin_numbers)
+    target_cells, source_cells, target_idx_sorted, target_cell_offsets = _result
+    target_bin_counts = np.diff(target_cell_offsets)
+
+    result = np.zeros_like(target_halo_bin_numbers).astype('i8')
+    matching_target_halo_ids = np.zeros_like(target_halo_bin_numbers).astype('i8')
+
+    if kwargs.get('seed_by_halo_id', False):
+        if intra_bin_selection_method != 'random':
+            msg = "``seed_by_halo_id`` is only supported by the ``random`` intra_bin_selection_method"
+            raise ValueError(msg)
+
+        #  Every target halo indexes the pool of its matched source cell with a uniform
+        #  random number hashed from its own ID, so no per-cell loop is needed.
+        #  Target halos with bin numbers outside every cell are left unassigned
+        binned_idx_sorted = target_idx_sorted[target_cell_offsets[0]:target_cell_offsets[-1]]
+        target_halo_source_cells = np.repeat(source_cells, target_bin_counts)
+        pool_first = source_halo_pools.cell_offsets[target_halo_source_cells]
+        pool_size = source_halo_pools.cell_counts[target_halo_source_cells]
+        sorted_target_halo_ids = target_halo_ids[binned_idx_sorted]
+        uran = halo_id_random_uniforms(kwargs.get('seed', fixed_seed), sorted_target_halo_ids)
+        result[binned_idx_sorted] = source_halo_pools.idx_sorted[
+            pool_first + (uran*pool_size).astype('i8')]
+        matching_target_halo_ids[binned_idx_sorted] = sorted_target_halo_ids
+        return result, matching_target_halo_ids
+
+    occupied_target_cells = np.flatnonzero(target_bin_counts)
+    cell_tasks = [(target_cells[target_cell], source_cells[target_cell], target_bin_counts[target_cell],
+        cell_draw_counts.get(target_cells[target_cell], 0)) for target_cell in occupied_target_cells]
+    cell_kwargs = {key: kwargs[key] for key in
+        ('intra_bin_selection_method', 'seed', 'source_richness', 'data_richness') if key in kwargs}
+
+    if executor is None and n_jobs == 1:
+        batches = [np.arange(len(cell_tasks))]
+        batch_selections = [_select_source_halos_in_cells(source_halo_pools, cell_tasks, **cell_kwargs)]
+    else:
+        if n_jobs is None or n_jobs < 1:
+            n_jobs = os.cpu_count() or 1
+
+        #  Large batches are submitted first, and there are several batches per worker,
+        #  so that workers finishing early can pick up the remaining small batches
+        batches = _batch_cells_by_size(target_bin_counts[occupied_target_cells], 4*n_jobs)
+
+        if executor is None:
+            from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+            #  hod_matching draws from the global Numpy random state,
+            #  which cannot be shared between threads
+            if intra_bin_selection_method == 'hod_matching':
+                _executor = ProcessPoolExecutor(n_jobs)
+            else:
+                _executor = ThreadPoolExecutor(n_jobs)
+        else:
+            _executor = executor
+
+        try:
+            futures = [_executor.submit(_select_source_halos_in_cells, source_halo_pools,
+                [cell_tasks[i] for i in batch], **cell_kwargs) for batch in batches]
+            batch_selections = [future.result() for future in futures]
+        finally:
+            if executor is None:
+                _executor.shutdown()
+
+    #  Scatter the selections of each cell into the preallocated output arrays
+    for batch, selections in zip(batches, batch_selections):
+        for i, selection in zip(batch, selections):
+            target_cell = occupied_target_cells[i]
+            ifirst, ilast = target_cell_offsets[target_cell], target_cell_offsets[target_cell+1]
+            target_bin_indices = target_idx_sorted[ifirst:ilast]
+            result[target_bin_indices] = selection
+            if intra_bin_selection_method == 'random':
+                matching_target_halo_ids[target_bin_indices] = target_halo_ids[target_bin_indices]
+
+    for target_bin, __, num_target_halos_in_bin, num_previous_draws in cell_tasks:
+        cell_draw_counts[target_bin] = num_previous_draws + num_target_halos_in_bin
+
+    return result, matching_target_halo_ids
+
+
+def _select_source_halos_in_cells(source_halo_pools, cell_tasks, **kwargs):
+    """ Select source halos for a batch of target cells.
+
+    Parameters
+    ----------
+    source_halo_pools : `_SourceHaloPools`
+
+    cell_tasks : list
+        List of tuples (target_bin, source_cell, num_target_halos_in_bin, num_previous_draws)
+
+    Returns
+    -------
+    selections : list
+        List of Numpy integer arrays storing the indices of the
+        source halos selected for each cell in ``cell_tasks``
+    """
     intra_bin_selection_method = kwargs.get('intra_bin_selection_method', 'random')
     seed = kwargs.get('seed', fixed_seed)
 
-    num_source_halos = len(source_halo_bin_numbers)
-    selection_indices = np.arange(num_source_halos).astype('i8')
+    num_source_halos = source_halo_pools.num_source_halos
+    num_cells_total = source_halo_pools.num_cells_total
+
+    selections = []
+    for target_bin, source_cell, num_target_halos_in_bin, num_previous_draws in cell_tasks:
+        source_bin_indices = source_halo_pools.cell_indices(source_cell)
+
+        if intra_bin_selection_method == 'random':
+            selections.append(randomly_select_source_halos_within_bin(
+                        source_bin_indices, num_target_halos_in_bin, seed, target_bin,
+                        num_previous_draws))
+        elif intra_bin_selection_method == 'hod_matching':
+            try:
+                source_bin_richness = kwargs['source_richness'][source_bin_indices]
+                data_bin_richness = np.atleast_1d(kwargs['data_richness'][target_bin])
+                assert data_bin_richness.shape[0] > 10
+                cell_seed = _reused_cell_random_generator(seed, target_bin).integers(2**32)
+                selections.append(hod_matching_halo_bin_selection(
+                    source_bin_indices, source_bin_richness,
+                    data_bin_richness, num_target_halos_in_bin, seed=cell_seed))
+            except KeyError:
+                required_kwargs = ('source_richness', 'data_richness')
+                msg = ("When selecting the `hod_matching` option, "
+                    "you must also pass the following keyword arguments:\n{0}")
+                raise KeyError(msg.format(required_kwargs))
+            except (IndexError, TypeError):
+                msg = ("``source_richness`` keyword argument must store "
+                    "an integer ndarray of shape (num_source_halos, ) = ({0}, )\n"
+                    "``data_richness`` keyword argument must store "
+                    "a list of num_target_halo_bins={1} ndarrays of richness-matching data")
+                raise ValueError(msg.format(num_source_halos, num_cells_total))
+            except AssertionError:
+                msg = ("For target_bin = {0}, there are only {1} elements of ``data_richness``")
+                raise ValueError(msg.format(target_bin, data_bin_richness.shape[0]))
+        else:
+            msg = ("keyword argument ``intra_bin_selection_method`` "
+                "can only take the following values:\n{0}")
+            available_methods = ('random', 'hod_matching')
+            raise ValueError(msg.format(available_methods))
+
+    return selections
+
+
+def _batch_cells_by_size(cell_sizes, num_batches):
+    """ Partition cells into batches of roughly equal total size.
+
+    Cells are ordered by decreasing size, so that the largest cells appear
+    in the first batches; a cell larger than the average batch size
+    occupies a batch of its own.
 
-    bin_shapes = tuple(len(arr)-1 for arr in bins)
-    num_cells_total = np.product(bin_shapes)
+    Parameters
+    ----------
+    cell_sizes : ndarray
+        Numpy integer array of shape (num_cells, )
 
-    cell_bins = np.arange(-0.5, num_cells_total+0.5, 1)
-    source_bin_counts = np.histogram(source_halo_bin_numbers, cell_bins)[0]
-    _check_source_binning(source_bin_counts, nhalo_min)
+    num_batches : int
+        Approximate number of batches
 
-    result = np.zeros_like(target_halo_bin_numbers).astype('i8')
-    matching_target_halo_ids = np.zeros_like(target_halo_bin_numbers).astype('i8')
+    Returns
+    -------
+    batches : list
+        List of Numpy integer arrays storing the indices of the cells in each batch
+    """
+    order = np.argsort(cell_sizes, kind='mergesort')[::-1]
+    sizes = np.asarray(cell_sizes)[order]
+    batch_size = max(1, np.sum(sizes) / float(num_batches))
 
-    for target_bin in range(num_cells_total):
-        target_bin_mask = target_halo_bin_numbers == target_bin
-        num_target_halos_in_bin = np.count_nonzero(target_bin_mask)
+    #  Each cell is assigned to a batch according to the total size of the larger cells
+    cumulative_size = np.cumsum(sizes) - sizes
+    batch_numbers = (cumulative_size // batch_size).astype('i8')
+    boundaries = np.flatnonzero(np.diff(batch_numbers)) + 1
+    return [batch for batch in np.split(order, boundaries) if len(batch) > 0]
 
-        if num_target_halos_in_bin > 0:
-            source_bin = get_source_bin_from_target_bin(
-                    source_bin_counts, target_bin, nhalo_min, bin_shapes)
-            source_bin_mask = source_halo_bin_numbers == source_bin
-            source_bin_indices = selection_indices[source_bin_mask]
 
-            if intra_bin_selection_method == 'random':
-                result[target_bin_mask] = randomly_select_source_halos_within_bin(
-                            source_bin_indices, num_target_halos_in_bin, seed=seed)
-                matching_target_halo_ids[target_bin_mask] = target_halo_ids[target_bin_mask]
-            elif intra_bin_selection_method == 'hod_matching':
-                try:
-                    source_bin_richness = kwargs['source_richness'][source_bin_mask]
-                    data_bin_richness = np.atleast_1d(kwargs['data_richness'][target_bin])
-                    assert data_bin_richness.shape[0] > 10
-                    result[target_bin_mask] = hod_matching_halo_bin_selection(
-                        source_bin_indices, source_bin_richness,
-                        data_bin_richness, num_target_halos_in_bin)
-                except KeyError:
-                    required_kwargs = ('source_richness', 'data_richness')
-                    msg = ("When selecting the `hod_matching` option, "
-                        "you must also pass the following keyword arguments:\n{0}")
-                    raise KeyError(msg.format(required_kwargs))
-                except (IndexError, TypeError):
-                    msg = ("``source_richness`` keyword argument must store "
-                        "an integer ndarray of shape (num_source_halos, ) = ({0}, )\n"
-                        "``data_richness`` keyword argument must store "
-                        "a list of num_target_halo_bins={1} ndarrays of richness-matching data")
-                    raise ValueError(msg.format(num_source_halos, num_cells_total))
-                except AssertionError:
-                    msg = ("For target_bin = {0}, there are only {1} elements of ``data_richness``")
-                    raise ValueError(msg.format(target_bin, data_bin_richness.shape[0]))
-            else:
-                msg = ("keyword argument ``intra_bin_selection_method`` "
-                    "can only take the following values:\n{0}")
-                available_methods = ('random', 'hod_matching')
-                raise ValueError(msg.format(available_methods))
+def _cell_pools(bin_numbers, num_cells_total):
+    """ Group objects by the cell they occupy using a single stable sort.
 
-    return result, matching_target_halo_ids
+    Parameters
+    ----------
+    bin_numbers : ndarray
+        Numpy integer array of shape (num_objects, ) storing the bin number
+        of every object. Objects with values outside the interval
+        [0, num_cells_total) are not assigned to any cell.
+
+    num_cells_total : int
+        Total number of cells in the binning scheme
+
+    Returns
+    -------
+    idx_sorted : ndarray
+        Numpy integer array of shape (num_objects, ) storing the indices that
+        sort ``bin_numbers``. Objects in a common cell appear contiguously,
+        in order of increasing index.
+
+    cell_offsets : ndarray
+        Numpy integer array of shape (num_cells_total+1, ) storing CSR-style offsets,
+        so that the indices of the objects in cell ``i`` are given by
+        ``idx_sorted[cell_offsets[i]:cell_offsets[i+1]]``
+    """
+    bin_numbers = np.atleast_1d(bin_numbers)
+    idx_sorted = np.argsort(bin_numbers, kind='mergesort')
+
+    #  Objects with bin numbers outside [0, num_cells_total) fall outside every cell
+    cell_edges = np.arange(num_cells_total+1)
+    cell_offsets = np.searchsorted(bin_numbers[idx_sorted], cell_edges).astype('i8')
+    return idx_sorted, cell_offsets
+
+
+class _SourceHaloPools(object):
+    """ Source halos grouped by cell, together with the correspondence between
+    each cell and its nearest well-sampled cell.
+
+    The source-side structure depends only on the source halo catalog,
+    so that it can be computed once and reused for any number of target catalogs.
+
+    Parameters
+    ----------
+    source_halo_bin_numbers : ndarray
+        Numpy integer array of shape (num_source_halos, ) storing the bin number
+        of every halo in the source catalog
+
+    nhalo_min : int
+        Minimum permissible number of halos in source catalog for a cell to be
+        considered well-sampled
+
+    bin_shapes : tuple
+        Sequence storing the number of bins of each binned property
+
+    sparse_cells : bool, optional
+        If True, only cells occupied by at least one source halo are materialized.
+        See `source_halo_index_selection`. Default is False.
+    """
+
+    def __init__(self, source_halo_bin_numbers, nhalo_min, bin_shapes, sparse_cells=False):
+        self.nhalo_min = nhalo_min
+        self.bin_shapes = tuple(bin_shapes)
+        self.num_cells_total = np.prod(self.bin_shapes)
+        self.num_source_halos = len(source_halo_bin_numbers)
+        self.sparse_cells = sparse_cells
+
+        if sparse_cells:
+            #  Each occupied cell is relabeled by its position in the sorted array of unique bin numbers
+            self.occupied_bins, source_labels, self.cell_counts = np.unique(
+                source_halo_bin_numbers, return_inverse=True, return_counts=True)
+            _check_source_binning(self.cell_counts, nhalo_min)
+            self.idx_sorted, self.cell_offsets = _cell_pools(source_labels, len(self.occupied_bins))
+        else:
+            self.idx_sorted, self.cell_offsets = _cell_pools(source_halo_bin_numbers, self.num_cells_total)
+            self.cell_counts = np.diff(self.cell_offsets)
+            _check_source_binning(self.cell_counts, nhalo_min)
+            self.source_bins = get_source_bins_from_target_bins(self.cell_counts, nhalo_min, self.bin_shapes)
+
+    def cell_indices(self, source_cell):
+        """ Indices of the source halos in the cell labeled ``source_cell``,
+        in order of increasing index.
+        """
+        return self.idx_sorted[self.cell_offsets[source_cell]:self.cell_offsets[source_cell+1]]
+
+    def group_targets(self, target_halo_bin_numbers):
+        """ Group the target halos by cell and match each cell to a well-sampled source cell.
+
+        Returns
+        -------
+        target_cells : ndarray
+            Numpy integer array of shape (num_target_cells, ) storing the bin number
+            of each target cell
+
+        source_cells : ndarray
+            Numpy integer array of shape (num_target_cells, ) storing the label
+            of the well-sampled source cell matched to each target cell,
+            for use with the `cell_indices` method
+
+        target_idx_sorted, target_cell_offsets : ndarrays
+            Output of `_cell_pools` for the target halos
+        """
+        if self.sparse_cells:
+            #  As in dense mode, target halos with bin numbers outside [0, num_cells_total)
+            #  are given a label beyond every cell, so that they are not assigned to any cell
+            target_halo_bin_numbers = np.atleast_1d(target_halo_bin_numbers)
+            in_range = (target_halo_bin_numbers >= 0) & (target_halo_bin_numbers < self.num_cells_total)
+            target_cells, binned_target_labels = np.unique(
+                target_halo_bin_numbers[in_range], return_inverse=True)
+            target_labels = np.full(len(target_halo_bin_numbers), len(target_cells), dtype='i8')
+            target_labels[in_range] = binned_target_labels
+            matching_source_bins = get_sparse_source_bins_from_target_bins(self.occupied_bins,
+                    self.cell_counts, target_cells, self.nhalo_min, self.bin_shapes)
+            source_cells = np.searchsorted(self.occupied_bins, matching_source_bins)
+            target_idx_sorted, target_cell_offsets = _cell_pools(target_labels, len(target_cells))
+        else:
+            target_cells = np.arange(self.num_cells_total)
+            source_cells = self.source_bins
+            target_idx_sorted, target_cell_offsets = _cell_pools(
+                target_halo_bin_numbers, self.num_cells_total)
+        return target_cells, source_cells, target_idx_sorted, target_cell_offsets
+
+
+def get_sparse_source_bins_from_target_bins(source_bin_numbers, source_bin_counts,
+            target_bin_numbers, nhalo_min, bin_shapes, chunk_size=int(1e6)):
+    """ For every cell in ``target_bin_numbers``, find the nearest
+    cell in ``source_bin_numbers`` with at least ``nhalo_min`` source halos.
+
+    This is the sparse counterpart of `get_source_bins_from_target_bins`:
+    rather than searching over the full grid of cells, the nearest well-sampled
+    cell is found with a k-d tree built from the occupied source cells, so that
+    the cost scales with the number of occupied cells rather than with the
+    total number of cells. Distances and tie-breaking are identical to
+    `get_source_bin_from_target_bin`.
+
+    Parameters
+    ----------
+    source_bin_numbers : ndarray
+        Numpy integer array of shape (num_occupied_source_cells, ) storing
+        the unique bin numbers of the source halos in increasing order
+
+    source_bin_counts : ndarray
+        Numpy integer array of shape (num_occupied_source_cells, ) storing
+        the number of source halos in each occupied cell
+
+    target_bin_numbers : ndarray
+        Numpy integer array of shape (num_cells, ) storing the bin numbers
+        for which a matching well-sampled source cell is required
+
+    nhalo_min : int
+        Minimum permissible number of halos in source catalog for a cell to be
+        considered well-sampled
 
+    bin_shapes : tuple
+        Sequence storing the number of bins of each binned property
 
-def randomly_select_source_halos_within_bin(source_bin_indices, num_target_halos_in_bin, seed):
+    chunk_size : int, optional
+        Maximum number of cells queried against the tree at once.
+        Default is one million.
+
+    Returns
+    -------
+    source_bins : ndarray
+        Numpy integer array of shape (num_cells, ) storing the bin number of
+        the well-sampled source cell matched to each element of ``target_bin_numbers``
+    """
+    bin_shapes = tuple(int(n) for n in bin_shapes)
+    target_bin_numbers = np.atleast_1d(target_bin_numbers)
+    well_sampled_bins = np.asarray(source_bin_numbers)[np.asarray(source_bin_counts) >= nhalo_min]
+    num_well_sampled = len(well_sampled_bins)
+    if num_well_sampled == 0:
+        msg = "There are no cells in the source catalog with more halos than nhalo_min={0}"
+        raise ValueError(msg.format(nhalo_min))
+
+    idx = np.minimum(np.searchsorted(well_sampled_bins, target_bin_numbers), num_well_sampled-1)
+    is_well_sampled = well_sampled_bins[idx] == target_bin_numbers
+    source_bins = np.where(is_well_sampled, target_bin_numbers, -1)
+
+    poorly_sampled = np.flatnonzero(~is_well_sampled)
+    if len(poorly_sampled) == 0:
+        return source_bins
+
+    from scipy.spatial import cKDTree
+    well_sampled_coords = np.array(np.unravel_index(well_sampled_bins, bin_shapes)).T
+    tree = cKDTree(well_sampled_coords)
+
+    #  Query several neighbors at once so that ties in taxicab distance can be broken
+    #  in favor of the smallest bin number, as in get_source_bin_from_target_bin
+    k = min(2*len(bin_shapes)+2, num_well_sampled)
+    for ifirst in range(0, len(poorly_sampled), chunk_size):
+        indices = poorly_sampled[ifirst:ifirst+chunk_size]
+        coords = np.array(np.unravel_index(target_bin_numbers[indices], bin_shapes)).T
+        dist, neighbors = tree.query(coords, k=k, p=1)
+        dist, neighbors = dist.reshape((-1, k)), neighbors.reshape((-1, k))
+
+        is_nearest = dist == dist[:, :1]
+        candidates = np.where(is_nearest, well_sampled_bins[neighbors], np.iinfo('i8').max)
+        source_bins[indices] = candidates.min(axis=1)
+
+        #  When all k neighbors are equidistant there may be further ties beyond the k-th
+        if k < num_well_sampled:
+            for i in np.flatnonzero(is_nearest[:, -1]):
+                tied = tree.query_ball_point(coords[i], dist[i, 0], p=1)
+                source_bins[indices[i]] = well_sampled_bins[tied].min()
+
+    return source_bins
+
+
+def randomly_select_source_halos_within_bin(source_bin_indices, num_target_halos_in_bin,
+            seed, bin_number=0, num_previous_draws=0):
+    """ Randomly select ``num_target_halos_in_bin`` elements of ``source_bin_indices``
+    with replacement, using the random stream of cell ``bin_number``.
+
+    Each cell draws from its own counter-based random stream keyed by
+    (``seed``, ``bin_number``), so that draws are independent between cells
+    and reproducible regardless of the order in which cells are processed.
+
+    Parameters
+    ----------
+    source_bin_indices : ndarray
+        Numpy integer array of shape (num_source_halos_in_bin, )
+
+    num_target_halos_in_bin : int
+        Number of selections
+
+    seed : int
+        Random number seed
+
+    bin_number : int, optional
+        Bin number of the cell. Default is 0.
+
+    num_previous_draws : int, optional
+        Number of values of the stream already consumed by previous selections
+        in the same cell, e.g., by earlier chunks of the target catalog.
+        Default is 0.
+
+    Returns
+    -------
+    selection : ndarray
+        Numpy integer array of shape (num_target_halos_in_bin, )
     """
+    rng = _reused_cell_random_generator(seed, bin_number, num_previous_draws)
+    #  Each uniform random draws exactly one 64-bit value from the stream,
+    #  so that the k-th selection in a cell always uses the k-th value of its stream
+    uran = rng.random(num_target_halos_in_bin)
+    idx = (uran*len(source_bin_indices)).astype('i8')
+    return source_bin_indices[idx]
+
+
+def cell_random_generator(seed, bin_number, num_previous_draws=0):
+    """ Random number generator for the cell ``bin_number``.
+
+    The generator uses the counter-based Philox bit generator keyed by
+    (``seed``, ``bin_number``), so that each cell has its own independent stream
+    that can be recreated in isolation, e.g., by a different worker.
+
+    Constructing a Philox bit generator seeds it from operating system entropy
+    before the key is set, which costs about 15 microseconds. The selection functions
+    of this module instead reset a single generator per thread to the stream
+    of each cell, which costs about 4 microseconds per cell.
+
+    Parameters
+    ----------
+    seed : int
+        Non-negative random number seed. If None, fresh entropy is drawn
+        from the operating system.
+
+    bin_number : int
+        Non-negative bin number of the cell
+
+    num_previous_draws : int, optional
+        Number of 64-bit values of the stream to skip, so that the generator
+        resumes the stream where a previous generator left off. Default is 0.
+
+    Returns
+    -------
+    rng : `numpy.random.Generator`
+    """
+    return _start_cell_stream(np.random.Generator(np.random.Philox()),
+            seed, bin_number, num_previous_draws)
+
+
+def _reused_cell_random_generator(seed, bin_number, num_previous_draws=0):
+    """ Same stream as `cell_random_generator`, drawn from a generator reused by
+    every call in the same thread, so the result must be consumed before the next call.
+    """
+    try:
+        rng = _thread_local.rng
+    except AttributeError:
+        rng = _thread_local.rng = np.random.Generator(np.random.Philox())
+    return _start_cell_stream(rng, seed, bin_number, num_previous_draws)
+
+
+def _start_cell_stream(rng, seed, bin_number, num_previous_draws):
+    """ Reset the Philox bit generator of ``rng`` to the stream of cell ``bin_number``.
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy % 2**64
+
+    #  Each increment of the Philox counter produces four 64-bit values,
+    #  so skip whole blocks by setting the counter and draw the remainder
+    num_blocks, num_remaining = divmod(int(num_previous_draws), 4)
+    rng.bit_generator.state = {'bit_generator': 'Philox',
+        'state': {'counter': np.array((num_blocks, 0, 0, 0), dtype='u8'),
+            'key': np.array((seed, bin_number), dtype='u8')},
+        'buffer': np.zeros(4, dtype='u8'), 'buffer_pos': 4, 'has_uint32': 0, 'uinteger': 0}
+    if num_remaining > 0:
+        rng.bit_generator.random_raw(num_remaining)
+    return rng
+
+
+def halo_id_random_uniforms(seed, halo_ids):
+    """ Uniform random numbers in [0, 1) that are a pure function of (``seed``, ``halo_id``).
+
+    Each halo ID is hashed with the SplitMix64 finalizer after being offset by
+    a hash of the seed, and the 53 most significant bits of the hash are mapped
+    to a double-precision uniform, so that the random number of a halo does not
+    depend on any other halo.
+
+    Parameters
+    ----------
+    seed : int
+        Non-negative random number seed. If None, fresh entropy is drawn
+        from the operating system.
+
+    halo_ids : ndarray
+        Numpy integer array of shape (num_halos, )
+
+    Returns
+    -------
+    uran : ndarray
+        Numpy float array of shape (num_halos, )
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy % 2**64
+    seed_hash = _splitmix64(np.array((seed, ), dtype='u8'))
+    hashed_ids = _splitmix64(np.atleast_1d(halo_ids).astype('u8') + seed_hash)
+    return (hashed_ids >> np.uint64(11)) * 2.0**-53
+
+
+def _splitmix64(x):
+    """ SplitMix64 finalizer of the Numpy uint64 array ``x``, relying on
+    the wraparound of unsigned integer arithmetic.
     """
-    with NumpyRNGContext(seed):
-        return np.random.choice(
-            source_bin_indices, num_target_halos_in_bin, replace=True)
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
 
 
 def hod_matching_halo_bin_selection(source_bin_indices, source_bin_richness,
-            data_bin_richness, num_target_halos_in_bin):
+            data_bin_richness, num_target_halos_in_bin, seed=None):
     """
     """
+    from halotools.utils import distribution_matching_indices
     max_richness = max(np.max(source_bin_richness), np.max(data_bin_richness))
     richness_bins = np.arange(0, max_richness+1) - 0.01
     return source_bin_indices[distribution_matching_indices(source_bin_richness, data_bin_richness,
-            num_target_halos_in_bin, richness_bins)]
+            num_target_halos_in_bin, richness_bins, seed=seed)]
@@ -0,0 +1,126 @@
+"""
+Measurement of the peak memory of each stage of the galaxy selection pipeline,
+used by the memory regression tests and the benchmarks.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict
+import tracemalloc
+import numpy as np
+
+from .fake_catalogs import fake_source_galaxy_catalog, fake_target_halo_catalog
+from ..host_halo_binning import halo_bin_indices
+from ..source_halo_selection import source_halo_index_selection
+from ..source_galaxy_selection import SourceSampler, source_galaxy_selection_indices
+from ..selection_kernels import galaxy_selection_indices
+from ..matched_halo_selection_1d import matched_value_selection_indices
+
+
+__all__ = ('peak_memory', 'pipeline_peak_memory', 'bytes_per_object_budgets')
+
+fixed_seed = 43
+
+#  tracemalloc.reset_peak requires Python 3.9. On earlier versions the peak is reset
+#  by starting tracemalloc, which is only possible if it is not already tracing.
+HAS_RESET_PEAK = hasattr(tracemalloc, 'reset_peak')
+
+#  Upper bounds on the peak number of bytes allocated by each stage, per object
+#  of the catalog setting its scale, e.g., per target galaxy for SourceSampler.sample.
+#  The budgets leave roughly 30% of headroom above the measured values.
+bytes_per_object_budgets = OrderedDict((
+    ('halo_bin_indices', 32),
+    ('SourceSampler', 64),
+    ('source_halo_index_selection', 48),
+    ('galaxy_selection_indices', 18),
+    ('SourceSampler.sample', 80),
+    ('SourceSampler.sample_compact', 104),
+    ('source_galaxy_selection_indices', 100),
+    ('matched_value_selection_indices', 44),
+))
+
+
+def peak_memory(func, *args, **kwargs):
+    """ Call ``func(*args, **kwargs)`` and measure the peak number of bytes
+    allocated during the call, including its return value, with `tracemalloc`,
+    which traces the memory allocated by Numpy arrays.
+
+    Before Python 3.9, tracemalloc must not be tracing when ``peak_memory`` is called.
+
+    Returns
+    -------
+    result : object
+        Return value of ``func``
+
+    peak_bytes : int
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if was_tracing and not HAS_RESET_PEAK:
+        msg = ("Measuring the peak memory while tracemalloc is already tracing\n"
+            "requires tracemalloc.reset_peak, available in Python 3.9 or later")
+        raise RuntimeError(msg)
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        if HAS_RESET_PEAK:
+            tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = func(*args, **kwargs)
+        peak_bytes = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    return result, peak_bytes
+
+
+def pipeline_peak_memory(num_objects, seed=fixed_seed, num_bins=30, nhalo_min=10):
+    """ Peak memory of each stage of the pipeline populating a fake target halo catalog
+    of ``num_objects`` halos with a fake source galaxy catalog of ``num_objects`` galaxies.
+
+    Returns
+    -------
+    stages : OrderedDict
+        Dictionary mapping the name of each stage to a tuple
+        (peak_bytes, num_objects, bytes_per_object), where ``num_objects`` is the
+        number of target halos, source galaxies, target galaxies or values
+        setting the scale of the stage
+    """
+    source_galaxies = fake_source_galaxy_catalog(num_objects, seed=seed)
+    source_galaxies_host_halo_id = source_galaxies['host_halo_id']
+    source_halo_ids, idx = np.unique(source_galaxies_host_halo_id, return_index=True)
+    mass_bins = np.logspace(10, 15.5, num_bins+1)
+    source_bin_numbers = halo_bin_indices(mass=(source_galaxies['host_halo_mass'][idx], mass_bins))
+    target_halos = fake_target_halo_catalog(num_objects, seed=seed)
+    target_halo_ids = target_halos['halo_id']
+
+    stages = OrderedDict()
+
+    def _record(name, scale, func, *args, **kwargs):
+        result, peak_bytes = peak_memory(func, *args, **kwargs)
+        stages[name] = (peak_bytes, scale, peak_bytes/float(max(scale, 1)))
+        return result
+
+    target_bin_numbers = _record('halo_bin_indices', num_objects,
+        halo_bin_indices, mass=(target_halos['mass'], mass_bins))
+    sampler = _record('SourceSampler', num_objects, SourceSampler,
+        source_galaxies_host_halo_id, source_bin_numbers, source_halo_ids, nhalo_min, mass_bins)
+    source_halo_indices, __ = _record('source_halo_index_selection', num_objects,
+        source_halo_index_selection, source_bin_numbers, target_bin_numbers,
+        target_halo_ids, nhalo_min, mass_bins)
+
+    richness = sampler.source_halos_richness[source_halo_indices]
+    first_indices = sampler._source_halo_sorted_source_galaxies_indices[source_halo_indices]
+    num_target_gals = int(np.sum(richness))
+    _record('galaxy_selection_indices', num_target_gals,
+        galaxy_selection_indices, first_indices, richness, num_target_gals)
+
+    _record('SourceSampler.sample', num_target_gals,
+        sampler.sample, target_bin_numbers, target_halo_ids)
+    _record('SourceSampler.sample_compact', num_target_gals,
+        sampler.sample, target_bin_numbers, target_halo_ids, compact=True)
+    _record('source_galaxy_selection_indices', num_target_gals,
+        source_galaxy_selection_indices, source_galaxies_host_halo_id, source_bin_numbers,
+        source_halo_ids, target_bin_numbers, target_halo_ids, nhalo_min, mass_bins)
+
+    _record('matched_value_selection_indices', num_objects,
+        matched_value_selection_indices, target_halos['mass'], source_galaxies['host_halo_mass'])
+    return stages
@@ -0,0 +1,104 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+import pytest
+from astropy.utils.misc import NumpyRNGContext
+from ..compact_selection import CompactGalaxySelection
+from ..source_galaxy_selection import SourceSampler, source_galaxy_selection_indices
+from ..host_halo_binning import halo_bin_indices
+
+
+fixed_seed = 43
+
+
+def _source_sampler_and_target_halos():
+    log_mhost_bins = np.arange(10.5, 16, 0.5)
+    log_mhost_mids = 0.5*(log_mhost_bins[:-1] + log_mhost_bins[1:])
+    source_halo_log_mhost = np.tile(log_mhost_mids, 20)
+    num_source_halos = len(source_halo_log_mhost)
+    source_halo_id = np.arange(num_source_halos).astype(int)
+    source_halo_bin_number = halo_bin_indices(log_mhost=(source_halo_log_mhost, log_mhost_bins))
+
+    source_halo_richness = np.tile([0, 1, 3, 7], num_source_halos)[:num_source_halos]
+    source_galaxy_host_halo_id = np.repeat(source_halo_id, source_halo_richness)[::-1]
+
+    sampler = SourceSampler(source_galaxy_host_halo_id,
+            source_halo_bin_number, source_halo_id, 5, log_mhost_bins)
+
+    with NumpyRNGContext(fixed_seed):
+        target_halo_bin_number = np.random.choice(source_halo_bin_number, 500)
+    target_halo_ids = np.arange(len(target_halo_bin_number)).astype('i8')
+    return sampler, target_halo_bin_number, target_halo_ids, source_galaxy_host_halo_id
+
+
+def test_compact_selection_expands_to_sample_result():
+    sampler, target_halo_bin_number, target_halo_ids, __ = _source_sampler_and_target_halos()
+    correct_result = sampler.sample(target_halo_bin_number, target_halo_ids)
+    selection = sampler.sample(target_halo_bin_number, target_halo_ids, compact=True)
+    assert selection.num_target_gals == len(correct_result[0])
+    assert len(selection.richness) < len(target_halo_ids)
+
+    for arr, correct_arr in zip(selection.expand(), correct_result):
+        assert np.all(arr == correct_arr)
+
+    for chunk_size in (1, 5, 64, 10**6):
+        for start, chunk_result in selection.iter_chunks(chunk_size):
+            for arr, correct_arr in zip(chunk_result, correct_result):
+                assert np.all(arr == correct_arr[start:start+chunk_size])
+
+    start, stop = 17, 123
+    assert np.all(selection.selection_indices(start, stop) == correct_result[0][start:stop])
+    assert len(selection.selection_indices(stop, stop)) == 0
+
+
+def test_compact_selection_gather():
+    sampler, target_halo_bin_number, target_halo_ids, source_galaxy_host_halo_id = (
+        _source_sampler_and_target_halos())
+    selection_indices = sampler.sample(target_halo_bin_number, target_halo_ids)[0]
+    selection = sampler.sample(target_halo_bin_number, target_halo_ids, compact=True)
+
+    source_galaxy_pos = np.random.RandomState(fixed_seed).uniform(
+        0, 250, (len(source_galaxy_host_halo_id), 3))
+    target_galaxy_pos = selection.gather(source_galaxy_pos, chunk_size=33)
+    assert np.all(target_galaxy_pos == source_galaxy_pos[selection_indices])
+
+    out = np.zeros(selection.num_target_gals, dtype='i8')
+    result = selection.gather(source_galaxy_host_halo_id, out=out)
+    assert result is out
+    assert np.all(out == source_galaxy_host_halo_id[selection_indices])
+
+    with pytest.raises(ValueError) as err:
+        selection.gather(source_galaxy_host_halo_id, out=out[1:])
+    substr = "Input ``out`` has length"
+    assert substr in err.value.args[0]
+
+
+def test_compact_selection_empty_halos():
+    selection = CompactGalaxySelection(np.array((5, 0, 2)), np.array((2, 0, 3)),
+        np.array((100, 101, 102)), np.array((7, 3, 5)))
+    indices, target_galaxy_target_halo_ids, target_galaxy_source_halo_ids = selection.expand()
+    assert np.all(indices == (5, 6, 2, 3, 4))
+    assert np.all(target_galaxy_target_halo_ids == (100, 100, 102, 102, 102))
+    assert np.all(target_galaxy_source_halo_ids == (7, 7, 5, 5, 5))
+
+    selection = CompactGalaxySelection(np.zeros(3), np.zeros(3), np.arange(3), np.arange(3))
+    assert selection.num_target_gals == 0
+    assert all(len(arr) == 0 for arr in selection.expand())
+    assert list(selection.iter_chunks()) == []
+
+
+def test_source_galaxy_selection_indices_compact():
+    source_halo_bin_number = np.repeat(np.arange(4), 10)
+    source_halo_id = np.arange(40)[::-1]
+    source_galaxy_host_halo_id = np.repeat(source_halo_id, np.tile([2, 0, 1, 4], 10))
+    target_halo_bin_number = np.repeat(np.arange(4), 25)
+    target_halo_ids = np.arange(100)
+    args = (source_galaxy_host_halo_id, source_halo_bin_number, source_halo_id,
+        target_halo_bin_number, target_halo_ids, 5, np.arange(5))
+
+    correct_result = source_galaxy_selection_indices(*args)
+    selection = source_galaxy_selection_indices(*args, compact=True)
+    assert isinstance(selection, CompactGalaxySelection)
+    for arr, correct_arr in zip(selection.expand(), correct_result):
+        assert np.all(arr == correct_arr)
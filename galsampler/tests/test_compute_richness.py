@@ -1,7 +1,16 @@
 """
 """
 import numpy as np
-from ..utils import compute_richness
+import pytest
+from astropy.utils.misc import NumpyRNGContext
+from ..utils import compute_richness, compute_richness_and_first_index, is_sorted, take
+from ..source_galaxy_selection import _galaxy_table_indices
+
+try:
+    import h5py
+    HAS_H5PY = True
+except ImportError:
+    HAS_H5PY = False
 
 
 __all__ = ('test_compute_richness1', )
@@ -47,6 +56,100 @@ def test_compute_richness4():
                 source_halo_id, source_galaxy_host_halo_id)
 
 
-
-
-
+def test_compute_richness_and_first_index1():
+    unique_halo_ids = [5, 2, 100]
+    sorted_halo_id_of_galaxies = [2, 2, 3, 3, 100, 100, 100, 100]
+    richness, first_index = compute_richness_and_first_index(
+        unique_halo_ids, sorted_halo_id_of_galaxies)
+    assert np.all(richness == [0, 2, 4])
+    assert np.all(first_index == [-1, 0, 4])
+
+
+def test_compute_richness_and_first_index2():
+    with NumpyRNGContext(43):
+        unique_halo_ids = np.random.choice(np.arange(500), 200, replace=False)
+        halo_id_of_galaxies = np.sort(np.random.randint(0, 600, 1000))
+    richness, first_index = compute_richness_and_first_index(unique_halo_ids, halo_id_of_galaxies)
+    assert np.all(richness == compute_richness(unique_halo_ids, halo_id_of_galaxies))
+    assert np.all(first_index == _galaxy_table_indices(unique_halo_ids, halo_id_of_galaxies))
+
+
+@pytest.mark.parametrize('dtypes', (('u8', 'i8'), ('i8', 'u8')))
+def test_compute_richness_and_first_index_mixed_signedness(dtypes):
+    """ Host halo IDs differing by less than the float64 spacing of 2**60 are told apart
+    when the halo IDs and the galaxy host halo IDs differ in signedness.
+    """
+    halo_id_dtype, galaxy_dtype = dtypes
+    unique_halo_ids = np.array((2**60+3, 2**60+1, 5), dtype=halo_id_dtype)
+    sorted_halo_id_of_galaxies = np.array((5, 2**60+1, 2**60+2, 2**60+3, 2**60+3), dtype=galaxy_dtype)
+    richness, first_index = compute_richness_and_first_index(
+        unique_halo_ids, sorted_halo_id_of_galaxies, block_size=2)
+    assert np.all(richness == [2, 1, 1])
+    assert np.all(first_index == [3, 1, 0])
+
+
+def test_compute_richness_and_first_index_no_galaxies():
+    richness, first_index = compute_richness_and_first_index([4, 1], [])
+    assert np.all(richness == [0, 0])
+    assert np.all(first_index == [-1, -1])
+
+
+def test_is_sorted():
+    assert is_sorted(np.arange(100), chunk_size=7)
+    assert is_sorted(np.repeat(np.arange(10), 10), chunk_size=10)
+    assert is_sorted([])
+    x = np.arange(100)
+    x[50], x[49] = x[49], x[50]
+    assert not is_sorted(x, chunk_size=7)
+    assert not is_sorted(x[48:51], chunk_size=1)
+
+
+def test_compute_richness_and_first_index_memmap(tmpdir):
+    with NumpyRNGContext(43):
+        unique_halo_ids = np.random.choice(np.arange(500), 200, replace=False)
+        halo_id_of_galaxies = np.sort(np.random.randint(0, 600, 1000))
+    fname = str(tmpdir.join('halo_id_of_galaxies.npy'))
+    np.save(fname, halo_id_of_galaxies)
+    mmap_halo_id_of_galaxies = np.load(fname, mmap_mode='r')
+
+    correct_result = compute_richness_and_first_index(unique_halo_ids, halo_id_of_galaxies)
+    for block_size in (1, 2, 7, 1000, 10**7):
+        result = compute_richness_and_first_index(unique_halo_ids, mmap_halo_id_of_galaxies,
+            block_size=block_size)
+        for arr, correct_arr in zip(result, correct_result):
+            assert np.all(arr == correct_arr)
+        assert is_sorted(mmap_halo_id_of_galaxies, chunk_size=block_size)
+
+
+def test_take_memmap(tmpdir):
+    with NumpyRNGContext(43):
+        arr = np.random.uniform(0, 1, (1000, 3))
+        indices = np.random.randint(0, 1000, 5000)
+    fname = str(tmpdir.join('arr.npy'))
+    np.save(fname, arr)
+    mmap_arr = np.load(fname, mmap_mode='r')
+
+    for block_size in (1, 7, 1000, 10**7):
+        result = take(mmap_arr, indices, block_size=block_size)
+        assert type(result) is np.ndarray
+        assert np.all(result == arr[indices])
+    assert take(mmap_arr, indices[:0]).shape == (0, 3)
+
+
+@pytest.mark.skipif(not HAS_H5PY, reason="h5py is not installed")
+def test_hdf5_datasets(tmpdir):
+    with NumpyRNGContext(43):
+        unique_halo_ids = np.random.choice(np.arange(500), 200, replace=False)
+        halo_id_of_galaxies = np.sort(np.random.randint(0, 600, 1000))
+        indices = np.random.randint(0, 1000, 5000)
+    fname = str(tmpdir.join('galaxies.hdf5'))
+    with h5py.File(fname, 'w') as f:
+        f['halo_id'] = halo_id_of_galaxies
+
+    correct_result = compute_richness_and_first_index(unique_halo_ids, halo_id_of_galaxies)
+    with h5py.File(fname, 'r') as f:
+        assert is_sorted(f['halo_id'], chunk_size=7)
+        result = compute_richness_and_first_index(unique_halo_ids, f['halo_id'], block_size=7)
+        assert np.all(take(f['halo_id'], indices, block_size=100) == halo_id_of_galaxies[indices])
+    for arr, correct_arr in zip(result, correct_result):
+        assert np.all(arr == correct_arr)
@@ -0,0 +1,123 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+import pytest
+from halotools.utils import crossmatch
+from ..galaxy_catalog import build_target_galaxy_catalog
+from ..source_galaxy_selection import SourceSampler
+from ..host_halo_binning import halo_bin_indices
+
+
+fixed_seed = 43
+
+
+def _selection_and_catalogs():
+    rng = np.random.RandomState(fixed_seed)
+    log_mhost_bins = np.arange(10.5, 16, 0.5)
+    num_source_halos = 200
+    source_halo_log_mhost = rng.uniform(10.5, 15.5, num_source_halos)
+    source_halo_id = rng.permutation(np.arange(1000, 1000+num_source_halos))
+    source_halo_bin_number = halo_bin_indices(log_mhost=(source_halo_log_mhost, log_mhost_bins))
+    source_galaxy_host_halo_id = np.repeat(source_halo_id, rng.randint(0, 4, num_source_halos))
+
+    num_source_gals = len(source_galaxy_host_halo_id)
+    source_galaxies = np.zeros(num_source_gals,
+        dtype=[('host_halo_id', 'i8'), ('luminosity', 'f4'), ('pos', 'f4', (3, ))])
+    source_galaxies['host_halo_id'] = source_galaxy_host_halo_id
+    source_galaxies['luminosity'] = rng.uniform(0, 1, num_source_gals)
+    source_galaxies['pos'] = rng.uniform(0, 250, (num_source_gals, 3))
+
+    num_target_halos = 1000
+    target_halos = dict(halo_id=rng.permutation(num_target_halos),
+        halo_mvir=10**rng.uniform(10.5, 15.5, num_target_halos))
+    target_halo_bin_number = halo_bin_indices(
+        log_mhost=(np.log10(target_halos['halo_mvir']), log_mhost_bins))
+
+    sampler = SourceSampler(source_galaxy_host_halo_id,
+            source_halo_bin_number, source_halo_id, 5, log_mhost_bins)
+    selection = sampler.sample(target_halo_bin_number, target_halos['halo_id'], compact=True)
+    return selection, source_galaxies, target_halos
+
+
+def test_build_target_galaxy_catalog_agrees_with_crossmatch():
+    selection, source_galaxies, target_halos = _selection_and_catalogs()
+    selection_indices, target_galaxy_target_halo_ids, target_galaxy_source_halo_ids = (
+        selection.expand())
+
+    for chunk_size in (7, 10**6):
+        target_galaxies = build_target_galaxy_catalog(selection, source_galaxies, target_halos,
+            source_galaxy_keys=('luminosity', 'pos'), target_halo_keys=('halo_mvir', ),
+            chunk_size=chunk_size)
+        assert list(target_galaxies.keys()) == [
+            'target_halo_id', 'source_halo_id', 'luminosity', 'pos', 'halo_mvir']
+        assert np.all(target_galaxies['target_halo_id'] == target_galaxy_target_halo_ids)
+        assert np.all(target_galaxies['source_halo_id'] == target_galaxy_source_halo_ids)
+        for key in ('luminosity', 'pos'):
+            assert np.all(target_galaxies[key] == source_galaxies[key][selection_indices])
+        assert target_galaxies['pos'].dtype == np.float32
+
+        idxA, idxB = crossmatch(target_galaxy_target_halo_ids, target_halos['halo_id'])
+        assert len(idxA) == selection.num_target_gals
+        assert np.all(target_galaxies['halo_mvir'][idxA] == target_halos['halo_mvir'][idxB])
+
+
+def test_build_target_galaxy_catalog_preallocated_memmap(tmpdir):
+    selection, source_galaxies, target_halos = _selection_and_catalogs()
+    correct_result = build_target_galaxy_catalog(selection, source_galaxies, target_halos,
+        target_halo_keys=('halo_mvir', ), include_halo_ids=False)
+    assert list(correct_result.keys()) == ['host_halo_id', 'luminosity', 'pos', 'halo_mvir']
+
+    dt = [('luminosity', 'f4'), ('halo_mvir', 'f8')]
+    fname = str(tmpdir.join('target_galaxies.dat'))
+    out = np.memmap(fname, dtype=dt, mode='w+', shape=(selection.num_target_gals, ))
+    result = build_target_galaxy_catalog(selection, source_galaxies, target_halos,
+        source_galaxy_keys=('luminosity', ), target_halo_keys=('halo_mvir', ),
+        out=out, chunk_size=50, include_halo_ids=False)
+    assert result is out
+    out.flush()
+    del out, result
+
+    target_galaxies = np.memmap(fname, dtype=dt, mode='r')
+    for key in ('luminosity', 'halo_mvir'):
+        assert np.all(target_galaxies[key] == correct_result[key])
+
+
+def test_build_target_galaxy_catalog_raises_on_bad_input():
+    selection, source_galaxies, target_halos = _selection_and_catalogs()
+
+    with pytest.raises(ValueError) as err:
+        build_target_galaxy_catalog(selection, target_halos, target_halos,
+            target_halo_keys=('halo_mvir', ))
+    substr = "appear more than once in the output catalog"
+    assert substr in err.value.args[0]
+
+    out = dict(luminosity=np.zeros(selection.num_target_gals - 1))
+    with pytest.raises(ValueError) as err:
+        build_target_galaxy_catalog(selection, source_galaxies, target_halos,
+            source_galaxy_keys=('luminosity', ), out=out, include_halo_ids=False)
+    substr = "Column ``luminosity`` of ``out`` has length"
+    assert substr in err.value.args[0]
+
+
+def test_build_target_galaxy_catalog_without_row_indices():
+    """ Selections without target halo row indices are matched to the
+    target halos by halo ID, in any order of the target halo catalog.
+    """
+    selection, source_galaxies, target_halos = _selection_and_catalogs()
+    correct_result = build_target_galaxy_catalog(selection, source_galaxies, target_halos,
+        target_halo_keys=('halo_mvir', ))
+
+    selection.target_halo_row_indices = None
+    rng = np.random.RandomState(fixed_seed)
+    shuffle = rng.permutation(len(target_halos['halo_id']))
+    shuffled_target_halos = dict((key, val[shuffle]) for key, val in target_halos.items())
+    result = build_target_galaxy_catalog(selection, source_galaxies, shuffled_target_halos,
+        target_halo_keys=('halo_mvir', ), chunk_size=11)
+    assert np.all(result['halo_mvir'] == correct_result['halo_mvir'])
+
+    incomplete_target_halos = dict((key, val[1:]) for key, val in target_halos.items())
+    with pytest.raises(ValueError) as err:
+        build_target_galaxy_catalog(selection, source_galaxies, incomplete_target_halos,
+            target_halo_keys=('halo_mvir', ))
+    assert "do not appear in" in str(err.value)
@@ -0,0 +1,97 @@
+"""
+"""
+import numpy as np
+import pytest
+from astropy.utils.misc import NumpyRNGContext
+
+from ..selection_kernels import HAS_CYTHON_KERNELS, galaxy_selection_indices
+from ..selection_kernels import cython_galaxy_selection_kernel as galaxy_selection_kernel
+
+
+fixed_seed = 43
+
+requires_cython_kernels = pytest.mark.skipif(not HAS_CYTHON_KERNELS,
+    reason="compiled extension galsampler.cython_kernels is not available")
+
+
+@requires_cython_kernels
+def test_galaxy_selection_kernel1():
+    first_source_gal_indices = np.array((5, 0, 2, 9)).astype('i8')
+    richness = np.array((2, 0, 3, 1)).astype('i8')
+    result = galaxy_selection_kernel(first_source_gal_indices, richness, 6)
+    assert np.all(result == (5, 6, 2, 3, 4, 9))
+
+
+@requires_cython_kernels
+def test_galaxy_selection_kernel_64bit_indices():
+    """ Indices beyond the range of a 32-bit integer should not overflow
+    """
+    first_source_gal_indices = np.array((2**31 - 1, 2**40)).astype('i8')
+    richness = np.array((3, 2)).astype('i8')
+    result = galaxy_selection_kernel(first_source_gal_indices, richness, 5)
+    correct_result = (2**31 - 1, 2**31, 2**31 + 1, 2**40, 2**40 + 1)
+    assert np.all(result == correct_result)
+
+
+@requires_cython_kernels
+def test_galaxy_selection_kernel_parallel_agrees_with_serial():
+    num_halos = int(1e4)
+    with NumpyRNGContext(fixed_seed):
+        richness = np.random.randint(0, 5, num_halos).astype('i8')
+        first_source_gal_indices = np.random.randint(0, int(1e5), num_halos).astype('i8')
+    ngal_tot = np.sum(richness)
+
+    serial_result = galaxy_selection_kernel(first_source_gal_indices, richness, ngal_tot)
+    parallel_result = galaxy_selection_kernel(first_source_gal_indices, richness, ngal_tot, 4)
+    assert np.all(serial_result == parallel_result)
+    assert np.all(serial_result == np.concatenate(
+        [np.arange(i, i+n) for i, n in zip(first_source_gal_indices, richness)]))
+
+
+@requires_cython_kernels
+def test_galaxy_selection_kernel_raises_for_short_output():
+    first_source_gal_indices = np.array((0, 3)).astype('i8')
+    richness = np.array((3, 2)).astype('i8')
+    with pytest.raises(ValueError):
+        galaxy_selection_kernel(first_source_gal_indices, richness, 4)
+
+
+@pytest.mark.parametrize('backend', ('numpy', pytest.param('cython', marks=requires_cython_kernels)))
+def test_galaxy_selection_indices_raises_for_mismatched_lengths(backend):
+    first_source_gal_indices = np.array((0, 3, 7)).astype('i8')
+    richness = np.array((3, 2)).astype('i8')
+    with pytest.raises(ValueError):
+        galaxy_selection_indices(first_source_gal_indices, richness, 5, backend=backend)
+    with pytest.raises(ValueError):
+        galaxy_selection_indices(first_source_gal_indices[:1], richness, 5, backend=backend)
+
+
+@pytest.mark.parametrize('backend', ('numpy', pytest.param('cython', marks=requires_cython_kernels)))
+def test_galaxy_selection_indices_backends(backend):
+    num_halos = int(1e4)
+    with NumpyRNGContext(fixed_seed):
+        richness = np.random.randint(-1, 5, num_halos)
+        first_source_gal_indices = np.random.randint(0, int(1e5), num_halos)
+    ngal_tot = np.sum(np.maximum(richness, 0))
+
+    result = galaxy_selection_indices(first_source_gal_indices, richness, ngal_tot, backend=backend)
+    correct_result = np.concatenate(
+        [np.arange(i, i+n) for i, n in zip(first_source_gal_indices, richness)])
+    assert result.dtype == np.dtype('i8')
+    assert np.all(result == correct_result)
+
+
+def test_galaxy_selection_indices_numpy_edge_cases():
+    empty = np.zeros(0, dtype='i8')
+    assert len(galaxy_selection_indices(empty, empty, 0, backend='numpy')) == 0
+
+    first_source_gal_indices = np.array((2**40, 7))
+    richness = np.array((2, 0))
+    result = galaxy_selection_indices(first_source_gal_indices, richness, 3, backend='numpy')
+    assert np.all(result == (2**40, 2**40 + 1, 0))
+
+    with pytest.raises(ValueError):
+        galaxy_selection_indices(first_source_gal_indices, richness, 1, backend='numpy')
+
+    with pytest.raises(ValueError):
+        galaxy_selection_indices(first_source_gal_indices, richness, 2, backend='fortran')
@@ -3,7 +3,8 @@
 import numpy as np
 import pytest
 
-from ..host_halo_binning import halo_bin_indices, matching_bin_dictionary
+from ..host_halo_binning import halo_bin_indices, matching_bin_dictionary, matching_bin_array
+from ..host_halo_binning import _halo_bin_indices
 from ..source_halo_selection import get_source_bin_from_target_bin
 
 
@@ -113,6 +114,21 @@ def test2_2bins():
     assert np.all(y[bin7_mask] >= 0.5)
 
 
+def test_halo_bin_indices_ordered_pairs():
+    """ The cell IDs computed from ordered (haloprop, bins) pairs do not depend on
+    the order of keyword arguments, which is arbitrary before Python 3.6
+    """
+    haloprop_a, bins_a = np.linspace(0, 10, 100), np.linspace(0, 10, 5)
+    haloprop_b, bins_b = np.linspace(10, 20, 100)[::-1], np.linspace(10, 20, 15)
+    bin_numbers = _halo_bin_indices([(haloprop_a, bins_a), (haloprop_b, bins_b)])
+    bin_a = np.digitize(haloprop_a, bins_a).clip(1, len(bins_a)-1) - 1
+    bin_b = np.digitize(haloprop_b, bins_b).clip(1, len(bins_b)-1) - 1
+    assert np.all(bin_numbers == bin_a*(len(bins_b)-1) + bin_b)
+
+    bin_numbers2 = _halo_bin_indices([(haloprop_b, bins_b), (haloprop_a, bins_a)])
+    assert np.all(bin_numbers2 == bin_b*(len(bins_a)-1) + bin_a)
+
+
 def test_matching_bin_dictionary1():
     """
     """
@@ -185,3 +201,27 @@ def test_matching_bin_dictionary4():
     result = matching_bin_dictionary(assigned_bin_numbers, nmin, bin_shapes)
     assert set(result.values()) == set((2, ))
     assert set(result.keys()) == set(np.arange(np.prod(bin_shapes)))
+
+
+def test_matching_bin_array_agrees_with_dictionary():
+    """
+    """
+    assigned_bin_numbers = [3, 2, 2, 2, 3, 5, 2, 5, 5, 2, 2, 6]
+    nmin = 3
+    bin_shapes = (10, )
+
+    result = matching_bin_array(assigned_bin_numbers, nmin, bin_shapes)
+    assert result.shape == (10, )
+    d = matching_bin_dictionary(assigned_bin_numbers, nmin, bin_shapes)
+    for bin_number in range(10):
+        assert result[bin_number] == d[bin_number]
+    assert np.all(result[assigned_bin_numbers] == [2, 2, 2, 2, 2, 5, 2, 5, 5, 2, 2, 5])
+
+
+def test_halo_bin_indices_memmap(tmpdir):
+    mass = 10**np.random.RandomState(43).uniform(10, 15, 1000)
+    mass_bins = np.logspace(10, 15, 12)
+    fname = str(tmpdir.join('mass.npy'))
+    np.save(fname, mass)
+    cell_ids = halo_bin_indices(mass=(np.load(fname, mmap_mode='r'), mass_bins))
+    assert np.all(cell_ids == halo_bin_indices(mass=(mass, mass_bins)))
@@ -0,0 +1,126 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+import pytest
+from astropy.utils.misc import NumpyRNGContext
+from halotools.utils import crossmatch
+from ..halo_ids import crossmatch_halo_ids, HaloIdIndex, cast_ids_to_dtype
+
+
+fixed_seed = 43
+
+
+def _brute_force_rows(x, halo_ids):
+    row_of_id = dict((halo_id, row) for row, halo_id in enumerate(halo_ids))
+    return np.array([row_of_id.get(val, -1) for val in x], dtype=int)
+
+
+@pytest.mark.parametrize('max_dense_ratio', (0, 4, np.inf))
+@pytest.mark.parametrize('id_range', (50, 10**12))
+def test_crossmatch_halo_ids_agrees_with_brute_force(max_dense_ratio, id_range):
+    with NumpyRNGContext(fixed_seed):
+        halo_ids = np.random.choice(np.arange(id_range - 50, id_range), 30, replace=False)
+        x = np.random.randint(id_range - 60, id_range + 10, 500)
+    idx_x, idx_halo_ids = crossmatch_halo_ids(x, halo_ids, max_dense_ratio=max_dense_ratio)
+
+    rows = _brute_force_rows(x, halo_ids)
+    assert np.all(idx_x == np.flatnonzero(rows >= 0))
+    assert np.all(idx_halo_ids == rows[idx_x])
+    assert np.all(x[idx_x] == halo_ids[idx_halo_ids])
+
+
+@pytest.mark.parametrize('max_dense_ratio', (0, 4))
+def test_crossmatch_halo_ids_agrees_with_crossmatch(max_dense_ratio):
+    with NumpyRNGContext(fixed_seed):
+        halo_ids = np.random.permutation(1000)[:800]
+        x = np.random.randint(-10, 1010, 5000)
+    idx_x, idx_halo_ids = crossmatch_halo_ids(x, halo_ids, max_dense_ratio=max_dense_ratio)
+    idx_x2, idx_halo_ids2 = crossmatch(x, halo_ids)
+    order = np.argsort(idx_x2)
+    assert np.all(idx_x == idx_x2[order])
+    assert np.all(idx_halo_ids == idx_halo_ids2[order])
+
+
+def test_crossmatch_halo_ids_mixed_dtypes():
+    halo_ids = np.array((3, 1, 2), dtype='u8')
+    x = np.array((2., 2.5, -1., 3., 7.))
+    idx_x, idx_halo_ids = crossmatch_halo_ids(x, halo_ids)
+    assert np.all(idx_x == (0, 3))
+    assert np.all(idx_halo_ids == (2, 0))
+
+
+def test_crossmatch_halo_ids_empty_inputs():
+    idx_x, idx_halo_ids = crossmatch_halo_ids(np.arange(5), np.zeros(0, dtype=int))
+    assert len(idx_x) == len(idx_halo_ids) == 0
+    idx_x, idx_halo_ids = crossmatch_halo_ids(np.zeros(0, dtype=int), np.arange(5))
+    assert len(idx_x) == len(idx_halo_ids) == 0
+
+
+@pytest.mark.parametrize('id_spacing', (1, 10**9))
+def test_halo_id_index_lookup(id_spacing):
+    with NumpyRNGContext(fixed_seed):
+        halo_ids = id_spacing*np.random.choice(np.arange(50), 30, replace=False)
+        ids = id_spacing*np.random.randint(-10, 60, 500) + np.random.randint(0, 2, 500)
+    index = HaloIdIndex(halo_ids)
+    assert index.is_dense == (id_spacing == 1)
+    assert len(index) == len(halo_ids)
+
+    rows = _brute_force_rows(ids, halo_ids)
+    assert np.all(index.lookup(ids) == rows)
+    assert np.all(index.lookup(ids, missing=len(halo_ids)) == np.where(rows < 0, len(halo_ids), rows))
+    assert np.all(index.lookup(halo_ids) == np.arange(len(halo_ids)))
+
+
+@pytest.mark.parametrize('id_spacing', (1, 10**9))
+def test_halo_id_index_uint64_beyond_int64(id_spacing):
+    id_min = 2**63 + 5
+    halo_ids = np.array([id_min + id_spacing*i for i in (3, 0, 2)], dtype='u8')
+    index = HaloIdIndex(halo_ids)
+    assert index.is_dense == (id_spacing == 1)
+
+    ids = np.array([id_min + id_spacing*i for i in (2, 1, 0, 5, 3)] + [0, 2**64-1], dtype='u8')
+    assert np.all(index.lookup(ids) == (2, -1, 1, -1, 0, -1, -1))
+    assert np.all(index.lookup(halo_ids) == np.arange(len(halo_ids)))
+    assert np.all(index.lookup(np.array((-1, 7))) == (-1, -1))
+
+
+@pytest.mark.parametrize('dtypes', (('u8', 'i8'), ('i8', 'u8')))
+@pytest.mark.parametrize('id_spacing', (1, 10**9))
+def test_halo_id_index_mixed_signedness_beyond_float64_precision(dtypes, id_spacing):
+    """ IDs differing by less than the float64 spacing of 2**60 are told apart
+    when the halo IDs and the queried IDs differ in signedness.
+    """
+    halo_id_dtype, id_dtype = dtypes
+    halo_ids = np.array([2**60 + id_spacing*i for i in (1, 0, 3)] + [3], dtype=halo_id_dtype)
+    index = HaloIdIndex(halo_ids)
+    assert not index.is_dense
+
+    ids = np.array([2**60 + id_spacing*i for i in (3, 2, 1, 0)] + [3, 4], dtype=id_dtype)
+    assert np.all(index.lookup(ids) == (2, -1, 0, 1, 3, -1))
+    if id_dtype == 'i8':
+        assert np.all(index.lookup(np.array((-3, 3))) == (-1, 3))
+
+
+def test_cast_ids_to_dtype():
+    ids = np.array((-1, 0, 2**63-1), dtype='i8')
+    is_representable, cast_ids = cast_ids_to_dtype(ids, 'u8')
+    assert np.all(is_representable == (False, True, True))
+    assert cast_ids.dtype == np.uint64
+    assert np.all(cast_ids == np.array((0, 2**63-1), dtype='u8'))
+
+    ids = np.array((0, 2**63-1, 2**63), dtype='u8')
+    is_representable, cast_ids = cast_ids_to_dtype(ids, 'i8')
+    assert np.all(is_representable == (True, True, False))
+    assert np.all(cast_ids == (0, 2**63-1))
+
+    ids = np.array((-1., 2., 2.5, np.nan, 2.**64))
+    is_representable, cast_ids = cast_ids_to_dtype(ids, 'u8')
+    assert np.all(is_representable == (False, True, False, False, False))
+    assert np.all(cast_ids == (2, ))
+
+
+def test_halo_id_index_empty_catalog():
+    index = HaloIdIndex(np.zeros(0, dtype=int))
+    assert not index.is_dense
+    assert np.all(index.lookup(np.arange(3), missing=-7) == -7)
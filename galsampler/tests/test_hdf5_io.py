@@ -0,0 +1,106 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+import pytest
+
+from ..hdf5_io import HAS_H5PY, iter_hdf5_chunks, prefetch, HDF5ChunkedWriter
+from ..hdf5_io import populate_hdf5_target_galaxy_catalog
+from ..galaxy_catalog import build_target_galaxy_catalog
+from ..source_galaxy_selection import SourceSampler
+from ..host_halo_binning import halo_bin_indices
+
+if HAS_H5PY:
+    import h5py
+
+
+fixed_seed = 43
+
+requires_h5py = pytest.mark.skipif(not HAS_H5PY, reason="h5py is not installed")
+
+
+def test_prefetch():
+    assert list(prefetch(iter(range(10)), depth=3)) == list(range(10))
+
+    def _failing_generator():
+        yield 0
+        raise KeyError("Item 1 is missing")
+    with pytest.raises(KeyError):
+        list(prefetch(_failing_generator()))
+
+    closed = []
+
+    def _infinite_generator():
+        try:
+            for i in range(10**9):
+                yield i
+        finally:
+            closed.append(True)
+    items = prefetch(_infinite_generator())
+    assert next(items) == 0
+    items.close()
+    assert closed == [True]
+
+
+@requires_h5py
+def test_writer_and_chunked_reader_roundtrip(tmpdir):
+    fname = str(tmpdir.join('table.hdf5'))
+    x = np.arange(25, dtype='f4')
+    pos = np.arange(75.).reshape((25, 3))
+    with HDF5ChunkedWriter(fname, chunk_size=4, compression='gzip') as writer:
+        for first, last in ((0, 10), (10, 10), (10, 25)):
+            writer.write(dict(x=x[first:last], pos=pos[first:last]))
+        assert writer.num_rows == 25
+
+    with h5py.File(fname, 'r') as f:
+        assert f['x'].dtype == np.float32
+        assert f['x'].compression == 'gzip'
+        assert f['pos'].chunks == (4, 3)
+
+    chunks = list(iter_hdf5_chunks(fname, ['pos'], chunk_size=7))
+    assert [first_row for first_row, __ in chunks] == [0, 7, 14, 21]
+    assert list(chunks[0][1].keys()) == ['pos']
+    assert np.all(np.concatenate([chunk['pos'] for __, chunk in chunks]) == pos)
+
+
+@requires_h5py
+def test_populate_hdf5_target_galaxy_catalog(tmpdir):
+    rng = np.random.RandomState(fixed_seed)
+    mass_bins = np.logspace(10.5, 15.5, 11)
+    num_source_halos = 300
+    source_halo_mass = 10**rng.uniform(10.5, 15.5, num_source_halos)
+    source_halo_id = np.arange(num_source_halos)
+    source_halo_bin_number = halo_bin_indices(mass=(source_halo_mass, mass_bins))
+    source_galaxy_host_halo_id = np.repeat(source_halo_id, rng.randint(0, 4, num_source_halos))
+    num_source_gals = len(source_galaxy_host_halo_id)
+    source_galaxies = dict(host_halo_id=source_galaxy_host_halo_id,
+        luminosity=rng.uniform(0, 1, num_source_gals))
+
+    num_target_halos = 2000
+    target_halos = dict(halo_id=rng.permutation(num_target_halos),
+        halo_mvir=10**rng.uniform(10.5, 15.5, num_target_halos),
+        halo_x=rng.uniform(0, 250, num_target_halos))
+    target_halos_fname = str(tmpdir.join('target_halos.hdf5'))
+    with h5py.File(target_halos_fname, 'w') as f:
+        for key, arr in target_halos.items():
+            f[key] = arr
+
+    sampler = SourceSampler(source_galaxy_host_halo_id, source_halo_bin_number,
+        source_halo_id, 5, mass_bins, assume_sorted=True)
+    target_halo_bin_number = halo_bin_indices(mass=(target_halos['halo_mvir'], mass_bins))
+    selection = sampler.sample(target_halo_bin_number, target_halos['halo_id'], compact=True)
+    correct_result = build_target_galaxy_catalog(selection, source_galaxies, target_halos,
+        source_galaxy_keys=('luminosity', ), target_halo_keys=('halo_x', ))
+
+    for chunk_size, prefetch_depth in ((300, 1), (10**6, 0)):
+        output_fname = str(tmpdir.join('target_galaxies.hdf5'))
+        num_target_gals = populate_hdf5_target_galaxy_catalog(sampler, target_halos_fname,
+            dict(halo_mvir=mass_bins), output_fname, source_galaxies,
+            source_galaxy_keys=('luminosity', ), target_halo_keys=('halo_x', ),
+            chunk_size=chunk_size, compression='gzip', prefetch_depth=prefetch_depth)
+        assert num_target_gals == selection.num_target_gals
+
+        with h5py.File(output_fname, 'r') as f:
+            assert set(f.keys()) == set(correct_result.keys())
+            for key, correct_arr in correct_result.items():
+                assert np.all(f[key][...] == correct_arr)
@@ -0,0 +1,112 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+import pytest
+from astropy.utils.misc import NumpyRNGContext
+
+from ..host_centric_transfer import transfer_host_centric_positions, transfer_host_centric_velocities
+from ..host_centric_transfer import HAS_CYTHON_KERNELS
+
+
+fixed_seed = 43
+
+requires_cython_kernels = pytest.mark.skipif(not HAS_CYTHON_KERNELS,
+    reason="compiled extension galsampler.cython_kernels is not available")
+
+backends = ['numpy', pytest.param('cython', marks=requires_cython_kernels)]
+
+
+def _enforce_periodicity_of_box(x, period):
+    return x % period
+
+
+@pytest.mark.parametrize('backend', backends)
+@pytest.mark.parametrize('dtype', ('f4', 'f8'))
+def test_transfer_host_centric_positions_agrees_with_naive_calculation(backend, dtype):
+    num_gals, num_halos, Lbox = int(1e4), 500, 250.
+    with NumpyRNGContext(fixed_seed):
+        host_centric_x = np.random.uniform(-2, 2, num_gals).astype(dtype)
+        target_halo_x = np.random.uniform(0, Lbox, num_halos).astype(dtype)
+        rows = np.random.randint(0, num_halos, num_gals)
+        rvir_ratio = np.random.uniform(0.5, 2, num_gals).astype(dtype)
+
+    correct_x = _enforce_periodicity_of_box(target_halo_x[rows] + host_centric_x, Lbox)
+    x = transfer_host_centric_positions(host_centric_x, target_halo_x[rows], Lbox, backend=backend)
+    assert x.dtype == np.dtype(dtype)
+    assert np.allclose(x, correct_x, atol=1e-4)
+    assert np.all(x >= 0) and np.all(x < Lbox)
+
+    x2 = transfer_host_centric_positions(host_centric_x, target_halo_x, Lbox,
+        target_halo_row_indices=rows, backend=backend)
+    assert np.all(x2 == x)
+
+    correct_x = _enforce_periodicity_of_box(target_halo_x[rows] + rvir_ratio*host_centric_x, Lbox)
+    x3 = transfer_host_centric_positions(host_centric_x, target_halo_x, Lbox,
+        target_halo_row_indices=rows, rvir_ratio=rvir_ratio, out=host_centric_x, backend=backend)
+    assert x3 is host_centric_x
+    assert np.allclose(x3, correct_x, atol=1e-4)
+
+
+@requires_cython_kernels
+@pytest.mark.parametrize('dtype', ('f4', 'f8'))
+def test_transfer_host_centric_positions_backends_agree(dtype):
+    num_gals, Lbox = int(1e5), 250.
+    with NumpyRNGContext(fixed_seed):
+        host_centric_pos = np.random.uniform(-5, 5, (num_gals, 3)).astype(dtype)
+        target_halo_pos = np.random.uniform(0, Lbox, (num_gals, 3)).astype(dtype)
+        rvir_ratio = np.random.uniform(0.5, 2, num_gals)
+    host_centric_pos[:5] = -1e-7
+    target_halo_pos[:5] = 0
+
+    results = [transfer_host_centric_positions(host_centric_pos, target_halo_pos, Lbox,
+        rvir_ratio=rvir_ratio, backend=backend, num_threads=num_threads)
+        for backend, num_threads in (('numpy', 1), ('cython', 1), ('cython', 4))]
+    for result in results[1:]:
+        assert np.all(result == results[0])
+    assert np.all(results[0] >= 0) and np.all(results[0] < Lbox)
+
+
+@pytest.mark.parametrize('backend', backends)
+def test_transfer_host_centric_positions_per_axis_period(backend):
+    host_centric_pos = np.array(((1., 1., 1.), (-1., -1., -1.)), dtype='f4')
+    target_halo_pos = np.array(((99.5, 49.5, 9.5), (0.5, 0.5, 0.5)), dtype='f4')
+    pos = transfer_host_centric_positions(host_centric_pos, target_halo_pos,
+        (100., 50., 10.), backend=backend)
+    correct_pos = ((0.5, 0.5, 0.5), (99.5, 49.5, 9.5))
+    assert np.allclose(pos, correct_pos)
+
+
+@pytest.mark.parametrize('backend', backends)
+def test_transfer_host_centric_velocities(backend):
+    host_centric_vel = np.array((-300., 10., 500.), dtype='f4')
+    target_halo_vel = np.array((100., -200.), dtype='f4')
+    rows = np.array((1, 0, 0))
+    vel = transfer_host_centric_velocities(host_centric_vel, target_halo_vel,
+        target_halo_row_indices=rows, rvir_ratio=np.array((1., 2., 0.5)), backend=backend)
+    assert np.allclose(vel, (-500., 120., 350.))
+
+
+def test_transfer_host_centric_positions_raises_on_bad_input():
+    x = np.zeros(5, dtype='f4')
+    with pytest.raises(ValueError) as err:
+        transfer_host_centric_positions(x, x, 250., out=np.zeros(4, dtype='f4'))
+    substr = "Input ``out`` has shape"
+    assert substr in err.value.args[0]
+
+    with pytest.raises(ValueError) as err:
+        transfer_host_centric_positions(x, x, 250., backend='fortran')
+    substr = "keyword argument ``backend`` can only take the following values"
+    assert substr in err.value.args[0]
+
+
+@pytest.mark.parametrize('backend', backends)
+@pytest.mark.parametrize('rows', ((1, -1, 0), (1, 2, 0)))
+def test_transfer_host_centric_positions_raises_on_out_of_bounds_rows(backend, rows):
+    x = np.zeros(3, dtype='f4')
+    target_halo_x = np.array((100., 200.), dtype='f4')
+    with pytest.raises(IndexError) as err:
+        transfer_host_centric_positions(x, target_halo_x, 250.,
+            target_halo_row_indices=np.array(rows), backend=backend)
+    substr = "Input ``target_halo_row_indices`` must be in the interval [0, 2)"
+    assert substr in err.value.args[0]
@@ -0,0 +1,97 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import numpy as np
+import pytest
+from ..instrumentation import StageProfiler, stage, _null_stage, HAS_RESET_PEAK
+from ..source_galaxy_selection import source_galaxy_selection_indices
+from .fake_catalogs import fake_source_galaxy_catalog, fake_target_halo_catalog
+
+
+fixed_seed = 43
+
+requires_reset_peak = pytest.mark.skipif(not HAS_RESET_PEAK,
+    reason="Memory tracing requires tracemalloc.reset_peak, added in Python 3.9")
+
+
+def _selection_inputs(num_objects=1000):
+    source_galaxies = fake_source_galaxy_catalog(num_objects, seed=fixed_seed)
+    source_halo_ids, idx = np.unique(source_galaxies['host_halo_id'], return_index=True)
+    mass_bins = np.logspace(10, 15.5, 15)
+    source_halo_bin_numbers = np.digitize(source_galaxies['host_halo_mass'][idx], mass_bins) - 1
+    target_halos = fake_target_halo_catalog(num_objects, seed=fixed_seed)
+    target_halo_bin_numbers = np.digitize(target_halos['mass'], mass_bins) - 1
+    return (source_galaxies['host_halo_id'], source_halo_bin_numbers, source_halo_ids,
+        target_halo_bin_numbers, target_halos['halo_id'], 5, mass_bins)
+
+
+def test_stages_are_not_measured_without_profiler():
+    assert stage('argsort', 10) is _null_stage
+
+
+@requires_reset_peak
+def test_stage_profiler_records_selection_stages():
+    args = _selection_inputs()
+    with StageProfiler(trace_memory=True) as profiler:
+        result = source_galaxy_selection_indices(*args)
+    num_target_gals = len(result[0])
+
+    expected_stages = ('sort_source_galaxies', 'compute_richness', 'source_halo_pools',
+        'source_halo_index_selection', 'gather_source_halo_properties',
+        'galaxy_selection_indices', 'repeat_halo_ids', 'unsort_selection_indices')
+    assert tuple(profiler.stages.keys()) == expected_stages
+    assert profiler.stages['galaxy_selection_indices']['num_items'] == num_target_gals
+    assert profiler.stages['source_halo_index_selection']['num_items'] == len(args[4])
+    for entry in profiler.stages.values():
+        assert entry['calls'] == 1
+        assert entry['wall_time'] >= 0
+        assert entry['peak_bytes'] >= 0
+    #  The expansion allocates at least the int64 output array
+    assert profiler.stages['galaxy_selection_indices']['peak_bytes'] >= 8*num_target_gals
+
+    decoded = json.loads(profiler.to_json())
+    assert list(decoded.keys()) == list(expected_stages)
+    table = profiler.summary()
+    assert all(name in table for name in expected_stages)
+
+    #  Results do not depend on the instrumentation
+    result2 = source_galaxy_selection_indices(*args)
+    assert all(np.all(a == b) for a, b in zip(result, result2))
+
+
+@requires_reset_peak
+def test_stage_profiler_nested_stages_and_callback():
+    calls = []
+
+    def callback(name, wall_time, num_items, peak_bytes):
+        calls.append((name, num_items, peak_bytes))
+
+    with StageProfiler(trace_memory=True, callback=callback) as profiler:
+        with stage('outer', 2):
+            with stage('inner', 1):
+                x = np.ones(10**6)
+            del x
+            with stage('inner', 1):
+                pass
+    assert [call[0] for call in calls] == ['inner', 'inner', 'outer']
+    assert profiler.stages['inner']['calls'] == 2
+    assert profiler.stages['inner']['num_items'] == 2
+    #  The peak of the outer stage includes the allocations of the inner stages
+    assert profiler.stages['outer']['peak_bytes'] >= 8*10**6
+    assert profiler.stages['inner']['peak_bytes'] >= 8*10**6
+
+
+def test_stage_profiler_without_memory_tracing():
+    with StageProfiler() as profiler:
+        with stage('argsort', 3):
+            np.argsort(np.array((3, 1, 2)))
+    assert profiler.stages['argsort']['peak_bytes'] is None
+    assert profiler.stages['argsort']['num_items'] == 3
+    assert stage('argsort') is _null_stage
+
+
+@pytest.mark.skipif(HAS_RESET_PEAK, reason="tracemalloc.reset_peak is available")
+def test_stage_profiler_memory_tracing_requires_reset_peak():
+    with pytest.raises(NotImplementedError):
+        StageProfiler(trace_memory=True)
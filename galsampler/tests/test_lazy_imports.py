@@ -0,0 +1,44 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import subprocess
+import sys
+import pytest
+
+
+heavy_modules = ('halotools', 'scipy', 'astropy', 'h5py', 'concurrent.futures')
+
+#  Before Python 3.7, the public functions are imported eagerly by ``import galsampler``
+requires_lazy_imports = pytest.mark.skipif(sys.version_info < (3, 7),
+    reason="Module __getattr__ requires Python 3.7")
+
+
+def _modules_imported_by(code):
+    """ Names among ``heavy_modules`` imported by running ``code`` in a fresh interpreter.
+    """
+    code = code + "; import json, sys; print(json.dumps([m for m in {0!r} if m in sys.modules]))".format(
+        list(heavy_modules))
+    output = subprocess.check_output([sys.executable, '-c', code])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+@requires_lazy_imports
+def test_import_galsampler_imports_no_heavy_dependency():
+    assert _modules_imported_by("import galsampler") == []
+
+
+@requires_lazy_imports
+@pytest.mark.parametrize('name', ('SourceSampler', 'source_galaxy_selection_indices',
+    'halo_bin_indices', 'build_target_galaxy_catalog', 'CompactGalaxySelection'))
+def test_public_functions_import_no_heavy_dependency(name):
+    assert _modules_imported_by("from galsampler import {0}".format(name)) == []
+
+
+def test_lazy_attributes():
+    import galsampler
+    from galsampler.source_galaxy_selection import SourceSampler
+    assert galsampler.SourceSampler is SourceSampler
+    assert 'populate_hdf5_target_galaxy_catalog' in dir(galsampler)
+    with pytest.raises(AttributeError):
+        galsampler.not_a_function
@@ -0,0 +1,46 @@
+"""
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+import tracemalloc
+import numpy as np
+import pytest
+from . import peak_memory as peak_memory_module
+from .peak_memory import peak_memory, pipeline_peak_memory, bytes_per_object_budgets
+
+
+@pytest.mark.parametrize('num_objects', (10**4, 10**5))
+def test_pipeline_peak_memory_within_budget(num_objects):
+    """ Fail when a change increases the peak memory per object of any stage
+    of the pipeline beyond its budget.
+    """
+    stages = pipeline_peak_memory(num_objects)
+    assert set(stages.keys()) == set(bytes_per_object_budgets.keys())
+
+    over_budget = dict((name, bytes_per_object) for name, (__, __, bytes_per_object)
+        in stages.items() if bytes_per_object > bytes_per_object_budgets[name])
+    msg = "Stages exceeding their budget of bytes per object:\n{0}"
+    assert not over_budget, msg.format(over_budget)
+
+
+def test_peak_memory_counts_numpy_allocations():
+    result, peak_bytes = peak_memory(np.ones, 10**6)
+    assert result.nbytes == 8*10**6
+    assert 8*10**6 <= peak_bytes < 9*10**6
+
+    __, peak_bytes = peak_memory(lambda: np.ones(10**6).sum())
+    assert 8*10**6 <= peak_bytes < 9*10**6
+
+
+def test_peak_memory_without_reset_peak(monkeypatch):
+    """ Emulate Python versions earlier than 3.9, lacking tracemalloc.reset_peak.
+    """
+    monkeypatch.setattr(peak_memory_module, 'HAS_RESET_PEAK', False)
+    __, peak_bytes = peak_memory(lambda: np.ones(10**6).sum())
+    assert 8*10**6 <= peak_bytes < 9*10**6
+
+    tracemalloc.start()
+    try:
+        with pytest.raises(RuntimeError):
+            peak_memory(np.ones, 10)
+    finally:
+        tracemalloc.stop()
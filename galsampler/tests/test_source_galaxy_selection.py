@@ -3,11 +3,15 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 import pytest
 import numpy as np
+from astropy.utils.misc import NumpyRNGContext
 from halotools.utils import crossmatch
-from ..source_galaxy_selection import source_galaxy_selection_indices
+from ..source_galaxy_selection import source_galaxy_selection_indices, SourceSampler
 from ..host_halo_binning import halo_bin_indices
 
 
+fixed_seed = 43
+
+
 def test1_bijective_case():
     """
     Setup:
@@ -217,3 +221,213 @@ def test_empty_halos_case():
         target_halo_mass = target_halo_log_mhost[target_mask][0]
         assert source_halo_mass == target_halo_mass == galmass
 
+
+def test_source_sampler_reuse_agrees_with_source_galaxy_selection_indices():
+    """ A single SourceSampler used to populate several target catalogs should
+    give the same results as separate calls to source_galaxy_selection_indices
+    """
+    log_mhost_bins = np.arange(10.5, 16, 0.5)
+    log_mhost_mids = 0.5*(log_mhost_bins[:-1] + log_mhost_bins[1:])
+
+    num_source_halos_per_bin = 20
+    source_halo_log_mhost = np.tile(log_mhost_mids, num_source_halos_per_bin)
+    num_source_halos = len(source_halo_log_mhost)
+    source_halo_id = np.arange(num_source_halos).astype(int)
+    source_halo_bin_number = halo_bin_indices(log_mhost=(source_halo_log_mhost, log_mhost_bins))
+
+    source_halo_richness = np.tile([0, 1, 3], num_source_halos)[:num_source_halos]
+    source_galaxy_host_halo_id = np.repeat(source_halo_id, source_halo_richness)[::-1]
+
+    nhalo_min = 5
+    sampler = SourceSampler(source_galaxy_host_halo_id,
+            source_halo_bin_number, source_halo_id, nhalo_min, log_mhost_bins)
+
+    for num_target_halos_per_source_halo in (3, 11):
+        target_halo_bin_number = np.repeat(source_halo_bin_number, num_target_halos_per_source_halo)
+        target_halo_ids = np.arange(len(target_halo_bin_number)).astype('i8')[::-1]
+
+        result = sampler.sample(target_halo_bin_number, target_halo_ids)
+        correct_result = source_galaxy_selection_indices(source_galaxy_host_halo_id,
+            source_halo_bin_number, source_halo_id, target_halo_bin_number,
+            target_halo_ids, nhalo_min, log_mhost_bins)
+        for arr, correct_arr in zip(result, correct_result):
+            assert np.all(arr == correct_arr)
+
+
+def test_assume_sorted():
+    """ Passing assume_sorted=True for a presorted galaxy catalog should
+    give the same results as the default behavior
+    """
+    log_mhost_bins = np.arange(10.5, 16, 0.5)
+    log_mhost_mids = 0.5*(log_mhost_bins[:-1] + log_mhost_bins[1:])
+    source_halo_log_mhost = np.tile(log_mhost_mids, 20)
+    num_source_halos = len(source_halo_log_mhost)
+    source_halo_id = np.arange(num_source_halos).astype(int)
+    source_halo_bin_number = halo_bin_indices(log_mhost=(source_halo_log_mhost, log_mhost_bins))
+
+    source_halo_richness = np.tile([0, 1, 3], num_source_halos)[:num_source_halos]
+    source_galaxy_host_halo_id = np.repeat(source_halo_id, source_halo_richness)
+
+    target_halo_bin_number = np.repeat(source_halo_bin_number, 4)
+    target_halo_ids = np.arange(len(target_halo_bin_number)).astype('i8')
+
+    args = (source_galaxy_host_halo_id, source_halo_bin_number, source_halo_id,
+        target_halo_bin_number, target_halo_ids, 5, log_mhost_bins)
+    result = source_galaxy_selection_indices(*args, assume_sorted=True)
+    correct_result = source_galaxy_selection_indices(*args)
+    for arr, correct_arr in zip(result, correct_result):
+        assert np.all(arr == correct_arr)
+
+    args = (source_galaxy_host_halo_id[::-1], source_halo_bin_number, source_halo_id,
+        target_halo_bin_number, target_halo_ids, 5, log_mhost_bins)
+    with pytest.raises(ValueError) as err:
+        source_galaxy_selection_indices(*args, assume_sorted=True)
+    substr = "must be sorted in monotonically increasing order"
+    assert substr in err.value.args[0]
+
+
+def test_source_sampler_rejects_unknown_kwargs():
+    log_mhost_bins = np.arange(10.5, 16, 0.5)
+    source_halo_id = np.arange(len(log_mhost_bins)-1)
+    source_halo_bin_number = np.arange(len(log_mhost_bins)-1)
+    args = (source_halo_id, source_halo_bin_number, source_halo_id, 1, log_mhost_bins)
+    sampler = SourceSampler(*args, sparse_cells=True, assume_sorted=True, check_sorted=False)
+    assert sampler.source_halos_richness.sum() == len(source_halo_id)
+
+    with pytest.raises(TypeError) as err:
+        SourceSampler(*args, sparse_cell=True)
+    assert "sparse_cell" in err.value.args[0]
+
+
+def test_source_galaxy_selection_indices_forwards_kwargs():
+    """ Every option of SourceSampler and SourceSampler.sample is honored by
+    source_galaxy_selection_indices, and unknown options raise a TypeError
+    """
+    log_mhost_bins = np.arange(10.5, 16, 0.5)
+    log_mhost_mids = 0.5*(log_mhost_bins[:-1] + log_mhost_bins[1:])
+    source_halo_log_mhost = np.tile(log_mhost_mids, 20)
+    num_source_halos = len(source_halo_log_mhost)
+    source_halo_id = np.arange(num_source_halos).astype(int)
+    source_halo_bin_number = halo_bin_indices(log_mhost=(source_halo_log_mhost, log_mhost_bins))
+    source_halo_richness = np.tile([0, 1, 3], num_source_halos)[:num_source_halos]
+    source_galaxy_host_halo_id = np.repeat(source_halo_id, source_halo_richness)
+    target_halo_bin_number = np.repeat(source_halo_bin_number, 4)
+    target_halo_ids = np.arange(len(target_halo_bin_number)).astype('i8')
+
+    args = (source_galaxy_host_halo_id, source_halo_bin_number, source_halo_id,
+        target_halo_bin_number, target_halo_ids, 5, log_mhost_bins)
+    sampler = SourceSampler(*(args[:3] + args[5:]), sparse_cells=True)
+    for seed in (fixed_seed, 999):
+        result = source_galaxy_selection_indices(*args, seed=seed, sparse_cells=True, n_jobs=2)
+        correct_result = sampler.sample(target_halo_bin_number, target_halo_ids, seed=seed)
+        for arr, correct_arr in zip(result, correct_result):
+            assert np.all(arr == correct_arr)
+
+    with pytest.raises(TypeError) as err:
+        source_galaxy_selection_indices(*args, assume_sortd=True)
+    assert "assume_sortd" in err.value.args[0]
+
+
+def test_sample_chunks_is_independent_of_chunk_size():
+    """ Concatenating the results of SourceSampler.sample_chunks should give
+    the same result as SourceSampler.sample, regardless of the chunk size
+    """
+    log_mhost_bins = np.arange(10.5, 16, 0.5)
+    log_mhost_mids = 0.5*(log_mhost_bins[:-1] + log_mhost_bins[1:])
+    source_halo_log_mhost = np.tile(log_mhost_mids, 20)
+    num_source_halos = len(source_halo_log_mhost)
+    source_halo_id = np.arange(num_source_halos).astype(int)
+    source_halo_bin_number = halo_bin_indices(log_mhost=(source_halo_log_mhost, log_mhost_bins))
+
+    source_halo_richness = np.tile([0, 1, 3], num_source_halos)[:num_source_halos]
+    source_galaxy_host_halo_id = np.repeat(source_halo_id, source_halo_richness)[::-1]
+
+    sampler = SourceSampler(source_galaxy_host_halo_id,
+            source_halo_bin_number, source_halo_id, 5, log_mhost_bins)
+
+    with NumpyRNGContext(fixed_seed):
+        target_halo_bin_number = np.random.choice(source_halo_bin_number, 1001)
+    target_halo_ids = np.arange(len(target_halo_bin_number)).astype('i8')
+    correct_result = sampler.sample(target_halo_bin_number, target_halo_ids)
+
+    for chunk_size in (1, 7, 250, 1001, 5000):
+        chunks = ((target_halo_bin_number[i:i+chunk_size], target_halo_ids[i:i+chunk_size])
+            for i in range(0, len(target_halo_ids), chunk_size))
+        chunk_results = list(sampler.sample_chunks(chunks))
+        for i, correct_arr in enumerate(correct_result):
+            arr = np.concatenate([chunk_result[i] for chunk_result in chunk_results])
+            assert np.all(arr == correct_arr)
+
+
+def test_return_row_indices():
+    """ Halo properties gathered with the returned row indices should agree with
+    those obtained by crossmatching halo IDs
+    """
+    log_mhost_bins = np.arange(10.5, 16, 0.5)
+    log_mhost_mids = 0.5*(log_mhost_bins[:-1] + log_mhost_bins[1:])
+    source_halo_log_mhost = np.tile(log_mhost_mids, 20)
+    num_source_halos = len(source_halo_log_mhost)
+    with NumpyRNGContext(fixed_seed):
+        source_halo_id = np.random.permutation(np.arange(num_source_halos)) + 1000
+        target_halo_bin_number = np.random.randint(0, len(log_mhost_mids), 500)
+        target_halo_ids = np.random.permutation(np.arange(500))
+    source_halo_bin_number = halo_bin_indices(log_mhost=(source_halo_log_mhost, log_mhost_bins))
+    source_halo_richness = np.tile([0, 1, 3], num_source_halos)[:num_source_halos]
+    source_galaxy_host_halo_id = np.repeat(source_halo_id, source_halo_richness)[::-1]
+
+    args = (source_galaxy_host_halo_id, source_halo_bin_number, source_halo_id,
+        target_halo_bin_number, target_halo_ids, 5, log_mhost_bins)
+    correct_result = source_galaxy_selection_indices(*args)
+    result = source_galaxy_selection_indices(*args, return_row_indices=True)
+    assert len(result) == 6
+    for arr, correct_arr in zip(result[:3], correct_result):
+        assert np.all(arr == correct_arr)
+
+    (target_galaxy_target_halo_ids, target_galaxy_source_halo_ids,
+        target_galaxy_target_halo_rows, target_galaxy_source_halo_rows,
+        target_halo_source_halo_rows) = result[1:]
+    assert np.all(target_halo_ids[target_galaxy_target_halo_rows] == target_galaxy_target_halo_ids)
+    assert np.all(source_halo_id[target_galaxy_source_halo_rows] == target_galaxy_source_halo_ids)
+
+    idxA, idxB = crossmatch(target_galaxy_source_halo_ids, source_halo_id)
+    assert np.all(target_galaxy_source_halo_rows[idxA] == idxB)
+
+    assert len(target_halo_source_halo_rows) == len(target_halo_ids)
+    assert np.all(source_halo_bin_number[target_halo_source_halo_rows] == target_halo_bin_number)
+
+
+def test_memmap_source_galaxy_catalog(tmpdir):
+    """ A presorted memory-mapped source galaxy catalog should give the same
+    results as the same catalog in memory
+    """
+    log_mhost_bins = np.arange(10.5, 16, 0.5)
+    log_mhost_mids = 0.5*(log_mhost_bins[:-1] + log_mhost_bins[1:])
+    source_halo_log_mhost = np.tile(log_mhost_mids, 20)
+    num_source_halos = len(source_halo_log_mhost)
+    source_halo_id = np.arange(num_source_halos).astype(int)
+    source_halo_bin_number = halo_bin_indices(log_mhost=(source_halo_log_mhost, log_mhost_bins))
+    source_halo_richness = np.tile([0, 1, 3], num_source_halos)[:num_source_halos]
+    source_galaxy_host_halo_id = np.repeat(source_halo_id, source_halo_richness)
+    source_galaxy_luminosity = np.arange(len(source_galaxy_host_halo_id))*1e8
+
+    fname = str(tmpdir.join('source_galaxy_host_halo_id.npy'))
+    np.save(fname, source_galaxy_host_halo_id)
+    mmap_source_galaxy_host_halo_id = np.load(fname, mmap_mode='r')
+    fname = str(tmpdir.join('source_galaxy_luminosity.npy'))
+    np.save(fname, source_galaxy_luminosity)
+    mmap_source_galaxy_luminosity = np.load(fname, mmap_mode='r')
+
+    target_halo_bin_number = np.repeat(source_halo_bin_number, 4)
+    target_halo_ids = np.arange(len(target_halo_bin_number)).astype('i8')
+
+    args = (source_halo_bin_number, source_halo_id, 5, log_mhost_bins)
+    sampler = SourceSampler(source_galaxy_host_halo_id, *args, assume_sorted=True)
+    mmap_sampler = SourceSampler(mmap_source_galaxy_host_halo_id, *args, assume_sorted=True)
+    correct_result = sampler.sample(target_halo_bin_number, target_halo_ids)
+    result = mmap_sampler.sample(target_halo_bin_number, target_halo_ids)
+    for arr, correct_arr in zip(result, correct_result):
+        assert np.all(arr == correct_arr)
+
+    selection = mmap_sampler.sample(target_halo_bin_number, target_halo_ids, compact=True)
+    luminosity = selection.gather(mmap_source_galaxy_luminosity, chunk_size=100)
+    assert np.all(luminosity == source_galaxy_luminosity[correct_result[0]])
@@ -6,6 +6,10 @@ from halotools.utils import crossmatch
 from astropy.utils.misc import NumpyRNGContext
 
 from ..source_halo_selection import source_halo_index_selection, get_source_bin_from_target_bin
+from ..source_halo_selection import _cell_pools, get_source_bins_from_target_bins
+from ..source_halo_selection import get_sparse_source_bins_from_target_bins
+from ..source_halo_selection import randomly_select_source_halos_within_bin, _batch_cells_by_size
+from ..source_halo_selection import cell_random_generator, _reused_cell_random_generator
 from ..host_halo_binning import halo_bin_indices
 
 
@@ -326,3 +330,228 @@ def test_hod_matching2():
     std_target_richness = np.std(target_richness)
     assert np.allclose(std_data_richness, std_target_richness, rtol=0.2)
 
+
+def test_cell_pools():
+    num_cells_total = 6
+    bin_numbers = np.array((4, 0, 4, 2, 0, 4, 7, -1))
+    idx_sorted, cell_offsets = _cell_pools(bin_numbers, num_cells_total)
+    assert cell_offsets.shape == (num_cells_total+1, )
+    assert np.all(np.diff(cell_offsets) == (2, 0, 1, 0, 3, 0))
+
+    for icell in range(num_cells_total):
+        ifirst, ilast = cell_offsets[icell], cell_offsets[icell+1]
+        cell_indices = idx_sorted[ifirst:ilast]
+        assert np.all(cell_indices == np.flatnonzero(bin_numbers == icell))
+
+
+def test_get_source_bins_from_target_bins_agrees_with_scalar_function():
+    nhalo_min = 3
+    bin_shapes = (6, 5, 4)
+    num_cells_total = np.prod(bin_shapes)
+    with NumpyRNGContext(fixed_seed):
+        source_bin_counts = np.random.randint(0, 4, num_cells_total)
+        source_bin_counts[np.random.rand(num_cells_total) < 0.8] = 0
+
+    source_bins = get_source_bins_from_target_bins(source_bin_counts, nhalo_min, bin_shapes)
+    assert source_bins.shape == (num_cells_total, )
+    for bin_number in range(num_cells_total):
+        correct_source_bin = get_source_bin_from_target_bin(
+            source_bin_counts, bin_number, nhalo_min, bin_shapes)
+        assert source_bins[bin_number] == correct_source_bin
+
+
+def test_get_source_bins_from_target_bins_no_well_sampled_cells():
+    source_bin_counts = np.zeros(10)
+    with pytest.raises(ValueError):
+        get_source_bins_from_target_bins(source_bin_counts, 1, (10, ))
+
+
+def test_get_sparse_source_bins_from_target_bins_agrees_with_scalar_function():
+    nhalo_min = 3
+    bin_shapes = (7, 6, 5, 4)
+    num_cells_total = np.prod(bin_shapes)
+    with NumpyRNGContext(fixed_seed):
+        source_bin_counts = np.random.randint(0, 4, num_cells_total)
+        source_bin_counts[np.random.rand(num_cells_total) < 0.9] = 0
+    occupied_source_bins = np.flatnonzero(source_bin_counts)
+    target_bins = np.arange(num_cells_total)
+
+    source_bins = get_sparse_source_bins_from_target_bins(occupied_source_bins,
+        source_bin_counts[occupied_source_bins], target_bins, nhalo_min, bin_shapes)
+    for bin_number in target_bins:
+        correct_source_bin = get_source_bin_from_target_bin(
+            source_bin_counts, bin_number, nhalo_min, bin_shapes)
+        assert source_bins[bin_number] == correct_source_bin
+
+
+def test_sparse_cells_agrees_with_dense_cells():
+    nhalo_min = 5
+    num_sources, num_target = int(1e3), int(1e4)
+    bin1, bin2, bin3 = np.linspace(0, 1, 9), np.linspace(0, 1, 7), np.linspace(0, 1, 5)
+    num_cells_total = 8*6*4
+    with NumpyRNGContext(fixed_seed):
+        source_halo_bin_numbers = np.random.randint(0, num_cells_total, num_sources)
+        target_halo_bin_numbers = np.random.randint(0, num_cells_total, num_target)
+    target_halo_ids = np.arange(num_target).astype('i8')
+
+    dense_indices, dense_ids = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers, target_halo_ids, nhalo_min, bin1, bin2, bin3)
+    sparse_indices, sparse_ids = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers, target_halo_ids, nhalo_min, bin1, bin2, bin3, sparse_cells=True)
+    assert np.all(dense_indices == sparse_indices)
+    assert np.all(dense_ids == sparse_ids)
+
+
+@pytest.mark.parametrize('seed_by_halo_id', (False, True))
+def test_sparse_cells_agrees_with_dense_cells_out_of_range_target_bins(seed_by_halo_id):
+    """ Target halos with bin numbers outside every cell are left unassigned in both modes
+    """
+    nhalo_min = 2
+    bin1, bin2 = np.linspace(0, 1, 3), np.linspace(0, 1, 3)
+    with NumpyRNGContext(fixed_seed):
+        source_halo_bin_numbers = np.random.randint(0, 4, 100)
+        target_halo_bin_numbers = np.random.randint(-2, 7, 1000)
+    target_halo_ids = np.arange(1000).astype('i8')
+
+    dense_result = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers, target_halo_ids, nhalo_min, bin1, bin2,
+        seed_by_halo_id=seed_by_halo_id)
+    sparse_result = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers, target_halo_ids, nhalo_min, bin1, bin2,
+        seed_by_halo_id=seed_by_halo_id, sparse_cells=True)
+    for arr, correct_arr in zip(sparse_result, dense_result):
+        assert np.all(arr == correct_arr)
+
+    out_of_range = (target_halo_bin_numbers < 0) | (target_halo_bin_numbers >= 4)
+    assert np.all(sparse_result[1][out_of_range] == 0)
+
+
+def test_random_streams_are_independent_between_cells():
+    """ Cells with identical pools of source halos should receive different draws,
+    and the draws in one cell should not depend on the other cells
+    """
+    source_bin_indices = np.arange(1000)
+    draws0 = randomly_select_source_halos_within_bin(source_bin_indices, 500, fixed_seed, 0)
+    draws1 = randomly_select_source_halos_within_bin(source_bin_indices, 500, fixed_seed, 1)
+    assert not np.all(draws0 == draws1)
+    assert np.all(draws0 == randomly_select_source_halos_within_bin(
+        source_bin_indices, 500, fixed_seed, 0))
+    assert not np.all(draws0 == randomly_select_source_halos_within_bin(
+        source_bin_indices, 500, fixed_seed+1, 0))
+
+    nhalo_min = 5
+    bins = np.linspace(0, 1, 6)
+    source_halo_bin_numbers = np.repeat(np.arange(5), 50)
+    target_halo_bin_numbers = np.repeat(np.arange(5), 200)
+    target_halo_ids = np.arange(len(target_halo_bin_numbers))
+    source_indices, __ = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers, target_halo_ids, nhalo_min, bins)
+
+    mask = target_halo_bin_numbers == 3
+    source_indices2, __ = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers[mask], target_halo_ids[mask], nhalo_min, bins)
+    assert np.all(source_indices[mask] == source_indices2)
+
+
+@pytest.mark.parametrize('num_previous_draws', (0, 1, 3, 4, 9, 1001))
+def test_cell_random_generator_agrees_with_philox_stream(num_previous_draws):
+    """ The stream of a cell is the Philox stream keyed by (seed, bin_number),
+    whether the generator is constructed or reused
+    """
+    for seed, bin_number in ((fixed_seed, 0), (fixed_seed, 12345), (2**63 + 7, 2**40)):
+        bit_generator = np.random.Philox(key=np.array((seed, bin_number), dtype='u8'))
+        correct_draws = bit_generator.random_raw(num_previous_draws + 10)[num_previous_draws:]
+        rng = cell_random_generator(seed, bin_number, num_previous_draws)
+        assert np.all(rng.bit_generator.random_raw(10) == correct_draws)
+        rng = _reused_cell_random_generator(seed, bin_number, num_previous_draws)
+        assert np.all(rng.bit_generator.random_raw(10) == correct_draws)
+
+
+def test_parallel_selection_agrees_with_serial():
+    nhalo_min = 10
+    num_sources, num_target = int(1e4), int(1e5)
+    bin1, bin2 = np.linspace(0, 1, 21), np.linspace(0, 1, 11)
+    with NumpyRNGContext(fixed_seed):
+        source_halo_bin_numbers = np.random.randint(0, 200, num_sources)
+        target_halo_bin_numbers = np.minimum(199, np.random.geometric(0.02, num_target))
+    target_halo_ids = np.arange(num_target).astype('i8')
+
+    serial_result = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers, target_halo_ids, nhalo_min, bin1, bin2)
+    parallel_result = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers, target_halo_ids, nhalo_min, bin1, bin2, n_jobs=4)
+    for arr, correct_arr in zip(parallel_result, serial_result):
+        assert np.all(arr == correct_arr)
+
+
+def test_batch_cells_by_size():
+    cell_sizes = np.array((1, 100, 3, 50, 2, 2, 40))
+    batches = _batch_cells_by_size(cell_sizes, 4)
+    assert batches[0][0] == 1
+    assert np.all(np.sort(np.concatenate(batches)) == np.arange(len(cell_sizes)))
+    assert _batch_cells_by_size(np.zeros(0, dtype='i8'), 4) == []
+
+
+def test_seed_by_halo_id_is_independent_of_target_catalog():
+    """ With seed_by_halo_id=True, the source halo selected for a target halo
+    should not depend on the order or the content of the rest of the target catalog
+    """
+    nhalo_min = 5
+    bins = np.linspace(0, 1, 11)
+    with NumpyRNGContext(fixed_seed):
+        source_halo_bin_numbers = np.random.randint(0, 10, 1000)
+        target_halo_bin_numbers = np.random.randint(0, 10, 5000)
+        target_halo_ids = np.random.permutation(np.arange(10**6, 10**6+5000))
+        indx = np.random.choice(5000, 1000, replace=False)
+
+    source_indices, matching_ids = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers, target_halo_ids, nhalo_min, bins, seed_by_halo_id=True)
+    assert np.all(matching_ids == target_halo_ids)
+    assert np.all(source_halo_bin_numbers[source_indices] == target_halo_bin_numbers)
+    assert len(np.unique(source_indices)) > 900
+
+    source_indices2, __ = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers[indx], target_halo_ids[indx], nhalo_min, bins, seed_by_halo_id=True)
+    assert np.all(source_indices2 == source_indices[indx])
+
+    source_indices3, __ = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers, target_halo_ids, nhalo_min, bins,
+        seed_by_halo_id=True, sparse_cells=True)
+    assert np.all(source_indices3 == source_indices)
+
+    source_indices4, __ = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers, target_halo_ids, nhalo_min, bins,
+        seed_by_halo_id=True, seed=fixed_seed+1)
+    assert not np.all(source_indices4 == source_indices)
+
+    with pytest.raises(ValueError) as err:
+        source_halo_index_selection(source_halo_bin_numbers, target_halo_bin_numbers,
+            target_halo_ids, nhalo_min, bins, seed_by_halo_id=True,
+            intra_bin_selection_method='hod_matching')
+    substr = "``seed_by_halo_id`` is only supported"
+    assert substr in err.value.args[0]
+
+
+def test_seed_by_halo_id_out_of_range_target_bins():
+    """ Target halos with bin numbers outside every cell are left unassigned,
+    as with the default per-cell selection
+    """
+    nhalo_min = 1
+    bins = np.linspace(0, 1, 6)
+    source_halo_bin_numbers = np.repeat(np.arange(5), 3)
+    target_halo_bin_numbers = np.array((0, 1, 2, 3, 4, -1, 2, 5))
+    target_halo_ids = np.arange(100, 108)
+    in_range = (target_halo_bin_numbers >= 0) & (target_halo_bin_numbers < 5)
+
+    default_indices, default_ids = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers, target_halo_ids, nhalo_min, bins)
+    source_indices, matching_ids = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers, target_halo_ids, nhalo_min, bins, seed_by_halo_id=True)
+    assert np.all(source_indices[~in_range] == default_indices[~in_range])
+    assert np.all(matching_ids == default_ids)
+    assert np.all(source_halo_bin_numbers[source_indices[in_range]] == target_halo_bin_numbers[in_range])
+
+    source_indices2, __ = source_halo_index_selection(source_halo_bin_numbers,
+        target_halo_bin_numbers[in_range], target_halo_ids[in_range], nhalo_min, bins,
+        seed_by_halo_id=True)
+    assert np.all(source_indices2 == source_indices[in_range])
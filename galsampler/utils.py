@@ -3,7 +3,10 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import numpy as np
-from halotools.utils import crossmatch
+from .halo_ids import HaloIdIndex, cast_ids_to_dtype
+
+
+default_block_size = int(1e7)
 
 
 def compute_richness(unique_halo_ids, halo_id_of_galaxies):
@@ -11,11 +14,208 @@ def compute_richness(unique_halo_ids, halo_id_of_galaxies):
     """
     unique_halo_ids = np.atleast_1d(unique_halo_ids)
     halo_id_of_galaxies = np.atleast_1d(halo_id_of_galaxies)
-    richness_result = np.zeros_like(unique_halo_ids).astype(int)
 
-    vals, counts = np.unique(halo_id_of_galaxies, return_counts=True)
-    idxA, idxB = crossmatch(vals, unique_halo_ids)
-    richness_result[idxB] = counts[idxA]
-    return richness_result
+    #  Each galaxy is matched to its host halo directly, so the galaxies need not be sorted
+    rows = HaloIdIndex(unique_halo_ids).lookup(halo_id_of_galaxies)
+    return np.bincount(rows[rows >= 0], minlength=len(unique_halo_ids)).astype(int)
+
+
+def compute_richness_and_first_index(unique_halo_ids, sorted_halo_id_of_galaxies,
+            block_size=default_block_size):
+    """ For every halo, calculate the number of resident galaxies and the index of
+    the first resident galaxy, in a single linear pass over a galaxy catalog
+    that has already been sorted by host halo ID.
+
+    Parameters
+    ----------
+    unique_halo_ids : ndarray
+        Numpy integer array of shape (num_halos, ) storing unique halo IDs
+
+    sorted_halo_id_of_galaxies : ndarray
+        Numpy integer array of shape (num_gals, ) storing the host halo ID
+        of every galaxy, in monotonically increasing order.
+        May be a memory-mapped array or an HDF5 dataset, which is read
+        in sequential blocks of ``block_size`` elements.
+
+    block_size : int, optional
+        Number of galaxies processed at once. Default is 1e7.
+
+    Returns
+    -------
+    richness : ndarray
+        Numpy integer array of shape (num_halos, ) storing the number of galaxies
+        in each halo. Identical to the result of `compute_richness`.
+
+    first_index : ndarray
+        Numpy integer array of shape (num_halos, ) storing the index in
+        ``sorted_halo_id_of_galaxies`` of the first galaxy in each halo,
+        reserving -1 for halos with no resident galaxies
+
+    Examples
+    --------
+    >>> unique_halo_ids = [5, 2, 100]
+    >>> sorted_halo_id_of_galaxies = [2, 2, 3, 3, 100, 100, 100, 100]
+    >>> richness, first_index = compute_richness_and_first_index(unique_halo_ids, sorted_halo_id_of_galaxies)
+    """
+    unique_halo_ids = np.atleast_1d(unique_halo_ids)
+    sorted_halo_id_of_galaxies = atleast_1d_no_copy(sorted_halo_id_of_galaxies)
+    num_gals = len(sorted_halo_id_of_galaxies)
+
+    richness = np.zeros(len(unique_halo_ids), dtype='i8')
+    first_index = np.zeros(len(unique_halo_ids), dtype='i8') - 1
+    if num_gals == 0:
+        return richness, first_index
+
+    #  Galaxies sharing a host halo occupy a contiguous run of the sorted array.
+    #  Each block is compared to the last galaxy of the previous block,
+    #  so that runs straddling two blocks are not split
+    run_starts, run_halo_ids = [], []
+    for ifirst, ilast in iter_blocks(num_gals, block_size):
+        block = np.asarray(sorted_halo_id_of_galaxies[max(ifirst-1, 0):ilast])
+        if ifirst == 0:
+            is_run_start = np.ones(len(block), dtype=bool)
+            np.not_equal(block[1:], block[:-1], out=is_run_start[1:])
+            block_run_starts = np.flatnonzero(is_run_start)
+        else:
+            block_run_starts = np.flatnonzero(block[1:] != block[:-1]) + 1
+        run_starts.append(block_run_starts + max(ifirst-1, 0))
+        run_halo_ids.append(block[block_run_starts])
+    run_starts = np.concatenate(run_starts)
+    run_halo_ids = np.concatenate(run_halo_ids)
+    run_lengths = np.diff(np.append(run_starts, num_gals))
+
+    #  Halo IDs are cast to the dtype of the galaxy host halo IDs, since searching
+    #  uint64 IDs in int64 IDs or conversely would compare them in float64
+    is_representable = np.ones(len(unique_halo_ids), dtype=bool)
+    if run_halo_ids.dtype.kind in 'iu':
+        is_representable, halo_ids = cast_ids_to_dtype(unique_halo_ids, run_halo_ids.dtype)
+    else:
+        halo_ids = unique_halo_ids
+    idx = np.minimum(np.searchsorted(run_halo_ids, halo_ids), len(run_halo_ids)-1)
+    is_match = run_halo_ids[idx] == halo_ids
+    halos_with_galaxies = np.flatnonzero(is_representable)[is_match]
+    richness[halos_with_galaxies] = run_lengths[idx[is_match]]
+    first_index[halos_with_galaxies] = run_starts[idx[is_match]]
+    return richness, first_index
+
+
+def is_sorted(arr, chunk_size=default_block_size):
+    """ Determine whether the input array is in monotonically increasing order.
+
+    The check requires a single O(num_elements) pass, and processes the array
+    in chunks so that the temporary memory does not scale with the size of the input.
+
+    Parameters
+    ----------
+    arr : ndarray
+        Numpy array of shape (num_elements, ).
+        May be a memory-mapped array or an HDF5 dataset.
+
+    chunk_size : int, optional
+        Number of elements compared at once. Default is 1e7.
+
+    Returns
+    -------
+    result : bool
+
+    Examples
+    --------
+    >>> is_sorted(np.array((0, 1, 1, 3)))
+    True
+    >>> is_sorted(np.array((0, 3, 1)))
+    False
+    """
+    arr = atleast_1d_no_copy(arr)
+    for ifirst in range(1, len(arr), chunk_size):
+        ilast = min(ifirst + chunk_size, len(arr))
+        block = np.asarray(arr[ifirst-1:ilast])
+        if np.any(block[1:] < block[:-1]):
+            return False
+    return True
+
+
+def atleast_1d_no_copy(arr):
+    """ Equivalent to `numpy.atleast_1d`, except that array-like objects supporting
+    slicing, such as memory-mapped arrays and HDF5 datasets, are returned as is,
+    so that their contents are not read into memory.
+    """
+    if hasattr(arr, 'shape') and hasattr(arr, 'dtype') and len(arr.shape) > 0:
+        return arr
+    return np.atleast_1d(arr)
+
+
+def is_in_memory(arr):
+    """ Determine whether ``arr`` is an ndarray residing in memory, as opposed to
+    a memory-mapped array or an array-like object such as an HDF5 dataset.
+    """
+    return isinstance(arr, np.ndarray) and not isinstance(arr, np.memmap)
+
+
+def iter_blocks(num_elements, block_size=default_block_size):
+    """ Iterate over the (first, last) bounds of consecutive blocks
+    of at most ``block_size`` elements.
+
+    Examples
+    --------
+    >>> list(iter_blocks(5, 2))
+    [(0, 2), (2, 4), (4, 5)]
+    """
+    for ifirst in range(0, num_elements, block_size):
+        yield ifirst, min(ifirst + block_size, num_elements)
+
+
+def take(arr, indices, block_size=default_block_size):
+    """ Equivalent to ``arr[indices]`` for an in-memory ``arr``.
+
+    Memory-mapped arrays and HDF5 datasets are instead read in sequential blocks,
+    skipping blocks that contain none of the ``indices``, so that each block
+    is read at most once and random access to the file is avoided.
+
+    Parameters
+    ----------
+    arr : ndarray
+        Array of shape (num_elements, ...), possibly memory-mapped,
+        or an HDF5 dataset
+
+    indices : ndarray
+        Numpy integer array of shape (num_indices, ) storing
+        indices in the interval [0, num_elements)
+
+    block_size : int, optional
+        Number of rows of ``arr`` read at once. Default is 1e7.
+
+    Returns
+    -------
+    result : ndarray
+        In-memory array of shape (num_indices, ...)
+
+    Examples
+    --------
+    >>> arr = np.arange(10)*10
+    >>> take(arr, np.array((7, 2, 2)), block_size=3)
+    array([70, 20, 20])
+    """
+    if is_in_memory(arr):
+        return arr[indices]
+
+    indices = np.asarray(indices)
+    result = np.empty((len(indices), ) + tuple(arr.shape[1:]), dtype=arr.dtype)
+    if len(indices) == 0:
+        return result
+
+    idx_sorted = np.argsort(indices, kind='mergesort')
+    sorted_indices = indices[idx_sorted]
 
+    #  Requested rows in block i are sorted_indices[block_bounds[i]:block_bounds[i+1]]
+    first_block_row = sorted_indices[0] - sorted_indices[0] % block_size
+    block_edges = np.arange(first_block_row, sorted_indices[-1] + block_size + 1, block_size)
+    block_bounds = np.searchsorted(sorted_indices, block_edges)
 
+    for lo, hi in zip(block_bounds[:-1], block_bounds[1:]):
+        if lo == hi:
+            continue
+        #  Only read the rows between the first and last requested row of the block
+        row_offset = sorted_indices[lo]
+        block = np.asarray(arr[row_offset:sorted_indices[hi-1]+1])
+        result[idx_sorted[lo:hi]] = block[sorted_indices[lo:hi] - row_offset]
+    return result
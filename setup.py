@@ -127,6 +127,7 @@ setup(name=PACKAGENAME,
       description=DESCRIPTION,
       scripts=scripts,
       install_requires=[s.strip() for s in metadata.get('install_requires', 'astropy').split(',')],
+      python_requires='>=3.5',
       author=AUTHOR,
       author_email=AUTHOR_EMAIL,
       license=LICENSE,